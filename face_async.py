@@ -0,0 +1,102 @@
+import cv2
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from face_engine import largest_face_crop
+
+
+class EngineBusy(RuntimeError):
+    pass
+
+
+# asyncio front end for a FaceEngine. The OpenCV work runs on a thread pool
+# owned by this object; at most `max_concurrency` calls run at once and at
+# most `max_pending` may be running or waiting, beyond which calls fail
+# fast with EngineBusy so callers can drop frames instead of queueing them.
+# Cancelling a call that has not started yet frees its slot immediately;
+# one that is already running finishes in the background and then frees it.
+class AsyncFaceEngine:
+    def __init__(self, engine, max_concurrency=None, max_pending=None):
+        self.engine = engine
+        self.max_concurrency = max_concurrency or min(os.cpu_count() or 1, 8)
+        self.max_pending = max_pending or self.max_concurrency * 4
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='face-engine')
+        self.pending = 0
+        self.semaphore = None
+        self.closed = False
+        
+    async def __aenter__(self):
+        return self
+        
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+        
+    async def detect(self, frame):
+        # Face boxes in a BGR frame.
+        return await self.run(self.detect_sync, frame)
+        
+    async def recognize(self, frame):
+        # (box, name, confidence) per face, as FaceEngine.recognize_faces.
+        return await self.run(self.engine.recognize_faces, frame, None, None, True)
+        
+    async def enroll(self, name, image):
+        # Adds the largest face in a BGR image for `name`. Returns the
+        # person's ID, or None if no face was found.
+        return await self.run(self.enroll_sync, name, image)
+        
+    def detect_sync(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return [tuple(int(v) for v in box) for box in self.engine.detect_faces(frame, gray)]
+        
+    def enroll_sync(self, name, image):
+        crop = largest_face_crop(self.engine, image)
+        if crop is None:
+            return None
+        # Enrollments change the gallery: one at a time, and never alongside
+        # the engine's own callbacks (see EngineFrontend).
+        with self.engine.frontend.lock:
+            return self.engine.enroll(name, [crop], incremental=True)
+            
+    async def run(self, function, *args):
+        if self.closed:
+            raise RuntimeError("AsyncFaceEngine is closed")
+        if self.pending >= self.max_pending:
+            raise EngineBusy(f"{self.pending} calls already pending")
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        except BaseException:
+            self.pending -= 1
+            raise
+            
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self.release()
+            raise
+        # Hold the slot until the worker thread is really done, even if the
+        # caller stops waiting for it.
+        future.add_done_callback(lambda _: self.release_threadsafe(loop))
+        return await asyncio.wrap_future(future)
+        
+    def release(self):
+        self.pending -= 1
+        self.semaphore.release()
+        
+    def release_threadsafe(self, loop):
+        try:
+            loop.call_soon_threadsafe(self.release)
+        except RuntimeError:
+            # The event loop is already closed.
+            pass
+            
+    def close(self):
+        # Waits for running calls. Nothing queues inside the executor: the
+        # semaphore never lets more calls in than it has threads.
+        self.closed = True
+        self.executor.shutdown(wait=True)
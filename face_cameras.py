@@ -0,0 +1,209 @@
+import cv2
+import numpy as np
+import math
+import os
+import sys
+import threading
+import time
+
+
+def stream_name(source):
+    source = str(source)
+    return f"Camera {source}" if source.isdigit() else os.path.basename(source)
+
+
+# One frame source and what has been seen on it. Only the newest frame is
+# kept for the detector; frames that arrive before it got to the last one
+# are counted as dropped.
+class CameraStream:
+    def __init__(self, source, name=None):
+        self.source = str(source)
+        self.name = name or stream_name(self.source)
+        # Mirror cameras like the single-camera preview; leave files as recorded.
+        self.mirror = self.source.isdigit()
+        self.capture = None
+        self.frame = None
+        self.pending = None
+        self.busy = False
+        self.results = []
+        self.last_seen = {}
+        self.frames = 0
+        self.processed = 0
+        self.dropped = 0
+        self.last_read = 0
+        self.ended = False
+        
+    def open(self):
+        self.capture = cv2.VideoCapture(int(self.source) if self.source.isdigit() else self.source)
+        return self.capture.isOpened()
+        
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+
+# Runs several CameraStreams against one engine: a capture thread per
+# stream and `workers` detector threads shared by all of them. Workers take
+# streams round-robin, one frame in flight per stream, so when detection
+# is the bottleneck every stream gets an equal share of it; an idle stream
+# leaves its share to the others. All streams share the engine's gallery
+# and each call uses whichever model is live when it starts; each worker
+# detects with its own detector models (FaceEngine.detectors), while
+# predictions take turns on the shared model.
+class MultiCamera:
+    def __init__(self, engine, sources, workers=None, on_result=None):
+        self.engine = engine
+        self.streams = [CameraStream(source) for source in sources]
+        self.workers = workers or min(len(self.streams), os.cpu_count() or 1)
+        self.on_result = on_result
+        self.condition = threading.Condition()
+        self.next_stream = 0
+        self.active = True
+        self.running = False
+        self.threads = []
+        
+    def start(self):
+        # Opens every source; returns the streams that could not be opened,
+        # which are left out.
+        failed = [stream for stream in self.streams if not stream.open()]
+        for stream in failed:
+            stream.release()
+        self.streams = [stream for stream in self.streams if stream not in failed]
+        
+        self.running = True
+        for stream in self.streams:
+            self.threads.append(threading.Thread(target=self.capture_loop, args=(stream,), daemon=True))
+        for _ in range(self.workers):
+            self.threads.append(threading.Thread(target=self.detect_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return failed
+        
+    def set_active(self, active):
+        # While inactive frames are still captured but not recognized.
+        with self.condition:
+            self.active = active
+            for stream in self.streams:
+                stream.pending = None
+                stream.results = []
+            self.condition.notify_all()
+            
+    def capture_loop(self, stream):
+        while self.running:
+            ret, frame = stream.capture.read()
+            if not ret:
+                with self.condition:
+                    stream.ended = True
+                    self.condition.notify_all()
+                return
+            if stream.mirror:
+                frame = cv2.flip(frame, 1)
+                
+            with self.condition:
+                stream.frame = frame
+                stream.frames += 1
+                if self.active:
+                    if stream.pending is not None:
+                        stream.dropped += 1
+                    stream.pending = frame
+                self.condition.notify_all()
+                
+    def next_job(self):
+        # Caller holds self.condition.
+        if not self.active:
+            return None
+        count = len(self.streams)
+        for offset in range(count):
+            index = (self.next_stream + offset) % count
+            stream = self.streams[index]
+            if stream.pending is not None and not stream.busy:
+                self.next_stream = (index + 1) % count
+                frame, stream.pending = stream.pending, None
+                stream.busy = True
+                return stream, frame
+        return None
+        
+    def detect_loop(self):
+        last_error = None
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None and self.running:
+                    self.condition.wait()
+                    job = self.next_job()
+                if not self.running:
+                    return
+            stream, frame = job
+            
+            try:
+                results = self.engine.recognize_faces(frame, wait=True)
+            except Exception as e:
+                if str(e) != last_error:
+                    print(f"Recognition failed on {stream.name}: {str(e)}", file=sys.stderr)
+                last_error = str(e)
+                results = []
+                
+            now = time.time()
+            with self.condition:
+                stream.busy = False
+                stream.processed += 1
+                if self.active:
+                    stream.results = results
+                    for _, name, _ in results:
+                        if name not in (None, "Unknown"):
+                            stream.last_seen[name] = now
+                self.condition.notify_all()
+            if self.on_result is not None:
+                self.on_result(stream, frame, results)
+                
+    def latest(self, stream):
+        # (newest frame, results of the newest recognized frame).
+        with self.condition:
+            return stream.frame, list(stream.results)
+            
+    def read(self, stream, timeout=1.0):
+        # Waits for a frame this method has not returned yet, like
+        # VideoCapture.read(). Returns (ok, frame).
+        with self.condition:
+            self.condition.wait_for(lambda: stream.frames > stream.last_read or stream.ended or not self.running,
+                                    timeout)
+            if stream.frames <= stream.last_read:
+                return False, None
+            stream.last_read = stream.frames
+            return True, stream.frame.copy()
+            
+    def stats(self):
+        with self.condition:
+            return {stream.name: {'frames': stream.frames, 'processed': stream.processed,
+                                  'dropped': stream.dropped} for stream in self.streams}
+                                  
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(5)
+        self.threads = []
+        for stream in self.streams:
+            stream.release()
+
+
+def compose_grid(frames, labels=None, tile_size=(640, 360)):
+    # Tiles BGR frames (None for a stream without a frame yet) into one
+    # image, as close to square as possible, each letterboxed in its tile.
+    tile_w, tile_h = tile_size
+    cols = max(1, math.ceil(math.sqrt(len(frames))))
+    rows = max(1, math.ceil(len(frames) / cols))
+    grid = np.zeros((rows * tile_h, cols * tile_w, 3), dtype=np.uint8)
+    
+    for i, frame in enumerate(frames):
+        x0, y0 = (i % cols) * tile_w, (i // cols) * tile_h
+        if frame is not None:
+            h, w = frame.shape[:2]
+            scale = min(tile_w / w, tile_h / h)
+            new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+            x, y = x0 + (tile_w - new_w) // 2, y0 + (tile_h - new_h) // 2
+            grid[y:y + new_h, x:x + new_w] = cv2.resize(frame, (new_w, new_h))
+        if labels is not None:
+            cv2.putText(grid, labels[i], (x0 + 10, y0 + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    return grid
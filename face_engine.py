@@ -0,0 +1,3402 @@
+import cv2
+import numpy as np
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import sqlite3
+import glob
+import hashlib
+import struct
+import zlib
+import threading
+import time
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+try:
+    import dlib
+    DLIB_AVAILABLE = True
+except ImportError:
+    DLIB_AVAILABLE = False
+    print("Warning: dlib not installed. Haar and dlib detection methods will not be available.", file=sys.stderr)
+
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+    print("Warning: face_recognition not installed. face_recognition detection method will not be available.", file=sys.stderr)
+
+try:
+    import mediapipe as mp
+    _ = mp.solutions
+    MEDIAPIPE_AVAILABLE = True
+except (ImportError, AttributeError):
+    MEDIAPIPE_AVAILABLE = False
+    print("Warning: mediapipe not fully installed. MediaPipe detection method will not be available.", file=sys.stderr)
+
+
+DEFAULT_GALLERY_SETTINGS = {
+    'crop_size': 100,
+    'lbph_radius': 1,
+    'lbph_neighbors': 8,
+    'lbph_grid_x': 8,
+    'lbph_grid_y': 8
+}
+
+GALLERY_SETTING_LIMITS = {
+    'crop_size': (32, 200),
+    'lbph_radius': (1, 3),
+    'lbph_neighbors': (4, 8),
+    'lbph_grid_x': (1, 16),
+    'lbph_grid_y': (1, 16)
+}
+
+
+def validate_gallery_settings(settings):
+    validated = dict(DEFAULT_GALLERY_SETTINGS)
+    for key, value in (settings or {}).items():
+        if key not in GALLERY_SETTING_LIMITS:
+            raise ValueError(f"Unknown setting '{key}'")
+        low, high = GALLERY_SETTING_LIMITS[key]
+        value = int(value)
+        if not low <= value <= high:
+            raise ValueError(f"{key} must be between {low} and {high}")
+        validated[key] = value
+        
+    cells = (validated['crop_size'] - 2 * validated['lbph_radius']) // max(validated['lbph_grid_x'], validated['lbph_grid_y'])
+    if cells < 2:
+        raise ValueError("LBPH grid is too fine for the crop size")
+    return validated
+
+
+def resize_samples(face_data, crop_size):
+    # Samples already at the target size are returned as-is, so a
+    # memory-mapped gallery stays mapped instead of being copied.
+    if isinstance(face_data, np.ndarray) and face_data.shape[1:] == (crop_size, crop_size):
+        return face_data
+        
+    resized = np.empty((len(face_data), crop_size, crop_size), dtype=np.uint8)
+    for i, face in enumerate(face_data):
+        if face.shape == (crop_size, crop_size):
+            resized[i] = face
+        else:
+            resized[i] = cv2.resize(face, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
+    return resized
+
+
+def model_key(backend, settings=None):
+    settings = settings or DEFAULT_GALLERY_SETTINGS
+    return f"{backend}:{json.dumps(settings, sort_keys=True)}"
+
+
+def compute_gallery_hash(face_data, face_labels, key='lbph'):
+    digest = hashlib.sha256(key.encode('utf-8'))
+    if isinstance(face_data, np.ndarray):
+        # Hash in fixed-size blocks so a memory-mapped gallery is streamed
+        # through rather than copied.
+        flat = face_data.reshape(len(face_data), -1)
+        for start in range(0, len(flat), 1024):
+            digest.update(np.ascontiguousarray(flat[start:start + 1024], dtype=np.uint8).data)
+    else:
+        for face in face_data:
+            digest.update(np.ascontiguousarray(face, dtype=np.uint8).tobytes())
+    digest.update(np.asarray(face_labels, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def predict_faces(recognizer, face_regions):
+    if hasattr(recognizer, 'predict_batch'):
+        return recognizer.predict_batch(face_regions)
+    return [recognizer.predict(face) for face in face_regions]
+
+
+# Mirrors cv2.face.LBPHFaceRecognizer (circular LBP, per-cell histograms that
+# sum to 1, nearest neighbour) but keeps the gallery in one float32 matrix and
+# scores a whole batch of faces per call. The default 'chi2' metric gives the
+# same distance scale as OpenCV's HISTCMP_CHISQR_ALT, so `confidence < 100`
+# still means "known". 'intersection' only ranks the gallery; the best
+# match is then scored with the chi-square distance, so both metrics
+# report confidences on that scale.
+class NumpyLBPHRecognizer:
+    METRICS = ('chi2', 'intersection')
+
+    def __init__(self, radius=1, neighbors=8, grid_x=8, grid_y=8, metric='chi2',
+                 workers=None, chunk_size=256, max_block_bytes=64 * 1024 * 1024):
+        if metric not in self.METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {self.METRICS}")
+        if not 1 <= neighbors <= 16:
+            raise ValueError("neighbors must be between 1 and 16")
+            
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.metric = metric
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_block_bytes = max_block_bytes
+        
+        self.num_patterns = 2 ** neighbors
+        self.feature_size = grid_x * grid_y * self.num_patterns
+        self.set_gallery(np.empty((0, self.feature_size), dtype=np.float32), np.empty(0, dtype=np.int32))
+        
+    # The gallery is kept feature-major, (feature_size, N): a query only
+    # touches the bins it has non-zero counts in, and gathering those rows
+    # is a contiguous copy per bin instead of a strided one per sample.
+    def set_gallery(self, histograms, labels):
+        self.gallery = np.ascontiguousarray(np.asarray(histograms, dtype=np.float32).T)
+        self.gallery_sums = self.gallery.sum(axis=0)
+        self.labels = np.asarray(labels, dtype=np.int32).ravel()
+        
+    @property
+    def histograms(self):
+        return self.gallery.T
+        
+    def _lbp_codes(self, images):
+        r = self.radius
+        _, rows, cols = images.shape
+        center = images[:, r:rows - r, r:cols - r]
+        codes = np.zeros(center.shape, dtype=np.uint32)
+        
+        for n in range(self.neighbors):
+            x = r * np.cos(2.0 * np.pi * n / self.neighbors)
+            y = -r * np.sin(2.0 * np.pi * n / self.neighbors)
+            fx, fy = int(np.floor(x)), int(np.floor(y))
+            cx, cy = int(np.ceil(x)), int(np.ceil(y))
+            tx, ty = x - fx, y - fy
+            
+            def shifted(dy, dx):
+                return images[:, r + dy:rows - r + dy, r + dx:cols - r + dx]
+                
+            sample = ((1 - tx) * (1 - ty) * shifted(fy, fx) +
+                      tx * (1 - ty) * shifted(fy, cx) +
+                      (1 - tx) * ty * shifted(cy, fx) +
+                      tx * ty * shifted(cy, cx))
+            bit = (sample > center) | (np.abs(sample - center) < np.finfo(np.float32).eps)
+            codes |= bit.astype(np.uint32) << n
+            
+        return codes
+        
+    def _spatial_histograms(self, codes):
+        count, rows, cols = codes.shape
+        cell_h = rows // self.grid_y
+        cell_w = cols // self.grid_x
+        cells = self.grid_x * self.grid_y
+        
+        codes = codes[:, :cell_h * self.grid_y, :cell_w * self.grid_x]
+        codes = codes.reshape(count, self.grid_y, cell_h, self.grid_x, cell_w)
+        codes = codes.transpose(0, 1, 3, 2, 4).reshape(count, cells, cell_h * cell_w)
+        
+        offsets = (np.arange(count)[:, None, None] * self.feature_size +
+                   np.arange(cells)[None, :, None] * self.num_patterns)
+        bins = np.bincount((codes + offsets).ravel(), minlength=count * self.feature_size)
+        
+        histograms = bins.reshape(count, self.feature_size).astype(np.float32)
+        histograms /= float(cell_h * cell_w)
+        return histograms
+        
+    def extract_features(self, images):
+        images = np.asarray(images)
+        if images.ndim == 2:
+            images = images[None]
+        if len(images) == 0:
+            return np.empty((0, self.feature_size), dtype=np.float32)
+        return self._spatial_histograms(self._lbp_codes(images.astype(np.float32)))
+        
+    def extract_features_parallel(self, images):
+        images = np.asarray(images)
+        chunks = [images[i:i + self.chunk_size] for i in range(0, len(images), self.chunk_size)]
+        if len(chunks) <= 1:
+            return self.extract_features(images)
+            
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+            parts = list(executor.map(self.extract_features, chunks))
+        return np.ascontiguousarray(np.concatenate(parts), dtype=np.float32)
+        
+    def train(self, images, labels):
+        self.set_gallery(self.extract_features_parallel(images), labels)
+        
+    def train_features(self, features, labels):
+        self.set_gallery(features, labels)
+        
+    def update(self, images, labels):
+        self.update_features(self.extract_features_parallel(images), labels)
+        
+    def update_features(self, features, labels):
+        self.set_gallery(
+            np.concatenate([self.histograms, features]),
+            np.concatenate([self.labels, np.asarray(labels, dtype=np.int32).ravel()])
+        )
+        
+    def _distances(self, query):
+        # Only bins where the query is non-zero contribute to the overlap
+        # terms, so score against those rows of the gallery matrix.
+        cols = np.flatnonzero(query)
+        values = query[cols][:, None]
+        distances = np.empty(self.gallery.shape[1], dtype=np.float32)
+        block = max(1, int(self.max_block_bytes // max(len(cols) * 4, 1)))
+        
+        for start in range(0, self.gallery.shape[1], block):
+            gallery = self.gallery[cols, start:start + block]
+            
+            if self.metric == 'chi2':
+                # 2 * sum((q - g)^2 / (q + g)) == 2 * sum(q + g) - 8 * sum(q * g / (q + g))
+                total = gallery + values
+                gallery *= values
+                gallery /= total
+                overlap = gallery.sum(axis=0)
+                dist = 2.0 * (query.sum() + self.gallery_sums[start:start + block]) - 8.0 * overlap
+            else:
+                # Histogram intersection as a distance: each cell histogram
+                # sums to 1, so 2 * (cells - overlap) is 0 for identical faces.
+                np.minimum(gallery, values, out=gallery)
+                cells = self.grid_x * self.grid_y
+                dist = 2.0 * (cells - gallery.sum(axis=0))
+                
+            distances[start:start + block] = np.maximum(dist, 0.0)
+            
+        return distances
+        
+    def _chi2(self, query, index):
+        gallery = self.gallery[:, index]
+        total = query + gallery
+        used = total > 0
+        return float(2.0 * np.sum((query[used] - gallery[used]) ** 2 / total[used]))
+        
+    def _best_match(self, query):
+        distances = self._distances(query)
+        index = int(distances.argmin())
+        if self.metric != 'chi2':
+            return int(self.labels[index]), self._chi2(query, index)
+        return int(self.labels[index]), float(distances[index])
+        
+    def predict_batch(self, images):
+        if len(self.labels) == 0:
+            raise ValueError("Recognizer has not been trained")
+            
+        queries = self.extract_features(images)
+        if len(queries) <= 1:
+            return [self._best_match(query) for query in queries]
+            
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(queries))) as executor:
+            return list(executor.map(self._best_match, queries))
+            
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+        
+    def write(self, filename):
+        with open(filename, 'wb') as f:
+            np.savez(
+                f,
+                params=np.array([self.radius, self.neighbors, self.grid_x, self.grid_y]),
+                metric=np.array(self.metric),
+                histograms=self.histograms,
+                labels=self.labels
+            )
+            
+    def read(self, filename):
+        with np.load(filename) as data:
+            self.radius, self.neighbors, self.grid_x, self.grid_y = (int(v) for v in data['params'])
+            self.metric = str(data['metric'])
+            self.num_patterns = 2 ** self.neighbors
+            self.feature_size = self.grid_x * self.grid_y * self.num_patterns
+            self.set_gallery(data['histograms'], data['labels'])
+
+
+# Eigenfaces keeps at most this many components (OpenCV also stops at
+# samples - 1). Past the first few dozen they mostly encode noise and
+# lighting, while every extra one makes each prediction slower.
+EIGEN_COMPONENTS = 80
+# Training samples used as queries when calibrating the unknown distance;
+# each is compared against the whole gallery.
+CALIBRATION_SAMPLES = 500
+
+
+def calibrate_unknown_distance(projections, labels):
+    # Subspace distances grow with the crop size and the gallery, so the
+    # cut-off between "known" and "unknown" is measured on the training
+    # samples themselves: halfway between how far a sample typically is
+    # from the nearest other sample of the same person and from the
+    # nearest sample of anyone else. A stranger's face shares little with
+    # the gallery and projects close to the mean face (the origin), so
+    # its nearest sample is about the one closest to the origin; that
+    # distance caps the "anyone else" side.
+    projections = np.asarray(projections, dtype=np.float64)
+    labels = np.asarray(labels).ravel()
+    queries = np.unique(np.linspace(0, len(labels) - 1, min(len(labels), CALIBRATION_SAMPLES)).astype(int))
+    
+    same, other = [], []
+    for i in queries:
+        distances = np.linalg.norm(projections - projections[i], axis=1)
+        distances[i] = np.inf
+        matches = labels == labels[i]
+        if np.isfinite(distances[matches]).any():
+            same.append(distances[matches].min())
+        if (~matches).any():
+            other.append(distances[~matches].min())
+            
+    if same and other:
+        stranger = np.linalg.norm(projections, axis=1).min()
+        distance = (np.median(same) + min(np.median(other), stranger)) / 2.0
+    elif same:
+        # Nobody else to compare against: allow twice the spread of the
+        # one person's own samples.
+        distance = 2.0 * np.median(same)
+    elif other:
+        distance = np.median(other) / 2.0
+    else:
+        distance = 0.0
+    return max(float(distance), 1e-6)
+
+
+# Eigenfaces/Fisherfaces return a Euclidean distance in their subspace, on a
+# very different scale from LBPH. Rescale it so that `unknown_distance` maps
+# to 100 and the overlay's `confidence < 100` rule works for every backend.
+# Unless given, `unknown_distance` is calibrated from the training data
+# whenever the model is trained or read.
+class ScaledDistanceRecognizer:
+    def __init__(self, recognizer, unknown_distance=None):
+        self.recognizer = recognizer
+        self.fixed_distance = unknown_distance is not None
+        self.unknown_distance = float(unknown_distance) if self.fixed_distance else None
+        
+    def calibrate(self):
+        if not self.fixed_distance:
+            self.unknown_distance = calibrate_unknown_distance(
+                np.vstack(self.recognizer.getProjections()), self.recognizer.getLabels()
+            )
+            
+    def train(self, images, labels):
+        self.recognizer.train(images, labels)
+        self.calibrate()
+        
+    def predict(self, image):
+        label, distance = self.recognizer.predict(image)
+        return label, distance * 100.0 / self.unknown_distance
+        
+    def write(self, filename):
+        self.recognizer.write(filename)
+        
+    def read(self, filename):
+        self.recognizer.read(filename)
+        self.calibrate()
+
+
+RECOGNIZER_BACKENDS = {
+    'lbph': {
+        'create': lambda settings: cv2.face.LBPHFaceRecognizer_create(
+            radius=settings['lbph_radius'],
+            neighbors=settings['lbph_neighbors'],
+            grid_x=settings['lbph_grid_x'],
+            grid_y=settings['lbph_grid_y']
+        ),
+        'info': 'OpenCV LBPH histograms',
+        'model_ext': '.yml',
+        'min_classes': 1,
+        'features': False,
+        'incremental': True
+    },
+    'lbph_numpy': {
+        'create': lambda settings: NumpyLBPHRecognizer(
+            radius=settings['lbph_radius'],
+            neighbors=settings['lbph_neighbors'],
+            grid_x=settings['lbph_grid_x'],
+            grid_y=settings['lbph_grid_y']
+        ),
+        'info': 'Batched NumPy LBPH',
+        'model_ext': '.npz',
+        'min_classes': 1,
+        'features': True,
+        'incremental': True
+    },
+    'eigen': {
+        'create': lambda settings: ScaledDistanceRecognizer(
+            cv2.face.EigenFaceRecognizer_create(num_components=EIGEN_COMPONENTS)
+        ),
+        'info': 'Eigenfaces (PCA subspace)',
+        'model_ext': '.yml',
+        'min_classes': 1,
+        'features': False,
+        'incremental': False
+    },
+    'fisher': {
+        'create': lambda settings: ScaledDistanceRecognizer(cv2.face.FisherFaceRecognizer_create()),
+        'info': 'Fisherfaces (LDA subspace, 2+ people)',
+        'model_ext': '.yml',
+        'min_classes': 2,
+        'features': False,
+        'incremental': False
+    }
+}
+
+
+def create_recognizer(backend, settings=None):
+    if backend not in RECOGNIZER_BACKENDS:
+        raise ValueError(f"Unknown recognizer backend '{backend}'")
+    return RECOGNIZER_BACKENDS[backend]['create'](settings or DEFAULT_GALLERY_SETTINGS)
+
+
+def copy_recognizer(backend, settings, recognizer):
+    # An independent copy of a trained model, via its own file format.
+    ext = RECOGNIZER_BACKENDS[backend]['model_ext']
+    fd, path = tempfile.mkstemp(prefix="recognizer.", suffix=ext)
+    os.close(fd)
+    try:
+        recognizer.write(path)
+        copy = create_recognizer(backend, settings)
+        copy.read(path)
+        return copy
+    finally:
+        os.remove(path)
+
+
+def feature_key(backend, settings):
+    # Backends whose per-sample features can be computed outside the model
+    # get a key naming the recognizer and its parameters, so cached features
+    # are only reused by an identical configuration.
+    if not RECOGNIZER_BACKENDS[backend]['features']:
+        return None
+    digest = hashlib.sha1(model_key(backend, settings).encode('utf-8')).hexdigest()[:12]
+    return f"{backend}_{digest}"
+
+
+def check_trainable(backend, face_labels):
+    min_classes = RECOGNIZER_BACKENDS[backend]['min_classes']
+    if len(np.unique(np.asarray(face_labels))) < min_classes:
+        raise ValueError(f"{backend} needs at least {min_classes} registered people")
+
+
+def split_gallery(face_data, face_labels, test_every=5):
+    # Hold out every n-th sample of each person so every identity appears in
+    # both the training and the test split.
+    seen = {}
+    train_idx, test_idx = [], []
+    for i, label in enumerate(face_labels):
+        count = seen.get(int(label), 0)
+        seen[int(label)] = count + 1
+        (test_idx if count % test_every == test_every - 1 else train_idx).append(i)
+    return train_idx, test_idx
+
+
+def benchmark_recognizers(face_data, face_labels, backends=None, test_every=5, settings=None):
+    backends = backends or list(RECOGNIZER_BACKENDS)
+    train_idx, test_idx = split_gallery(face_data, face_labels, test_every)
+    train_data = [face_data[i] for i in train_idx]
+    train_labels = np.array([face_labels[i] for i in train_idx])
+    test_data = [face_data[i] for i in test_idx]
+    test_labels = [int(face_labels[i]) for i in test_idx]
+    
+    results = []
+    for backend in backends:
+        result = {'backend': backend, 'train_samples': len(train_data), 'test_samples': len(test_data)}
+        try:
+            if not test_data:
+                raise ValueError(f"need at least {test_every} samples per person")
+            check_trainable(backend, train_labels)
+            recognizer = create_recognizer(backend, settings)
+            
+            start = time.perf_counter()
+            recognizer.train(train_data, train_labels)
+            result['train_time'] = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            predictions = predict_faces(recognizer, test_data)
+            result['predict_ms'] = (time.perf_counter() - start) * 1000.0 / len(test_data)
+            
+            correct = sum(1 for (label, confidence), expected in zip(predictions, test_labels)
+                          if label == expected and confidence < 100)
+            result['accuracy'] = correct / len(test_data)
+        except Exception as e:
+            result['error'] = str(e)
+        results.append(result)
+        
+    return results
+
+
+BENCHMARK_CONFIGURATIONS = [
+    {'crop_size': 100, 'lbph_grid_x': 8, 'lbph_grid_y': 8},
+    {'crop_size': 80, 'lbph_grid_x': 8, 'lbph_grid_y': 8},
+    {'crop_size': 64, 'lbph_grid_x': 8, 'lbph_grid_y': 8},
+    {'crop_size': 64, 'lbph_grid_x': 4, 'lbph_grid_y': 4},
+    {'crop_size': 48, 'lbph_grid_x': 4, 'lbph_grid_y': 4}
+]
+
+
+def benchmark_configurations(face_data, face_labels, backend='lbph', configurations=None, test_every=5):
+    results = []
+    for configuration in configurations or BENCHMARK_CONFIGURATIONS:
+        settings = validate_gallery_settings(configuration)
+        samples = resize_samples(face_data, settings['crop_size'])
+        result = benchmark_recognizers(samples, face_labels, [backend], test_every, settings)[0]
+        result['settings'] = settings
+        results.append(result)
+    return results
+
+
+def describe_settings(settings):
+    return (f"{settings['crop_size']}px r{settings['lbph_radius']} n{settings['lbph_neighbors']} "
+            f"{settings['lbph_grid_x']}x{settings['lbph_grid_y']}")
+
+
+def format_benchmark_report(results):
+    by_settings = any('settings' in result for result in results)
+    title = 'Configuration' if by_settings else 'Backend'
+    width = 24 if by_settings else 12
+    
+    lines = [f"{title:<{width}}{'Train (s)':>11}{'Predict (ms)':>14}{'Accuracy':>10}"]
+    for result in results:
+        name = describe_settings(result['settings']) if by_settings else result['backend']
+        if 'error' in result:
+            lines.append(f"{name:<{width}}  failed: {result['error']}")
+        else:
+            lines.append(
+                f"{name:<{width}}{result['train_time']:>11.3f}"
+                f"{result['predict_ms']:>14.2f}{result['accuracy'] * 100:>9.1f}%"
+            )
+    if results:
+        lines.append(f"\n{results[0]['train_samples']} training / {results[0]['test_samples']} test samples")
+    return "\n".join(lines)
+
+
+# In-memory gallery: one (capacity, H, W) uint8 buffer plus an int32 label
+# buffer, grown by doubling. Rows [0, count) are never written again once
+# filled, so `faces`/`labels` views handed to a training thread stay valid
+# while new samples are appended; deletes and resizes build a new buffer.
+# `version` changes whenever existing rows are removed or replaced.
+class FaceGallery:
+    def __init__(self, crop_size=100, capacity=0):
+        self.buffer = np.empty((capacity, crop_size, crop_size), dtype=np.uint8)
+        self.label_buffer = np.empty(capacity, dtype=np.int32)
+        self.count = 0
+        self.version = 0
+        
+    @classmethod
+    def from_arrays(cls, faces, labels, crop_size=100):
+        # Wraps the arrays without copying; a read-only memory map is only
+        # copied into RAM when the first append outgrows it.
+        faces = np.asanyarray(faces, dtype=np.uint8)
+        gallery = cls(faces.shape[1] if len(faces) > 0 else crop_size)
+        if len(faces) > 0:
+            gallery.buffer = faces
+            gallery.label_buffer = np.asarray(labels, dtype=np.int32)
+            gallery.count = len(faces)
+        return gallery
+        
+    def __len__(self):
+        return self.count
+        
+    @property
+    def crop_size(self):
+        return self.buffer.shape[1]
+        
+    @property
+    def capacity(self):
+        return len(self.buffer)
+        
+    @property
+    def faces(self):
+        return self.buffer[:self.count]
+        
+    @property
+    def labels(self):
+        return self.label_buffer[:self.count]
+        
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity, 16)
+        buffer = np.empty((capacity, self.crop_size, self.crop_size), dtype=np.uint8)
+        label_buffer = np.empty(capacity, dtype=np.int32)
+        buffer[:self.count] = self.buffer[:self.count]
+        label_buffer[:self.count] = self.label_buffer[:self.count]
+        self.buffer = buffer
+        self.label_buffer = label_buffer
+        
+    def append(self, faces, labels):
+        faces = np.asarray(faces, dtype=np.uint8)
+        if faces.ndim == 2:
+            faces = faces[None]
+        if len(faces) == 0:
+            return
+            
+        end = self.count + len(faces)
+        if end > self.capacity or not self.buffer.flags.writeable:
+            self.reserve(max(end, self.capacity + 1))
+        self.buffer[self.count:end] = faces
+        self.label_buffer[self.count:end] = labels
+        self.count = end
+        
+    def delete_labels(self, labels):
+        keep = ~np.isin(self.labels, np.asarray(labels, dtype=np.int32))
+        removed = self.count - int(keep.sum())
+        if removed:
+            faces = self.faces[keep]
+            kept_labels = self.labels[keep]
+            self.buffer = np.empty((max(len(faces), 16), self.crop_size, self.crop_size), dtype=np.uint8)
+            self.label_buffer = np.empty(len(self.buffer), dtype=np.int32)
+            self.count = 0
+            self.version += 1
+            self.append(faces, kept_labels)
+        return removed
+        
+    def clear(self, crop_size=None):
+        self.buffer = np.empty((0, crop_size or self.crop_size, crop_size or self.crop_size), dtype=np.uint8)
+        self.label_buffer = np.empty(0, dtype=np.int32)
+        self.count = 0
+        self.version += 1
+        
+    def resize(self, crop_size):
+        if crop_size == self.crop_size:
+            return
+        faces = resize_samples(self.faces, crop_size)
+        labels = self.labels.copy()
+        self.clear(crop_size)
+        self.append(faces, labels)
+        
+    def label_counts(self):
+        labels, counts = np.unique(self.labels, return_counts=True)
+        return {int(label): int(count) for label, count in zip(labels, counts)}
+
+
+# Advisory lock on a lock file, shared by every process that uses the same
+# gallery. Re-entrant within a process, so the store, the journal and the
+# model writer can nest it.
+class ProcessLock:
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+        
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self.file = open(self.path, 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+            except BaseException:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+        
+        
+# Append-only change journal (JSON lines) shared by every process using
+# the gallery. Each process appends what it changed after the change is on
+# disk and polls for other processes' entries from its last offset:
+#   person    a name registered under a new ID
+#   delete    a person deleted (the store already holds the tombstone)
+#   append    samples added as store segment/batch `segment`
+#   metadata  recognizer or gallery settings changed
+#   reset     the gallery was rewritten; reload it (carries names/settings)
+# checkpoint() folds everything before an offset into a single checkpoint
+# line at the top of the file (see fold_journal), so the file stays small.
+# Offsets keep counting across checkpoints: a reader's offset stays valid,
+# and one that is behind the checkpoint gets the checkpoint entry first.
+class GalleryJournal:
+    CHECKPOINT_PREFIX = b'{"op": "checkpoint"'
+    
+    def __init__(self, path="gallery_journal.log", lock=None):
+        self.path = path
+        self.lock = lock or ProcessLock(path + ".lock")
+        self.instance = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        
+    def append(self, op, **fields):
+        line = json.dumps(dict(fields, op=op, instance=self.instance)) + "\n"
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(line.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                
+    def header(self, f):
+        # (offset of the first byte after the checkpoint line, length of
+        # that line, the checkpoint entry) for an open journal file.
+        f.seek(0)
+        if f.read(len(self.CHECKPOINT_PREFIX)) != self.CHECKPOINT_PREFIX:
+            return 0, 0, None
+        f.seek(0)
+        line = f.readline()
+        checkpoint = json.loads(line)
+        return checkpoint['base'], len(line), checkpoint
+        
+    def end(self):
+        try:
+            with open(self.path, 'rb') as f:
+                base, start, _ = self.header(f)
+                return base + os.fstat(f.fileno()).st_size - start
+        except FileNotFoundError:
+            return 0
+            
+    def read(self, offset=0):
+        # Returns the complete entries after `offset` and the new offset.
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return [], 0
+        with f:
+            base, start, checkpoint = self.header(f)
+            size = base + os.fstat(f.fileno()).st_size - start
+            entries = []
+            if offset < base:
+                entries.append(checkpoint)
+                offset = base
+            if size <= offset:
+                return entries, min(offset, size)
+            f.seek(start + offset - base)
+            data = f.read(size - offset)
+        end = data.rfind(b"\n") + 1
+        entries += [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return entries, offset + end
+        
+    def checkpoint(self, offset, min_bytes=0):
+        # Replaces the entries before `offset` with their checkpoint, if that
+        # drops at least `min_bytes`. They never change, so they are folded
+        # without the lock; only the rest is copied under it. Returns True
+        # if the file was rewritten.
+        try:
+            with open(self.path, 'rb') as f:
+                base, start, previous = self.header(f)
+                if offset - base <= max(min_bytes, 0):
+                    return False
+                f.seek(start)
+                data = f.read(offset - base)
+        except FileNotFoundError:
+            return False
+        data = data[:data.rfind(b"\n") + 1]
+        if not data:
+            return False
+        entries = [json.loads(line) for line in data.splitlines() if line.strip()]
+        checkpoint = fold_journal(([previous] if previous else []) + entries, base + len(data))
+        line = (json.dumps(checkpoint) + "\n").encode('utf-8')
+        
+        with self.lock:
+            with open(self.path, 'rb') as f:
+                # Someone else checkpointed meanwhile.
+                if self.header(f)[0] != base:
+                    return False
+                f.seek(start + len(data))
+                rest = f.read()
+            atomic_write(self.path, lambda out: out.write(line + rest))
+        return True
+
+
+JOURNAL_POLL_MS = 1000
+# The journal is checkpointed once gallery compaction can drop this much.
+JOURNAL_CHECKPOINT_BYTES = 1 << 20
+# Journal ops that change what the store holds. A checkpoint entry is only
+# read by someone who missed the entries it stands for.
+STORE_OPS = ('append', 'delete', 'reset', 'checkpoint')
+
+
+def apply_journal_names(entry, name_to_id, id_to_name):
+    # Replays one journal entry onto the name maps in place. Replaying an
+    # entry twice is harmless.
+    def add(person_id, name):
+        name_to_id[name] = int(person_id)
+        id_to_name[int(person_id)] = name
+        
+    def forget(person_id):
+        name = id_to_name.pop(int(person_id), None)
+        if name is not None and name_to_id.get(name) == int(person_id):
+            del name_to_id[name]
+            
+    op = entry.get('op')
+    if op == 'person':
+        add(entry['id'], entry['name'])
+    elif op == 'delete':
+        forget(entry['id'])
+    elif op == 'reset' and 'id_to_name' in entry:
+        id_to_name.clear()
+        id_to_name.update({int(k): v for k, v in entry['id_to_name'].items()})
+        name_to_id.clear()
+        name_to_id.update({v: k for k, v in id_to_name.items()})
+    elif op == 'checkpoint':
+        if entry['reset']:
+            id_to_name.clear()
+            name_to_id.clear()
+        for person_id in entry['deleted']:
+            forget(person_id)
+        for person_id, name in entry['people'].items():
+            add(person_id, name)
+            
+            
+def journal_next_person_id(entry):
+    # The lowest person ID a journal entry leaves free (0 if it has none).
+    op = entry.get('op')
+    if op in ('person', 'delete'):
+        return int(entry['id']) + 1
+    if op == 'checkpoint':
+        return entry['next_person_id']
+    return 0
+    
+    
+def fold_journal(entries, base):
+    # The checkpoint entry standing for `entries`, the journal up to offset
+    # `base`: the names registered and deleted since the last reset (or
+    # since the journal began, when the data file may hold older names),
+    # the lowest free person ID and the latest recognizer and settings.
+    # Appended samples need nothing; the store has them.
+    checkpoint = {'op': 'checkpoint', 'base': base, 'reset': False, 'people': {}, 'deleted': [],
+                  'next_person_id': 0, 'recognizer': None, 'settings': None}
+    people, deleted = {}, set()
+    for entry in entries:
+        op = entry.get('op')
+        checkpoint['next_person_id'] = max(checkpoint['next_person_id'], journal_next_person_id(entry))
+        if op == 'checkpoint':
+            checkpoint['reset'] = entry['reset']
+            people = {int(k): v for k, v in entry['people'].items()}
+            deleted = set(entry['deleted'])
+        elif op == 'person':
+            people[int(entry['id'])] = entry['name']
+        elif op == 'delete':
+            people.pop(int(entry['id']), None)
+            deleted.add(int(entry['id']))
+        elif op == 'reset' and 'id_to_name' in entry:
+            checkpoint['reset'] = True
+            people = {int(k): v for k, v in entry['id_to_name'].items()}
+            deleted = set()
+        if op in ('metadata', 'reset', 'checkpoint'):
+            for key in ('recognizer', 'settings'):
+                if entry.get(key) is not None:
+                    checkpoint[key] = entry[key]
+    checkpoint['people'] = {str(k): v for k, v in people.items()}
+    checkpoint['deleted'] = sorted(deleted)
+    return checkpoint
+
+
+# Crash-safe file replacement: the new contents are written to a temp file
+# in the same directory, fsynced and renamed over the target, so readers
+# only ever see the old file or the complete new one.
+def fsync_directory(directory):
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+        
+        
+def atomic_replace(tmp_path, path):
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+    
+    
+def atomic_write(path, write):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(directory)
+    
+    
+def atomic_write_json(path, data):
+    atomic_write(path, lambda f: f.write(json.dumps(data, indent=2).encode('utf-8')))
+    
+    
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Append-only sample store. Each capture is written as a new immutable
+# segment (<name>_faces.npy / <name>_labels.npy) and recorded in a small
+# manifest.json, so the cost of a save tracks the size of the change rather
+# than the size of the gallery. Deleting a person only appends a tombstone;
+# compact() later merges segments and physically drops tombstoned samples.
+# Per-sample features can be cached next to a segment's crops as
+# <name>_features_<key>.npy, one file per recognizer configuration.
+class SegmentedGalleryStore:
+    MANIFEST_VERSION = 1
+    
+    def __init__(self, directory="face_gallery", max_segments=8, max_tombstones=8, lock=None):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.max_segments = max_segments
+        self.max_tombstones = max_tombstones
+        # Pass a ProcessLock when several processes share the directory.
+        self.lock = lock or threading.Lock()
+        self.compaction_thread = None
+        self.manifest = self.read_manifest()
+        
+    def empty_manifest(self):
+        return {
+            'version': self.MANIFEST_VERSION,
+            'generation': 0,
+            'next_seq': 0,
+            'segments': [],
+            'tombstones': []
+        }
+        
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+        
+    def read_manifest(self):
+        if not self.exists():
+            return self.empty_manifest()
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+            
+    def write_manifest(self, manifest):
+        atomic_write_json(self.manifest_path, manifest)
+        self.manifest = manifest
+        
+    def segment_paths(self, name):
+        return (os.path.join(self.directory, f"{name}_faces.npy"),
+                os.path.join(self.directory, f"{name}_labels.npy"))
+                
+    def write_segment(self, name, faces, labels):
+        faces_path, labels_path = self.segment_paths(name)
+        faces = np.asarray(faces, dtype=np.uint8)
+        labels = np.asarray(labels, dtype=np.int32)
+        atomic_write(faces_path, lambda f: np.save(f, faces))
+        atomic_write(labels_path, lambda f: np.save(f, labels))
+        
+    def feature_path(self, name, key):
+        return os.path.join(self.directory, f"{name}_features_{key}.npy")
+        
+    def feature_keys(self, name):
+        prefix = os.path.join(self.directory, f"{name}_features_")
+        return {path[len(prefix):-len(".npy")] for path in glob.glob(glob.escape(prefix) + "*.npy")}
+        
+    def remove_segment_files(self, segments):
+        for segment in segments:
+            paths = list(self.segment_paths(segment['name']))
+            paths += [self.feature_path(segment['name'], key) for key in self.feature_keys(segment['name'])]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                    
+    def copy_manifest(self):
+        # Called under the lock; another process may have changed the
+        # manifest since it was last read.
+        self.manifest = self.read_manifest()
+        return json.loads(json.dumps(self.manifest))
+        
+    def refresh(self):
+        with self.lock:
+            self.manifest = self.read_manifest()
+            
+    def stage_segment(self, faces, labels):
+        # Writes a segment's files under a temporary name without the lock;
+        # publish_segment() gives them their final name once committed.
+        name = f"seg_staged_{time.time_ns()}_{os.getpid()}"
+        self.write_segment(name, faces, labels)
+        return name
+        
+    def publish_segment(self, staged, name):
+        # Caller holds the lock. The files are already synced, so this is
+        # only two renames.
+        for source, target in zip(self.segment_paths(staged), self.segment_paths(name)):
+            os.replace(source, target)
+        fsync_directory(self.directory)
+        
+    # Changes take an optional on_commit callback, which is called with the
+    # lock held right after the new manifest is written; the writer journals
+    # the change there so both land together. The samples themselves are
+    # written before the lock is taken.
+    def append(self, faces, labels, on_commit=None):
+        if len(faces) == 0:
+            return None
+            
+        staged = self.stage_segment(faces, labels)
+        with self.lock:
+            manifest = self.copy_manifest()
+            seq = manifest['next_seq']
+            name = f"seg_{seq:06d}"
+            self.publish_segment(staged, name)
+            
+            manifest['next_seq'] = seq + 1
+            manifest['segments'].append({'seq': seq, 'name': name, 'count': len(faces)})
+            self.write_manifest(manifest)
+            if on_commit is not None:
+                on_commit(name)
+        return name
+        
+    def delete_label(self, label, on_commit=None):
+        with self.lock:
+            manifest = self.copy_manifest()
+            # The tombstone only hides segments written before it, so samples
+            # added later under the same ID stay visible.
+            manifest['tombstones'].append({'label': int(label), 'before_seq': manifest['next_seq']})
+            self.write_manifest(manifest)
+            if on_commit is not None:
+                on_commit()
+            
+    def rewrite(self, faces, labels, on_commit=None):
+        staged = self.stage_segment(faces, labels) if len(faces) > 0 else None
+        with self.lock:
+            self.manifest = self.read_manifest()
+            old_segments = self.manifest['segments']
+            manifest = self.empty_manifest()
+            manifest['generation'] = self.manifest['generation'] + 1
+            manifest['next_seq'] = self.manifest['next_seq']
+            
+            if staged is not None:
+                seq = manifest['next_seq']
+                name = f"seg_{seq:06d}_g{manifest['generation']}"
+                self.publish_segment(staged, name)
+                manifest['segments'].append({'seq': seq, 'name': name, 'count': len(faces)})
+                manifest['next_seq'] = seq + 1
+                
+            self.write_manifest(manifest)
+            if on_commit is not None:
+                on_commit()
+        self.remove_segment_files(old_segments)
+            
+    def clear(self, on_commit=None):
+        self.rewrite([], [], on_commit)
+        
+    def add_segment(self, name, count, replace=False):
+        # Registers a segment whose files are already on disk.
+        with self.lock:
+            self.manifest = self.read_manifest()
+            old_segments = []
+            if replace:
+                old_segments = self.manifest['segments']
+                manifest = self.empty_manifest()
+                manifest['generation'] = self.manifest['generation'] + 1
+                manifest['next_seq'] = self.manifest['next_seq']
+            else:
+                manifest = self.copy_manifest()
+                
+            seq = manifest['next_seq']
+            manifest['segments'].append({'seq': seq, 'name': name, 'count': count})
+            manifest['next_seq'] = seq + 1
+            self.write_manifest(manifest)
+            self.remove_segment_files(old_segments)
+            
+    def read_segment(self, segment, tombstones, mmap_mode=None, key=None):
+        # With a feature key the cached features are read in place of the
+        # crops, filtered by the same tombstones.
+        faces_path, labels_path = self.segment_paths(segment['name'])
+        if key is not None:
+            faces_path = self.feature_path(segment['name'], key)
+        faces = np.load(faces_path, mmap_mode=mmap_mode)
+        labels = np.load(labels_path)
+        
+        dead = [t['label'] for t in tombstones if segment['seq'] < t['before_seq']]
+        if dead:
+            keep = ~np.isin(labels, dead)
+            faces, labels = faces[keep], labels[keep]
+        return faces, labels
+        
+    def load(self, mmap=True, key=None):
+        # Segments are opened memory-mapped. A compacted gallery is a single
+        # segment, which is returned as a read-only (N, H, W) view of the
+        # file; only several segments or tombstones force a copy.
+        mmap_mode = 'r' if mmap else None
+        for attempt in range(3):
+            self.refresh()
+            manifest = self.manifest
+            try:
+                parts = [self.read_segment(segment, manifest['tombstones'], mmap_mode, key)
+                         for segment in manifest['segments']]
+                break
+            except FileNotFoundError:
+                # Another process compacted or rewrote the segments while
+                # they were being opened; read the new manifest.
+                if attempt == 2:
+                    raise
+        parts = [(faces, labels) for faces, labels in parts if len(faces) > 0]
+        if not parts:
+            shape = (0, 0) if key is not None else (0, 0, 0)
+            return np.empty(shape, dtype=np.float32 if key is not None else np.uint8), np.empty(0, dtype=np.int32)
+        if len(parts) == 1:
+            return parts[0]
+        return (np.concatenate([faces for faces, _ in parts]),
+                np.concatenate([labels for _, labels in parts]))
+                
+    def create_builder(self, count, shape, feature_key=None, feature_size=0):
+        return SegmentBuilder(self, count, shape, feature_key, feature_size)
+        
+    def read_batch(self, name, key=None):
+        # Samples (and cached features, if any) written by one builder.
+        faces_path, labels_path = self.segment_paths(name)
+        features = None
+        if key is not None and os.path.exists(self.feature_path(name, key)):
+            features = np.load(self.feature_path(name, key), mmap_mode='r')
+        return np.load(faces_path, mmap_mode='r'), np.load(labels_path), features
+        
+    def has_features(self, key):
+        return all(os.path.exists(self.feature_path(segment['name'], key)) for segment in self.manifest['segments'])
+        
+    def load_features(self, key, mmap=True):
+        if not self.has_features(key):
+            return None
+        try:
+            return self.load(mmap, key)
+        except FileNotFoundError:
+            # Compacted or rewritten while reading.
+            return None
+            
+    def ensure_features(self, key, extract):
+        # Crops never change once written, so each segment's features are
+        # computed at most once per key.
+        for segment in list(self.manifest['segments']):
+            path = self.feature_path(segment['name'], key)
+            if os.path.exists(path):
+                continue
+            try:
+                faces = np.load(self.segment_paths(segment['name'])[0], mmap_mode='r')
+            except FileNotFoundError:
+                return False
+            features = np.ascontiguousarray(extract(faces), dtype=np.float32)
+            atomic_write(path, lambda f: np.save(f, features))
+            
+            with self.lock:
+                live = any(s['name'] == segment['name'] for s in self.manifest['segments'])
+            if not live:
+                self.remove_segment_files([segment])
+                return False
+        return True
+        
+    def state_key(self):
+        # Identifies what the store held when the manifest was last read,
+        # without reading any samples: segments never change once written.
+        manifest = self.manifest
+        return {'generation': manifest['generation'], 'segments': [segment['name'] for segment in manifest['segments']],
+                'tombstones': len(manifest['tombstones'])}
+                
+    def needs_compaction(self):
+        manifest = self.manifest
+        return (len(manifest['segments']) > self.max_segments or
+                len(manifest['tombstones']) >= self.max_tombstones)
+        
+    def compact(self, journal=None):
+        # With the shared journal, the manifest records the journal offset
+        # it is current at, and the journal is checkpointed up to there.
+        with self.lock:
+            snapshot = self.copy_manifest()
+            
+        segments = snapshot['segments']
+        if not segments or (len(segments) == 1 and not snapshot['tombstones']):
+            return False
+            
+        # Merge outside the lock: segments are immutable, so captures and
+        # deletes can keep landing while the merged segment is written.
+        try:
+            parts = [self.read_segment(segment, snapshot['tombstones']) for segment in segments]
+        except FileNotFoundError:
+            # A concurrent rewrite or clear removed the segments being merged.
+            return False
+        parts = [(faces, labels) for faces, labels in parts if len(faces) > 0]
+        last_seq = segments[-1]['seq']
+        merged = None
+        if parts:
+            merged = {'seq': last_seq, 'name': f"seg_{last_seq:06d}_c{time.time_ns()}", 'count': 0}
+            faces = np.concatenate([faces for faces, _ in parts])
+            labels = np.concatenate([labels for _, labels in parts])
+            merged['count'] = len(faces)
+            self.write_segment(merged['name'], faces, labels)
+            
+            # Carry over cached features that every merged segment has.
+            keys = set.intersection(*[self.feature_keys(segment['name']) for segment in segments])
+            for key in keys:
+                try:
+                    features = np.concatenate([self.read_segment(segment, snapshot['tombstones'], key=key)[0]
+                                               for segment in segments])
+                except FileNotFoundError:
+                    continue
+                atomic_write(self.feature_path(merged['name'], key), lambda f: np.save(f, features))
+            
+        with self.lock:
+            manifest = self.copy_manifest()
+            if manifest['generation'] != snapshot['generation']:
+                if merged:
+                    self.remove_segment_files([merged])
+                return False
+                
+            merged_names = {segment['name'] for segment in segments}
+            manifest['segments'] = ([merged] if merged else []) + \
+                [segment for segment in manifest['segments'] if segment['name'] not in merged_names]
+            manifest['tombstones'] = [t for t in manifest['tombstones'] if t not in snapshot['tombstones']]
+            if journal is not None:
+                # Every store change is journaled under this lock.
+                manifest['journal_offset'] = journal.end()
+            self.write_manifest(manifest)
+            
+        self.remove_segment_files(segments)
+        if journal is not None:
+            journal.checkpoint(manifest['journal_offset'], JOURNAL_CHECKPOINT_BYTES)
+        return True
+        
+    def compact_in_background(self, journal=None):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        if not self.needs_compaction():
+            return
+            
+        def worker():
+            try:
+                self.compact(journal)
+            except Exception as e:
+                print(f"Gallery compaction failed: {str(e)}")
+                
+        self.compaction_thread = threading.Thread(target=worker, daemon=True)
+        self.compaction_thread.start()
+
+
+# Writes one segment incrementally into memory-mapped temp files, so a
+# gallery far larger than memory can be streamed in. Nothing is visible in
+# the store until commit(); abort() discards the partial files.
+class SegmentBuilder:
+    def __init__(self, store, count, shape, feature_key=None, feature_size=0):
+        self.store = store
+        self.count = count
+        self.name = f"seg_import_{time.time_ns()}"
+        self.written = 0
+        self.features_written = 0
+        os.makedirs(store.directory, exist_ok=True)
+        
+        faces_path, labels_path = store.segment_paths(self.name)
+        self.targets = [faces_path, labels_path]
+        self.faces = np.lib.format.open_memmap(faces_path + ".tmp", mode='w+', dtype=np.uint8,
+                                               shape=(count,) + tuple(shape))
+        self.labels = np.lib.format.open_memmap(labels_path + ".tmp", mode='w+', dtype=np.int32, shape=(count,))
+        self.features = None
+        if feature_key is not None:
+            features_path = store.feature_path(self.name, feature_key)
+            self.targets.append(features_path)
+            self.features = np.lib.format.open_memmap(features_path + ".tmp", mode='w+', dtype=np.float32,
+                                                      shape=(count, feature_size))
+            
+    def add(self, faces, labels):
+        end = self.written + len(faces)
+        if end > self.count:
+            raise ValueError("More samples than declared")
+        self.faces[self.written:end] = faces
+        self.labels[self.written:end] = labels
+        self.written = end
+        
+    def add_features(self, features):
+        end = self.features_written + len(features)
+        if self.features is None or end > self.count:
+            raise ValueError("Unexpected features")
+        self.features[self.features_written:end] = features
+        self.features_written = end
+        
+    def close(self):
+        for array in (self.faces, self.labels, self.features):
+            if array is not None:
+                array.flush()
+        self.faces = self.labels = self.features = None
+        
+    def commit(self, replace=False):
+        if self.written != self.count:
+            raise ValueError(f"Expected {self.count} samples, got {self.written}")
+        if len(self.targets) > 2 and self.features_written != self.count:
+            raise ValueError(f"Expected {self.count} feature rows, got {self.features_written}")
+            
+        self.close()
+        for path in self.targets:
+            atomic_replace(path + ".tmp", path)
+        self.store.add_segment(self.name, self.count, replace)
+        
+    def abort(self):
+        self.close()
+        for path in self.targets:
+            for candidate in (path + ".tmp", path):
+                try:
+                    os.remove(candidate)
+                except FileNotFoundError:
+                    pass
+
+
+# Optional SQLite gallery backend (FACE_GALLERY_STORE=sqlite). People,
+# samples and cached features live in indexed tables of one WAL-mode
+# database: per-person deletes and counts only touch that person's rows,
+# and other connections keep reading a consistent snapshot while a write
+# is in progress. Crops and features are stored as BLOBs. Each thread
+# gets its own connection. Rows of an import still listed in the imports
+# table are hidden from every read (see SQLiteBatchBuilder).
+class SQLiteGalleryStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS people (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS samples (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            person_id INTEGER NOT NULL,
+            batch TEXT,
+            height INTEGER NOT NULL,
+            width INTEGER NOT NULL,
+            face BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS samples_person ON samples (person_id);
+        CREATE INDEX IF NOT EXISTS samples_batch ON samples (batch);
+        CREATE TABLE IF NOT EXISTS features (
+            sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (sample_id, key)
+        );
+        CREATE TABLE IF NOT EXISTS imports (
+            name TEXT PRIMARY KEY,
+            pid INTEGER NOT NULL,
+            written INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE VIEW IF NOT EXISTS visible_samples AS
+            SELECT * FROM samples WHERE batch IS NULL OR batch NOT IN (SELECT name FROM imports);
+    """
+    
+    def __init__(self, path="face_gallery.db", lock=None):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.local = threading.local()
+        # SQLite serialises the writes themselves; the lock only pairs each
+        # commit with its on_commit callback (see SegmentedGalleryStore).
+        self.lock = lock or threading.Lock()
+        
+    def exists(self):
+        return os.path.exists(self.path)
+        
+    def open_connection(self):
+        os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.executescript(self.SCHEMA)
+        return connection
+        
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.open_connection()
+        return connection
+        
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+            
+    @staticmethod
+    def sample_rows(faces, labels, batch=None):
+        faces = np.asarray(faces, dtype=np.uint8)
+        labels = np.asarray(labels).ravel()
+        for face, label in zip(faces, labels):
+            yield int(label), batch, face.shape[0], face.shape[1], np.ascontiguousarray(face).tobytes()
+            
+    def insert_samples(self, connection, faces, labels, batch=None):
+        connection.executemany(
+            "INSERT INTO samples (person_id, batch, height, width, face) VALUES (?, ?, ?, ?, ?)",
+            self.sample_rows(faces, labels, batch)
+        )
+        
+    @contextlib.contextmanager
+    def transaction(self, on_commit=None, *args):
+        # The rows are written outside the lock; only the commit and the
+        # callback run under it.
+        connection = self.connection()
+        try:
+            yield connection
+            with self.lock:
+                connection.commit()
+                if on_commit is not None:
+                    on_commit(*args)
+        except BaseException:
+            connection.rollback()
+            raise
+            
+    def append(self, faces, labels, on_commit=None):
+        if len(faces) == 0:
+            return None
+        batch = f"append_{time.time_ns()}"
+        with self.transaction(on_commit, batch) as connection:
+            self.insert_samples(connection, faces, labels, batch)
+        return batch
+        
+    # Every read goes to the database; there is no cached state to refresh.
+    def refresh(self):
+        pass
+            
+    def delete_label(self, label, on_commit=None):
+        with self.transaction(on_commit) as connection:
+            connection.execute("DELETE FROM samples WHERE person_id = ? AND id IN "
+                               "(SELECT id FROM visible_samples)", (int(label),))
+            connection.execute("DELETE FROM people WHERE id = ?", (int(label),))
+            
+    def rewrite(self, faces, labels, on_commit=None):
+        with self.transaction(on_commit) as connection:
+            connection.execute("DELETE FROM samples WHERE id IN (SELECT id FROM visible_samples)")
+            self.insert_samples(connection, faces, labels)
+            
+    def clear(self, on_commit=None):
+        self.rewrite([], [], on_commit)
+        
+    def set_people(self, id_to_name):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM people")
+            connection.executemany("INSERT INTO people (id, name) VALUES (?, ?)",
+                                   [(int(k), v) for k, v in id_to_name.items()])
+            
+    def people(self):
+        if not self.exists():
+            return {}
+        return dict(self.connection().execute("SELECT id, name FROM people ORDER BY id"))
+        
+    def label_counts(self):
+        if not self.exists():
+            return {}
+        rows = self.connection().execute("SELECT person_id, COUNT(*) FROM visible_samples GROUP BY person_id")
+        return {int(label): int(count) for label, count in rows}
+        
+    def read_rows(self, query, args=(), key=None):
+        # Builds (N, H, W) crops, or (N, D) features when key is set, plus
+        # labels from rows of (person_id, height, width, blob), inside one
+        # read transaction so the count and the rows agree.
+        connection = self.connection()
+        connection.execute("BEGIN")
+        try:
+            rows = connection.execute(query, args).fetchall()
+        finally:
+            connection.rollback()
+            
+        labels = np.array([row[0] for row in rows], dtype=np.int32)
+        if key is not None:
+            if not rows:
+                return np.empty((0, 0), dtype=np.float32), labels
+            return np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows]), labels
+            
+        if not rows:
+            return np.empty((0, 0, 0), dtype=np.uint8), labels
+        faces = np.empty((len(rows), rows[0][1], rows[0][2]), dtype=np.uint8)
+        for i, row in enumerate(rows):
+            faces[i] = np.frombuffer(row[3], dtype=np.uint8).reshape(row[1], row[2])
+        return faces, labels
+        
+    def load(self, mmap=True):
+        if not self.exists():
+            return np.empty((0, 0, 0), dtype=np.uint8), np.empty(0, dtype=np.int32)
+        return self.read_rows("SELECT person_id, height, width, face FROM visible_samples ORDER BY id")
+        
+    def person_samples(self, label):
+        return self.read_rows(
+            "SELECT person_id, height, width, face FROM visible_samples WHERE person_id = ? ORDER BY id",
+            (int(label),)
+        )[0]
+        
+    def has_features(self, key):
+        if not self.exists():
+            return False
+        missing, = self.connection().execute(
+            "SELECT COUNT(*) FROM visible_samples s WHERE NOT EXISTS "
+            "(SELECT 1 FROM features f WHERE f.sample_id = s.id AND f.key = ?)", (key,)
+        ).fetchone()
+        return missing == 0
+        
+    def load_features(self, key, mmap=True):
+        if not self.has_features(key):
+            return None
+        features, labels = self.read_rows(
+            "SELECT s.person_id, 0, 0, f.data FROM visible_samples s "
+            "JOIN features f ON f.sample_id = s.id AND f.key = ? ORDER BY s.id", (key,), key
+        )
+        # A sample added after the check has no features yet.
+        if len(labels) != sum(self.label_counts().values()):
+            return None
+        return features, labels
+        
+    def ensure_features(self, key, extract, chunk_size=256):
+        connection = self.connection()
+        while True:
+            rows = connection.execute(
+                "SELECT id, height, width, face FROM visible_samples s WHERE NOT EXISTS "
+                "(SELECT 1 FROM features f WHERE f.sample_id = s.id AND f.key = ?) ORDER BY id LIMIT ?",
+                (key, chunk_size)
+            ).fetchall()
+            if not rows:
+                return True
+                
+            faces = np.stack([np.frombuffer(row[3], dtype=np.uint8).reshape(row[1], row[2]) for row in rows])
+            features = np.ascontiguousarray(extract(faces), dtype=np.float32)
+            with connection:
+                # Samples deleted meanwhile are skipped.
+                connection.executemany(
+                    "INSERT OR REPLACE INTO features (sample_id, key, data) "
+                    "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM samples WHERE id = ?)",
+                    [(row[0], key, feature.tobytes(), row[0]) for row, feature in zip(rows, features)]
+                )
+                
+    def create_builder(self, count, shape, feature_key=None, feature_size=0):
+        self.roll_back_imports()
+        return SQLiteBatchBuilder(self, count, shape, feature_key, feature_size)
+        
+    def roll_back_imports(self):
+        # Drops the rows of imports whose process is gone; the rows were
+        # never visible, so nothing is journaled.
+        if not self.exists():
+            return
+        connection = self.connection()
+        for name, pid in connection.execute("SELECT name, pid FROM imports").fetchall():
+            if not process_alive(pid):
+                with connection:
+                    connection.execute("DELETE FROM samples WHERE batch = ?", (name,))
+                    connection.execute("DELETE FROM imports WHERE name = ?", (name,))
+        
+    def read_batch(self, name, key=None):
+        faces, labels = self.read_rows(
+            "SELECT person_id, height, width, face FROM visible_samples WHERE batch = ? ORDER BY id", (name,)
+        )
+        features = None
+        if key is not None:
+            features, feature_labels = self.read_rows(
+                "SELECT s.person_id, 0, 0, f.data FROM visible_samples s JOIN features f "
+                "ON f.sample_id = s.id AND f.key = ? WHERE s.batch = ? ORDER BY s.id", (key, name), key
+            )
+            if len(feature_labels) != len(labels):
+                features = None
+        return faces, labels, features
+        
+    def state_key(self):
+        # Row IDs only grow; with the journal offset (see
+        # FaceEngine.model_token) this tells whether rows changed.
+        if not self.exists():
+            return [0, None]
+        return list(self.connection().execute("SELECT COUNT(*), MAX(id) FROM visible_samples").fetchone())
+        
+    # The database reclaims space itself; there is nothing to compact.
+    def needs_compaction(self):
+        return False
+        
+    def compact(self, journal=None):
+        return False
+        
+    def compact_in_background(self, journal=None):
+        # Every commit is journaled under the lock, so the database is
+        # current at any offset read under it.
+        if journal is not None:
+            with self.lock:
+                offset = journal.end()
+            journal.checkpoint(offset, JOURNAL_CHECKPOINT_BYTES)
+        
+        
+# Samples an SQLiteBatchBuilder inserts between commits.
+SQLITE_IMPORT_CHUNK_SAMPLES = 1024
+
+
+# SegmentBuilder counterpart for SQLiteGalleryStore: rows are inserted on a
+# private connection, tagged with the batch name, and committed every
+# SQLITE_IMPORT_CHUNK_SAMPLES so other writers are never locked out for
+# the whole import. The batch stays listed in the imports table, which
+# hides its rows from readers, until commit(); abort() - or
+# roll_back_imports() after a crash - deletes them again.
+class SQLiteBatchBuilder:
+    def __init__(self, store, count, shape, feature_key=None, feature_size=0,
+                 chunk_samples=SQLITE_IMPORT_CHUNK_SAMPLES):
+        self.store = store
+        self.count = count
+        self.shape = tuple(shape)
+        self.feature_key = feature_key
+        self.chunk_samples = chunk_samples
+        self.name = f"import_{time.time_ns()}"
+        self.sample_ids = []
+        self.features_written = 0
+        self.pending = 0
+        self.connection = store.open_connection()
+        with self.connection:
+            self.connection.execute("INSERT INTO imports (name, pid) VALUES (?, ?)", (self.name, os.getpid()))
+            
+    def checkpoint(self, rows):
+        self.pending += rows
+        if self.pending >= self.chunk_samples:
+            self.connection.execute("UPDATE imports SET written = ? WHERE name = ?",
+                                    (len(self.sample_ids), self.name))
+            self.connection.commit()
+            self.pending = 0
+            
+    def add(self, faces, labels):
+        if len(self.sample_ids) + len(faces) > self.count:
+            raise ValueError("More samples than declared")
+        for row in self.store.sample_rows(faces, labels, self.name):
+            cursor = self.connection.execute(
+                "INSERT INTO samples (person_id, batch, height, width, face) VALUES (?, ?, ?, ?, ?)", row
+            )
+            self.sample_ids.append(cursor.lastrowid)
+        self.checkpoint(len(faces))
+            
+    def add_features(self, features):
+        end = self.features_written + len(features)
+        if self.feature_key is None or end > len(self.sample_ids):
+            raise ValueError("Unexpected features")
+        ids = self.sample_ids[self.features_written:end]
+        self.connection.executemany(
+            "INSERT INTO features (sample_id, key, data) VALUES (?, ?, ?)",
+            [(sample_id, self.feature_key, np.ascontiguousarray(feature, dtype=np.float32).tobytes())
+             for sample_id, feature in zip(ids, features)]
+        )
+        self.features_written = end
+        self.checkpoint(len(features))
+        
+    def commit(self, replace=False):
+        if len(self.sample_ids) != self.count:
+            raise ValueError(f"Expected {self.count} samples, got {len(self.sample_ids)}")
+        if self.feature_key is not None and self.features_written != self.count:
+            raise ValueError(f"Expected {self.count} feature rows, got {self.features_written}")
+            
+        # Publishing is one short transaction: drop the visible rows when
+        # replacing, then unhide this batch.
+        if replace:
+            self.connection.execute("DELETE FROM samples WHERE id IN (SELECT id FROM visible_samples)")
+        self.connection.execute("DELETE FROM imports WHERE name = ?", (self.name,))
+        self.connection.commit()
+        self.connection.close()
+        
+    def abort(self):
+        self.connection.rollback()
+        with self.connection:
+            self.connection.execute("DELETE FROM samples WHERE batch = ?", (self.name,))
+            self.connection.execute("DELETE FROM imports WHERE name = ?", (self.name,))
+        self.connection.close()
+
+
+# Both stores share the journal's lock file, so a change and its journal
+# entry are committed together.
+GALLERY_STORES = {
+    'segments': lambda lock: SegmentedGalleryStore("face_gallery", lock=lock),
+    'sqlite': lambda lock: SQLiteGalleryStore("face_gallery.db", lock=lock)
+}
+
+
+def create_gallery_store(kind=None, lock=None):
+    kind = kind or os.environ.get("FACE_GALLERY_STORE", "segments")
+    if kind not in GALLERY_STORES:
+        raise ValueError(f"Unknown gallery store '{kind}'")
+    return GALLERY_STORES[kind](lock)
+
+
+# Write-behind persistence. The UI thread only queues changes; a worker
+# thread waits for a burst of changes to settle (debounce, bounded by
+# max_delay), coalesces them and writes them through the store. Adjacent
+# appends become one segment, a rewrite or clear supersedes everything
+# queued before it, and only the newest metadata snapshot is written.
+class GalleryWriter:
+    def __init__(self, store, debounce=0.5, max_delay=2.0, on_error=None, journal=None):
+        self.store = store
+        self.journal = journal
+        self.shared_metadata = None
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.on_error = on_error
+        self.condition = threading.Condition()
+        self.pending = []
+        self.metadata = None
+        self.first_change = None
+        self.last_change = None
+        self.flush_requested = False
+        self.busy = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        
+    def has_work(self):
+        return bool(self.pending) or self.metadata is not None
+        
+    def queue(self, op, args):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Gallery writer is closed")
+            if op == 'append' and self.pending and self.pending[-1][0] == 'append':
+                faces, labels = self.pending[-1][1]
+                self.pending[-1] = ('append', (faces + args[0], labels + args[1]))
+            elif op in ('rewrite', 'clear'):
+                self.pending = [(op, args)]
+            else:
+                self.pending.append((op, args))
+            self.touch()
+            
+    def touch(self):
+        now = time.monotonic()
+        if self.first_change is None:
+            self.first_change = now
+        self.last_change = now
+        self.condition.notify_all()
+        
+    def append(self, faces, labels):
+        if len(faces) == 0:
+            return
+        self.queue('append', ([np.asarray(faces, dtype=np.uint8)], [np.asarray(labels, dtype=np.int32)]))
+        
+    def delete_label(self, label):
+        self.queue('delete_label', (int(label),))
+        
+    def rewrite(self, faces, labels):
+        self.queue('rewrite', (np.asarray(faces, dtype=np.uint8), np.asarray(labels, dtype=np.int32)))
+        
+    def clear(self):
+        self.queue('clear', ())
+        
+    def save_metadata(self, path, data):
+        # Snapshot now so later edits on the UI thread don't leak into
+        # the queued write.
+        data = json.loads(json.dumps(data))
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Gallery writer is closed")
+            self.metadata = (path, data)
+            self.touch()
+            
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.has_work() and not self.closed:
+                    self.condition.wait()
+                if not self.has_work():
+                    return
+                    
+                while not (self.closed or self.flush_requested):
+                    deadline = min(self.last_change + self.debounce, self.first_change + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                    
+                pending, metadata = self.pending, self.metadata
+                self.pending, self.metadata = [], None
+                self.first_change = self.last_change = None
+                self.busy = True
+                
+            try:
+                self.write(pending, metadata)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+                else:
+                    print(f"Failed to save data: {str(e)}")
+            finally:
+                with self.condition:
+                    self.busy = False
+                    if not self.has_work():
+                        self.flush_requested = False
+                    self.condition.notify_all()
+                    
+    def log(self, op, **fields):
+        if self.journal is not None:
+            self.journal.append(op, **fields)
+            
+    def write(self, pending, metadata):
+        # Each store change is journaled from its on_commit callback, under
+        # the store's lock, so the journal offset identifies what the store
+        # holds. The lock is never held while samples are written.
+        shared = None
+        if metadata is not None:
+            shared = {'settings': metadata[1].get('settings'), 'recognizer': metadata[1].get('recognizer')}
+            
+        def log_reset():
+            if metadata is not None:
+                self.log('reset', id_to_name=metadata[1].get('id_to_name', {}), **shared)
+            else:
+                self.log('reset')
+                
+        reset = False
+        for op, args in pending:
+            if op == 'append':
+                faces, labels = args
+                self.store.append(np.concatenate(faces), np.concatenate(labels),
+                                  on_commit=lambda segment: self.log('append', segment=segment))
+            elif op == 'delete_label':
+                self.store.delete_label(*args, on_commit=lambda: self.log('delete', id=args[0]))
+            else:
+                getattr(self.store, op)(*args, on_commit=log_reset)
+                reset = True
+                
+        # Metadata goes last so it never names people whose samples are
+        # not on disk yet.
+        if metadata is not None:
+            atomic_write_json(*metadata)
+            if hasattr(self.store, 'set_people'):
+                self.store.set_people({int(k): v for k, v in metadata[1].get('id_to_name', {}).items()})
+                
+            # Other processes only hear about metadata when the settings or
+            # the recognizer change, not on every save.
+            if not reset and self.shared_metadata is not None and shared != self.shared_metadata:
+                self.log('metadata', **shared)
+            self.shared_metadata = shared
+            
+        if pending:
+            self.store.compact_in_background(self.journal)
+            
+    def flush(self, timeout=None):
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: not self.has_work() and not self.busy, timeout)
+            
+    def close(self, timeout=None):
+        flushed = self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        return flushed
+
+
+# Single-file gallery bundle used for export/import. After an 8-byte magic
+# and a version, the file is a sequence of chunks, each a header
+# (kind, raw length, compressed length, crc32 of the raw data) followed by
+# the zlib-compressed payload:
+#   META  JSON metadata (names, settings, counts, crop shape)
+#   SAMP  a block of int32 labels followed by the matching uint8 crops
+#   FEAT  float32 features for the preceding SAMP block (optional)
+#   MODL  a piece of the trained model file (optional)
+#   END   JSON with the sha256 of every preceding payload
+# Both directions work one chunk at a time, report progress as a fraction
+# and stop with BundleCancelled once the cancel event is set.
+BUNDLE_MAGIC = b"FGBUNDLE"
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct("<4sIII")
+BUNDLE_CHUNK_SAMPLES = 256
+BUNDLE_MODEL_CHUNK_BYTES = 4 << 20
+
+
+class BundleCancelled(Exception):
+    pass
+
+
+def write_bundle(path, metadata, face_data, face_labels, features=None, model_file=None,
+                 progress=None, cancel=None, chunk_samples=BUNDLE_CHUNK_SAMPLES):
+    face_data = np.asanyarray(face_data)
+    face_labels = np.asarray(face_labels, dtype=np.int32)
+    model_size = os.path.getsize(model_file) if model_file else 0
+    
+    metadata = dict(metadata)
+    metadata.update({
+        'face_count': len(face_data),
+        'crop_shape': list(face_data.shape[1:]),
+        'feature_size': int(features.shape[1]) if features is not None else 0,
+        'model_size': model_size
+    })
+    if features is None:
+        metadata.pop('feature_key', None)
+    if not model_file:
+        metadata.pop('model', None)
+        
+    total = max(face_data.nbytes + (features.nbytes if features is not None else 0) + model_size, 1)
+    
+    def write(f):
+        digest = hashlib.sha256()
+        done = 0
+        
+        def emit(kind, data):
+            if cancel is not None and cancel.is_set():
+                raise BundleCancelled()
+            compressed = zlib.compress(data, 1)
+            f.write(BUNDLE_HEADER.pack(kind, len(data), len(compressed), zlib.crc32(data)))
+            f.write(compressed)
+            digest.update(data)
+            
+        f.write(BUNDLE_MAGIC + struct.pack("<H", BUNDLE_VERSION))
+        emit(b'META', json.dumps(metadata).encode('utf-8'))
+        
+        for start in range(0, len(face_data), chunk_samples):
+            faces = np.ascontiguousarray(face_data[start:start + chunk_samples], dtype=np.uint8)
+            emit(b'SAMP', face_labels[start:start + chunk_samples].tobytes() + faces.tobytes())
+            done += faces.nbytes
+            if features is not None:
+                block = np.ascontiguousarray(features[start:start + chunk_samples], dtype=np.float32)
+                emit(b'FEAT', block.tobytes())
+                done += block.nbytes
+            if progress:
+                progress(done / total)
+                
+        if model_file:
+            with open(model_file, 'rb') as model:
+                for data in iter(lambda: model.read(BUNDLE_MODEL_CHUNK_BYTES), b''):
+                    emit(b'MODL', data)
+                    done += len(data)
+                    if progress:
+                        progress(done / total)
+                        
+        end = json.dumps({'sha256': digest.hexdigest()}).encode('utf-8')
+        f.write(BUNDLE_HEADER.pack(b'END ', len(end), len(end), zlib.crc32(end)))
+        f.write(end)
+        
+    atomic_write(path, write)
+    if progress:
+        progress(1.0)
+        
+        
+def read_bundle_chunks(path, progress=None, cancel=None):
+    size = max(os.path.getsize(path), 1)
+    with open(path, 'rb') as f:
+        if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            raise ValueError("Not a face gallery bundle")
+        version, = struct.unpack("<H", f.read(2))
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported bundle version {version}")
+            
+        digest = hashlib.sha256()
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise BundleCancelled()
+                
+            header = f.read(BUNDLE_HEADER.size)
+            if len(header) < BUNDLE_HEADER.size:
+                raise ValueError("Bundle is truncated")
+            kind, raw_size, stored_size, crc = BUNDLE_HEADER.unpack(header)
+            payload = f.read(stored_size)
+            if len(payload) < stored_size:
+                raise ValueError("Bundle is truncated")
+                
+            if kind == b'END ':
+                if json.loads(payload)['sha256'] != digest.hexdigest():
+                    raise ValueError("Bundle checksum mismatch")
+                if progress:
+                    progress(1.0)
+                return
+                
+            try:
+                data = zlib.decompress(payload)
+            except zlib.error:
+                raise ValueError(f"Bundle chunk {kind.decode('ascii', 'replace')} is corrupt")
+            if len(data) != raw_size or zlib.crc32(data) != crc:
+                raise ValueError(f"Bundle chunk {kind.decode('ascii', 'replace')} is corrupt")
+            digest.update(data)
+            
+            yield kind, data
+            if progress:
+                progress(f.tell() / size)
+                
+                
+def read_bundle_metadata(path):
+    for kind, data in read_bundle_chunks(path):
+        if kind != b'META':
+            break
+        return json.loads(data)
+    raise ValueError("Bundle metadata is missing")
+    
+    
+def merge_name_maps(name_to_id, incoming_id_to_name, next_id=None):
+    # Maps every incoming person ID onto the local map: names that already
+    # exist keep their local ID, new names get fresh IDs from next_id (by
+    # default after the highest one in use). Returns (label_map, updated
+    # name_to_id).
+    merged = dict(name_to_id)
+    next_id = max([max(merged.values(), default=-1) + 1, next_id or 0])
+    label_map = {}
+    for incoming_id, name in sorted(incoming_id_to_name.items(), key=lambda item: int(item[0])):
+        if name not in merged:
+            merged[name] = next_id
+            next_id += 1
+        label_map[int(incoming_id)] = merged[name]
+    return label_map, merged
+    
+    
+def import_bundle(path, store, model_tmp=None, progress=None, cancel=None,
+                  label_map=None, crop_size=None, key=None):
+    # Streams the bundle into a new store segment, replacing the gallery
+    # only after the whole file has been verified. A bundled model is
+    # written to model_tmp. Returns the bundle metadata.
+    #
+    # With a label_map the bundle is merged instead: labels are remapped,
+    # crops are resized to crop_size, features are kept only if they were
+    # computed for `key`, the model is ignored and the segment is appended
+    # to the existing gallery.
+    merge = label_map is not None
+    metadata = None
+    builder = None
+    model_out = None
+    try:
+        for kind, data in read_bundle_chunks(path, progress, cancel):
+            if kind == b'META':
+                metadata = json.loads(data)
+                count = int(metadata['face_count'])
+                shape = tuple(metadata['crop_shape'])
+                keep_features = metadata.get('feature_size') and (not merge or (
+                    metadata.get('feature_key') == key and shape == (crop_size, crop_size)))
+                if count > 0:
+                    builder = store.create_builder(count, (crop_size, crop_size) if merge else shape,
+                                             metadata['feature_key'] if keep_features else None,
+                                             metadata.get('feature_size', 0))
+            elif metadata is None:
+                raise ValueError("Bundle metadata is missing")
+            elif kind == b'SAMP':
+                if builder is None:
+                    raise ValueError("Unexpected samples in bundle")
+                sample_size = 4 + int(np.prod(shape))
+                n = len(data) // sample_size
+                labels = np.frombuffer(data, dtype=np.int32, count=n)
+                faces = np.frombuffer(data, dtype=np.uint8, offset=4 * n).reshape((n,) + shape)
+                if merge:
+                    try:
+                        labels = np.array([label_map[int(label)] for label in labels], dtype=np.int32)
+                    except KeyError as e:
+                        raise ValueError(f"Bundle sample label {e.args[0]} has no name")
+                    faces = resize_samples(faces, crop_size)
+                builder.add(faces, labels)
+            elif kind == b'FEAT':
+                if builder is None:
+                    raise ValueError("Unexpected features in bundle")
+                if keep_features:
+                    builder.add_features(np.frombuffer(data, dtype=np.float32).reshape(-1, metadata['feature_size']))
+            elif kind == b'MODL' and model_tmp and not merge:
+                if model_out is None:
+                    model_out = open(model_tmp, 'wb')
+                model_out.write(data)
+                
+        if metadata is None:
+            raise ValueError("Bundle metadata is missing")
+            
+        if model_out is not None:
+            model_out.flush()
+            os.fsync(model_out.fileno())
+            model_out.close()
+        elif model_tmp and metadata.get('model') and not merge:
+            raise ValueError("Bundled model is missing")
+            
+        if builder is not None:
+            builder.commit(replace=not merge)
+            metadata['segment'] = builder.name
+        elif not merge:
+            store.clear()
+        return metadata
+        
+    except BaseException:
+        if builder is not None:
+            builder.abort()
+        if model_out is not None:
+            model_out.close()
+            os.remove(model_tmp)
+        raise
+
+
+# The detector models behind FaceEngine.detect_faces. OpenCV's cascade,
+# dlib and MediaPipe are not safe to call from several threads at once, so
+# every thread that detects gets its own set.
+class FaceDetectors:
+    def __init__(self):
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        
+        if DLIB_AVAILABLE:
+            self.dlib_detector = dlib.get_frontal_face_detector()
+        else:
+            self.dlib_detector = None
+            
+        if MEDIAPIPE_AVAILABLE:
+            self.mp_face_detector = mp.solutions.face_detection.FaceDetection(
+                model_selection=0,
+                min_detection_confidence=0.5
+            )
+        else:
+            self.mp_face_detector = None
+            
+    def close(self):
+        if self.mp_face_detector:
+            self.mp_face_detector.close()
+
+
+# face_recognition keeps a single detector for the whole process.
+FACE_RECOGNITION_LOCK = threading.Lock()
+
+
+# What a FaceEngine tells its front end. Training and compaction finish on
+# worker threads; dispatch() hands their callbacks to the thread that owns
+# the engine (the GUI schedules them on its event loop). A front end passes
+# any object with these methods as FaceEngine(frontend=...); these defaults
+# suit servers and batch jobs. Without an event loop, callbacks run on the
+# worker thread under `lock`, which code driving the engine from its own
+# threads (the service, the asyncio wrapper) holds around its calls, so a
+# callback never swaps the gallery in the middle of one.
+class EngineFrontend:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.compaction_timer = None
+        
+    def dispatch(self, callback):
+        with self.lock:
+            callback()
+            
+    def gallery_changed(self):
+        pass
+        
+    def training_failed(self, message):
+        pass
+        
+    def on_training_done(self):
+        pass
+        
+    def on_save_error(self, error):
+        # Called from the writer thread.
+        print(f"Failed to save data: {str(error)}")
+        
+    def schedule_compaction(self, compact, delay):
+        # Debounced like the GUI's: a burst of deletes compacts once,
+        # `delay` ms after the last of them.
+        if self.compaction_timer is not None:
+            self.compaction_timer.cancel()
+        self.compaction_timer = threading.Timer(delay / 1000.0, self.dispatch, (compact,))
+        self.compaction_timer.daemon = True
+        self.compaction_timer.start()
+
+
+# Detection, recognition and gallery persistence without any GUI. The Tk
+# app drives one; servers and batch jobs can use it directly.
+class FaceEngine:
+    def __init__(self, store_kind=None, frontend=None):
+        self.frontend = frontend if frontend is not None else EngineFrontend()
+        self.setup_detectors()
+        
+        self.recognizer_backend = 'lbph'
+        self.gallery_settings = dict(DEFAULT_GALLERY_SETTINGS)
+        self.face_recognizer = None
+        self.training_lock = threading.Lock()
+        self.training_generation = 0
+        self.training_thread = None
+        self.recognizer_lock = threading.Lock()
+        # Several app instances may share the gallery; the journal's lock
+        # file serialises store, model and name changes between them.
+        self.journal = GalleryJournal("gallery_journal.log")
+        self.journal_offset = 0
+        self.model_save_lock = self.journal.lock
+        
+        self.gallery = FaceGallery(self.gallery_settings['crop_size'])
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.next_person_id = 0
+        self.deleted_ids = set()
+        self.compaction_thread = None
+        self.reload_generation = 0
+        self.reload_thread = None
+        self.set_data_paths()
+        self.gallery_store = create_gallery_store(store_kind, lock=self.journal.lock)
+        self.gallery_writer = GalleryWriter(self.gallery_store, on_error=self.frontend.on_save_error, journal=self.journal)
+        
+        self.load_data()
+        
+    def set_data_paths(self):
+        self.data_file = "face_data_opencv.json"
+        self.model_file = "face_model_opencv"
+        self.model_hash_file = "face_model_opencv.hash"
+        self.legacy_face_file = "face_data_opencv.npy"
+        self.legacy_label_file = "face_labels_opencv.npy"
+        
+    def setup_detectors(self):
+        self.available_methods = ['haar']
+        
+        if DLIB_AVAILABLE:
+            self.available_methods.append('dlib')
+        
+        if FACE_RECOGNITION_AVAILABLE:
+            self.available_methods.append('face_recognition')
+            
+        if MEDIAPIPE_AVAILABLE:
+            self.available_methods.append('mediapipe')
+        
+        if FACE_RECOGNITION_AVAILABLE:
+            self.detection_method = 'face_recognition'
+        else:
+            self.detection_method = 'haar'
+            
+        # Created on first use in each thread, so concurrent callers (camera
+        # workers, the service, the asyncio executor) never share a model.
+        self.thread_detectors = threading.local()
+        self.detector_sets = []
+        self.detector_sets_lock = threading.Lock()
+        
+    def detectors(self):
+        detectors = getattr(self.thread_detectors, 'detectors', None)
+        if detectors is None:
+            detectors = self.thread_detectors.detectors = FaceDetectors()
+            with self.detector_sets_lock:
+                self.detector_sets.append(detectors)
+        return detectors
+        
+    def detect_faces(self, frame, gray):
+        faces = []
+        detectors = self.detectors()
+        
+        if self.detection_method == 'haar':
+            faces = detectors.face_cascade.detectMultiScale(gray, 1.3, 5)
+            faces = [(x, y, w, h) for (x, y, w, h) in faces]
+            
+        elif self.detection_method == 'dlib' and DLIB_AVAILABLE:
+            dlib_faces = detectors.dlib_detector(gray, 1)
+            faces = [(face.left(), face.top(), 
+                     face.right() - face.left(), 
+                     face.bottom() - face.top()) 
+                    for face in dlib_faces]
+            
+        elif self.detection_method == 'face_recognition' and FACE_RECOGNITION_AVAILABLE:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            with FACE_RECOGNITION_LOCK:
+                face_locations = face_recognition.face_locations(rgb_frame, model='hog')
+            faces = [(left, top, right - left, bottom - top) 
+                    for (top, right, bottom, left) in face_locations]
+            
+        elif self.detection_method == 'mediapipe' and MEDIAPIPE_AVAILABLE:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            results = detectors.mp_face_detector.process(rgb_frame)
+            
+            if results.detections:
+                h, w, _ = frame.shape
+                for detection in results.detections:
+                    bboxC = detection.location_data.relative_bounding_box
+                    x = int(bboxC.xmin * w)
+                    y = int(bboxC.ymin * h)
+                    width = int(bboxC.width * w)
+                    height = int(bboxC.height * h)
+                    faces.append((x, y, width, height))
+        else:
+            faces = detectors.face_cascade.detectMultiScale(gray, 1.3, 5)
+            faces = [(x, y, w, h) for (x, y, w, h) in faces]
+        
+        return faces
+            
+    def recognize_faces(self, frame, gray=None, timings=None, wait=False):
+        # One (box, name, confidence) per detected face. name is None while
+        # there is no model to ask and "Unknown" for faces not in the
+        # gallery; confidence is the recognizer's distance (lower is closer).
+        # Pass a dict as `timings` to get detect_ms and recognize_ms, and
+        # wait=True to queue for the model instead of skipping prediction.
+        start = time.perf_counter()
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.detect_faces(frame, gray)
+        detected = time.perf_counter()
+        
+        predictions = self.predict_regions(self.face_regions(gray, faces), wait)
+        
+        if timings is not None:
+            timings['detect_ms'] = (detected - start) * 1000.0
+            timings['recognize_ms'] = (time.perf_counter() - detected) * 1000.0
+        return self.label_predictions(faces, predictions)
+        
+    def recognize_batch(self, frames, wait=False):
+        # recognize_faces for several frames, with one model call for the
+        # faces of all of them.
+        grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+        faces = [self.detect_faces(frame, gray) for frame, gray in zip(frames, grays)]
+        regions = [region for gray, boxes in zip(grays, faces) for region in self.face_regions(gray, boxes)]
+        predictions = self.predict_regions(regions, wait)
+        
+        results = []
+        offset = 0
+        for boxes in faces:
+            results.append(self.label_predictions(boxes, predictions[offset:offset + len(boxes)]))
+            offset += len(boxes)
+        return results
+        
+    def face_regions(self, gray, faces):
+        crop_size = self.gallery_settings['crop_size']
+        return [cv2.resize(gray[y:y+h, x:x+w], (crop_size, crop_size)) for (x, y, w, h) in faces]
+        
+    def predict_regions(self, face_regions, wait=False):
+        # Take one reference to the live model per call; a finished training
+        # run may swap self.face_recognizer at any time.
+        recognizer = self.face_recognizer
+        
+        predictions = [None] * len(face_regions)
+        # One caller uses the model at a time; unless told to wait, skip
+        # prediction while another thread (or a snapshot) has it.
+        if recognizer is not None and len(face_regions) > 0 and self.recognizer_lock.acquire(blocking=wait):
+            try:
+                predictions = predict_faces(recognizer, face_regions)
+            finally:
+                self.recognizer_lock.release()
+        return predictions
+        
+    def label_predictions(self, faces, predictions):
+        results = []
+        for box, prediction in zip(faces, predictions):
+            if prediction is None:
+                results.append((tuple(box), None, None))
+                continue
+                
+            label, confidence = prediction
+            # Samples of deleted people stay in the model until the next
+            # compaction; never report them.
+            if confidence < 100 and label not in self.deleted_ids and label in self.id_to_name:
+                results.append((tuple(box), self.id_to_name[label], confidence))
+            else:
+                results.append((tuple(box), "Unknown", confidence))
+        return results
+        
+    def train_recognizer(self, on_done=None, wait=False):
+        with self.training_lock:
+            self.training_generation += 1
+            generation = self.training_generation
+            
+        if len(self.gallery) == 0:
+            self.face_recognizer = None
+            return
+            
+        face_data = self.gallery.faces
+        face_labels = self.gallery.labels
+        state = self.gallery_state()
+        deleted = bool(self.deleted_ids)
+        backend = self.recognizer_backend
+        settings = dict(self.gallery_settings)
+        
+        def worker():
+            try:
+                check_trainable(backend, face_labels)
+                recognizer = create_recognizer(backend, settings)
+                features = self.cached_features(
+                    feature_key(backend, settings), face_labels, state,
+                    lambda faces: recognizer.extract_features_parallel(resize_samples(faces, settings['crop_size']))
+                )
+                if features is not None:
+                    recognizer.train_features(features, face_labels)
+                else:
+                    recognizer.train(face_data, face_labels)
+            except Exception as e:
+                print(f"Failed to train recognizer: {str(e)}")
+                message = f"Training failed: {str(e)}"
+                self.frontend.dispatch(lambda: self.frontend.training_failed(message))
+                return
+                
+            with self.training_lock:
+                # A newer training run has started since this one; its model
+                # reflects the latest gallery, so drop this result.
+                if generation != self.training_generation:
+                    return
+                self.face_recognizer = recognizer
+                
+            self.save_model(recognizer, self.trained_model_token(backend, settings, state, deleted), backend, generation)
+                
+            if on_done:
+                self.frontend.dispatch(on_done)
+                
+        self.training_thread = threading.Thread(target=worker, daemon=True)
+        self.training_thread.start()
+        
+        if wait:
+            self.training_thread.join()
+            
+    def update_recognizer(self, face_data, face_labels, features=None, on_done=None):
+        # Adds only the new samples, on a copy of the live model that replaces
+        # it when done, so predictions keep running meanwhile. Falls back to a
+        # full retrain when there is no model yet, a training run is in flight
+        # or the backend cannot be updated incrementally.
+        backend = self.recognizer_backend
+        recognizer = self.face_recognizer
+        training = self.training_thread is not None and self.training_thread.is_alive()
+        if recognizer is None or training or not RECOGNIZER_BACKENDS[backend]['incremental']:
+            self.train_recognizer(on_done=on_done)
+            return
+            
+        with self.training_lock:
+            self.training_generation += 1
+            generation = self.training_generation
+            
+        state = self.gallery_state()
+        deleted = bool(self.deleted_ids)
+        settings = dict(self.gallery_settings)
+        
+        def worker():
+            try:
+                delta = features
+                if delta is None and RECOGNIZER_BACKENDS[backend]['features']:
+                    delta = recognizer.extract_features_parallel(face_data)
+                    
+                if delta is not None:
+                    updated = create_recognizer(backend, settings)
+                    updated.train_features(
+                        np.concatenate([recognizer.histograms, delta]),
+                        np.concatenate([recognizer.labels, np.asarray(face_labels, dtype=np.int32).ravel()])
+                    )
+                else:
+                    with self.recognizer_lock:
+                        updated = copy_recognizer(backend, settings, recognizer)
+                    updated.update(face_data, face_labels)
+            except Exception as e:
+                print(f"Failed to update recognizer: {str(e)}")
+                message = f"Training failed: {str(e)}"
+                self.frontend.dispatch(lambda: self.frontend.training_failed(message))
+                return
+                
+            with self.training_lock:
+                if generation != self.training_generation:
+                    return
+                self.face_recognizer = updated
+                
+            self.save_model(updated, self.trained_model_token(backend, settings, state, deleted), backend, generation)
+            
+            if on_done:
+                self.frontend.dispatch(on_done)
+                
+        self.training_thread = threading.Thread(target=worker, daemon=True)
+        self.training_thread.start()
+        
+    def cached_features(self, key, face_labels, state, extract=None):
+        # Runs off the UI thread. Features come from the store only when it
+        # holds the gallery as it was at `state`; missing ones are computed
+        # with `extract` if given. Store crops may be at another size, so
+        # `extract` resizes them like the in-memory gallery does.
+        if key is None:
+            return None
+            
+        try:
+            offset = self.store_offset(state)
+            if offset is None:
+                return None
+            store = self.gallery_store
+            if extract is not None and not store.ensure_features(key, extract):
+                return None
+                
+            cached = store.load_features(key)
+            if cached is None or self.store_changed(offset) or not np.array_equal(cached[1], face_labels):
+                return None
+            return cached[0]
+            
+        except Exception as e:
+            print(f"Feature cache unavailable: {str(e)}")
+            return None
+            
+    def model_path(self, backend):
+        return self.model_file + RECOGNIZER_BACKENDS[backend]['model_ext']
+        
+    def model_token(self, backend, settings, offset):
+        # What the hash file next to the saved model holds: the recognizer
+        # key, the store's state and the journal offset the store held the
+        # training gallery at, so a later start can tell whether the model
+        # is current without reading the gallery. With no offset the token
+        # matches nothing. Each token is unique, so followers see every save.
+        store = self.gallery_store.state_key() if offset is not None else None
+        return json.dumps({'key': model_key(backend, settings), 'store': store,
+                           'journal_offset': offset, 'model': uuid.uuid4().hex})
+                           
+    def trained_model_token(self, backend, settings, state, deleted):
+        # Runs off the UI thread. The in-memory gallery still holds deleted
+        # people's samples until compaction, so the store doesn't match it.
+        offset = None
+        if not deleted:
+            try:
+                offset = self.store_offset(state)
+            except Exception as e:
+                print(f"Could not key the saved model: {str(e)}")
+        return self.model_token(backend, settings, offset)
+        
+    def saved_model_current(self, backend, settings):
+        # Caller holds model_save_lock. True when the saved model was trained
+        # on what the store holds now.
+        try:
+            saved = json.loads(self.saved_model_hash() or 'null')
+        except ValueError:
+            # A content hash from an older version.
+            return False
+        if not isinstance(saved, dict) or saved.get('journal_offset') is None:
+            return False
+        return (saved['key'] == model_key(backend, settings) and
+                saved['store'] == self.gallery_store.state_key() and
+                not self.store_changed(saved['journal_offset']))
+                
+    def save_model(self, recognizer, token, backend, generation=None):
+        # The model is written to a private temp file first; the shared lock
+        # only covers swapping it and its hash in.
+        if generation is not None and generation != self.training_generation:
+            return
+        model_path = self.model_path(backend)
+        tmp_file = f"{self.model_file}.tmp{os.getpid()}_{threading.get_ident()}{RECOGNIZER_BACKENDS[backend]['model_ext']}"
+        try:
+            recognizer.write(tmp_file)
+            with self.model_save_lock:
+                # Skip the swap once a newer training run has started, so the
+                # model file and its hash always describe the same gallery.
+                if generation is not None and generation != self.training_generation:
+                    return
+                atomic_replace(tmp_file, model_path)
+                atomic_write(self.model_hash_file, lambda f: f.write(token.encode('utf-8')))
+                
+        except Exception as e:
+            print(f"Failed to save model: {str(e)}")
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            
+    def saved_model_hash(self):
+        try:
+            with open(self.model_hash_file, 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+            
+    def load_model(self):
+        backend = self.recognizer_backend
+        model_path = self.model_path(backend)
+        if not (os.path.exists(model_path) and os.path.exists(self.model_hash_file)):
+            return False
+            
+        try:
+            # Another instance may be replacing the model right now. The
+            # gallery was just read from the store, so the store's state
+            # says whether the model matches it.
+            with self.model_save_lock:
+                if not self.saved_model_current(backend, self.gallery_settings):
+                    return False
+                recognizer = create_recognizer(backend, self.gallery_settings)
+                recognizer.read(model_path)
+            self.face_recognizer = recognizer
+            return True
+            
+        except Exception as e:
+            print(f"Failed to load model: {str(e)}")
+            return False
+            
+    def register_person(self, name):
+        # Names are shared between instances, so a new name gets its ID under
+        # the journal lock after catching up with everyone else. Nothing holds
+        # that lock for longer than a journal append or a manifest commit,
+        # and a name that is already known never takes it.
+        self.poll_journal()
+        if name in self.name_to_id:
+            return self.name_to_id[name]
+        with self.journal.lock:
+            return self.reserve_person(name)
+            
+    def reserve_person(self, name):
+        # Caller holds journal.lock. Only names and IDs are caught up here:
+        # applying the rest may reload the gallery, which waits for our
+        # writer thread, which may be waiting for this lock.
+        self.catch_up_names()
+        if name in self.name_to_id:
+            return self.name_to_id[name]
+        person_id = self.allocate_person_id()
+        self.name_to_id[name] = person_id
+        self.id_to_name[person_id] = name
+        self.journal.append('person', id=person_id, name=name)
+        return person_id
+        
+    def catch_up_names(self):
+        # Applies other instances' name changes since the last poll without
+        # consuming them; the next poll_journal applies them in full.
+        entries, _ = self.journal.read(self.journal_offset)
+        for entry in entries:
+            if entry.get('instance') == self.journal.instance:
+                continue
+            apply_journal_names(entry, self.name_to_id, self.id_to_name)
+            self.next_person_id = max(self.next_person_id, journal_next_person_id(entry))
+                
+
+    def allocate_person_id(self):
+        # IDs are never reused, so a new person can't inherit a deleted
+        # person's samples or tombstone.
+        person_id = max([self.next_person_id] + [i + 1 for i in self.id_to_name])
+        self.next_person_id = person_id + 1
+        return person_id
+        
+    def enroll_batch(self, faces_by_name, on_done=None):
+        # Adds samples for several people with one store write and one
+        # training run. Returns {name: person_id}.
+        faces_by_name = {name: faces for name, faces in faces_by_name.items() if len(faces) > 0}
+        self.poll_journal()
+        person_ids = {name: self.name_to_id[name] for name in faces_by_name if name in self.name_to_id}
+        if len(person_ids) < len(faces_by_name):
+            with self.journal.lock:
+                person_ids = {name: self.reserve_person(name) for name in faces_by_name}
+        if not faces_by_name:
+            return person_ids
+            
+        faces = np.concatenate([np.asarray(f, dtype=np.uint8) for f in faces_by_name.values()])
+        labels = np.concatenate([np.full(len(f), person_ids[name], dtype=np.int32)
+                                 for name, f in faces_by_name.items()])
+        self.gallery.append(faces, labels)
+        
+        self.train_recognizer(on_done=on_done)
+        self.gallery_writer.append(faces, labels)
+        self.save_data()
+        return person_ids
+        
+    def enroll(self, name, faces, on_done=None, incremental=False):
+        # Adds face crops (already at the gallery crop size) for `name` and
+        # retrains, or with `incremental` only adds them to the live model
+        # where the backend allows it. Returns the person's ID.
+        person_id = self.register_person(name)
+        faces = np.asarray(faces, dtype=np.uint8)
+        self.gallery.append(faces, person_id)
+        
+        if incremental:
+            self.update_recognizer(faces, np.full(len(faces), person_id, dtype=np.int32), on_done=on_done)
+        else:
+            self.train_recognizer(on_done=on_done)
+        self.gallery_writer.append(faces, [person_id] * len(faces))
+        self.save_data()
+        return person_id
+        
+    def delete_person(self, name):
+        person_id = self.name_to_id[name]
+        
+        # Only a tombstone for now; the samples are dropped and the model
+        # retrained once for a whole batch of deletes.
+        self.deleted_ids.add(person_id)
+        del self.name_to_id[name]
+        del self.id_to_name[person_id]
+        
+        self.gallery_writer.delete_label(person_id)
+        self.save_data()
+        self.schedule_compaction()
+        return person_id
+        
+    def clear_gallery(self):
+        self.gallery.clear(self.gallery_settings['crop_size'])
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.deleted_ids.clear()
+        self.train_recognizer()
+        
+        self.gallery_writer.clear()
+        self.save_data()
+        
+    def schedule_compaction(self, delay=2000):
+        self.frontend.schedule_compaction(self.compact_gallery, delay)
+        
+    def compact_gallery(self):
+        if not self.deleted_ids:
+            return
+            
+        deleted = set(self.deleted_ids)
+        gallery = self.gallery
+        version = gallery.version
+        count = len(gallery)
+        face_data = gallery.faces
+        face_labels = gallery.labels
+        
+        def worker():
+            keep = ~np.isin(face_labels, list(deleted))
+            compacted = FaceGallery.from_arrays(face_data[keep], face_labels[keep], gallery.crop_size)
+            self.frontend.dispatch(lambda: finish(compacted))
+            
+        def finish(compacted):
+            # The gallery was replaced or purged meanwhile; that path already
+            # dealt with the tombstones.
+            if self.gallery is not gallery or gallery.version != version:
+                return
+            if len(gallery) > count:
+                compacted.append(gallery.faces[count:], gallery.labels[count:])
+            self.gallery = compacted
+            self.deleted_ids -= deleted
+            self.frontend.gallery_changed()
+            
+            if len(self.gallery) > 0:
+                self.train_recognizer(on_done=self.frontend.on_training_done)
+            else:
+                self.train_recognizer()
+                
+        self.compaction_thread = threading.Thread(target=worker, daemon=True)
+        self.compaction_thread.start()
+        
+    def purge_deleted(self):
+        # Synchronous compaction for operations that rewrite or export the
+        # whole gallery.
+        if self.deleted_ids:
+            self.gallery.delete_labels(list(self.deleted_ids))
+            self.deleted_ids.clear()
+            
+    def gallery_state(self):
+        # Identifies the in-memory gallery's contents: rows are only ever
+        # appended until `version` changes or the gallery is replaced.
+        return self.gallery, self.gallery.version, len(self.gallery)
+        
+    def store_offset(self, state):
+        # The journal offset at which the store held exactly the gallery as
+        # it was at `state`, or None if it may not have. Every store change
+        # is journaled together with the change, so nothing is read back.
+        if not self.gallery_writer.flush(timeout=10):
+            return None
+        gallery, version, count = state
+        with self.journal.lock:
+            if self.gallery_writer.has_work() or self.gallery_writer.busy:
+                return None
+            if self.gallery is not gallery or gallery.version != version or len(gallery) != count:
+                return None
+            # Our own entries are in memory already; anyone else's are not.
+            entries, offset = self.journal.read(self.journal_offset)
+            if any(entry['op'] in STORE_OPS and entry.get('instance') != self.journal.instance for entry in entries):
+                return None
+            return offset
+            
+    def store_changed(self, offset):
+        entries, _ = self.journal.read(offset)
+        return any(entry['op'] in STORE_OPS for entry in entries)
+        
+    def save_data(self):
+        data = {
+            'name_to_id': self.name_to_id,
+            'id_to_name': {str(k): v for k, v in self.id_to_name.items()},
+            'face_count': len(self.gallery),
+            'recognizer': self.recognizer_backend,
+            'settings': self.gallery_settings,
+            'next_person_id': self.next_person_id
+        }
+        
+        self.gallery_writer.save_metadata(self.data_file, data)
+            
+    def load_data(self):
+        try:
+            if os.path.exists(self.data_file):
+                with open(self.data_file, 'r') as f:
+                    data = json.load(f)
+                    
+                self.name_to_id = data.get('name_to_id', {})
+                self.id_to_name = {int(k): v for k, v in data.get('id_to_name', {}).items()}
+                
+                backend = data.get('recognizer', 'lbph')
+                if backend in RECOGNIZER_BACKENDS:
+                    self.recognizer_backend = backend
+                    
+                try:
+                    self.gallery_settings = validate_gallery_settings(data.get('settings'))
+                except ValueError as e:
+                    print(f"Ignoring invalid gallery settings: {str(e)}")
+                    
+                # The journal also has changes other instances made after
+                # the data file was last written.
+                self.replay_journal()
+                
+                # One-time migration of the old whole-gallery .npy files,
+                # or of the segmented store when switching to SQLite.
+                segmented = SegmentedGalleryStore("face_gallery")
+                if not self.gallery_store.exists():
+                    if not isinstance(self.gallery_store, SegmentedGalleryStore) and segmented.exists():
+                        self.gallery_store.rewrite(*segmented.load(mmap=False))
+                    elif os.path.exists(self.legacy_face_file) and os.path.exists(self.legacy_label_file):
+                        self.gallery_store.rewrite(np.load(self.legacy_face_file), np.load(self.legacy_label_file))
+                    
+                face_data_loaded, face_labels_loaded = self.gallery_store.load()
+                # Older data files have no allocator; start past every ID
+                # still referenced by a name or a sample.
+                self.next_person_id = max([data.get('next_person_id', 0), self.next_person_id] +
+                                          [i + 1 for i in self.id_to_name] +
+                                          [int(face_labels_loaded.max()) + 1 if len(face_labels_loaded) else 0])
+                if len(face_data_loaded) > 0:
+                    self.gallery = FaceGallery.from_arrays(
+                        resize_samples(face_data_loaded, self.gallery_settings['crop_size']),
+                        face_labels_loaded
+                    )
+                    
+                    # Retrain only when the gallery changed since the model
+                    # was last written.
+                    if not self.load_model():
+                        self.train_recognizer()
+                        
+        except Exception as e:
+            print(f"Failed to load data: {str(e)}")
+            self.gallery.clear(self.gallery_settings['crop_size'])
+            self.name_to_id = {}
+            self.id_to_name = {}
+            
+        self.gallery_writer.shared_metadata = self.shared_metadata()
+        
+    def shared_metadata(self):
+        return {'settings': dict(self.gallery_settings), 'recognizer': self.recognizer_backend}
+        
+    def replay_journal(self):
+        entries, self.journal_offset = self.journal.read(0)
+        for entry in entries:
+            apply_journal_names(entry, self.name_to_id, self.id_to_name)
+            self.next_person_id = max(self.next_person_id, journal_next_person_id(entry))
+            if entry['op'] in ('metadata', 'reset', 'checkpoint'):
+                self.apply_journal_metadata(entry)
+                
+    def apply_journal_metadata(self, entry):
+        # Returns True when the recognizer or its settings changed.
+        changed = False
+        backend = entry.get('recognizer')
+        if backend in RECOGNIZER_BACKENDS and backend != self.recognizer_backend:
+            self.recognizer_backend = backend
+            changed = True
+            
+        if entry.get('settings') is not None:
+            try:
+                settings = validate_gallery_settings(entry['settings'])
+            except ValueError as e:
+                print(f"Ignoring invalid gallery settings: {str(e)}")
+            else:
+                if settings != self.gallery_settings:
+                    self.gallery_settings = settings
+                    changed = True
+        return changed
+        
+    def poll_journal(self):
+        # Applies what other instances changed since the last poll. Returns
+        # True if anything was applied.
+        entries, self.journal_offset = self.journal.read(self.journal_offset)
+        entries = [entry for entry in entries if entry.get('instance') != self.journal.instance]
+        if not entries:
+            return False
+            
+        reload = retrain = deleted = False
+        faces, labels = [], []
+        for entry in entries:
+            op = entry['op']
+            apply_journal_names(entry, self.name_to_id, self.id_to_name)
+            self.next_person_id = max(self.next_person_id, journal_next_person_id(entry))
+            if op == 'checkpoint':
+                # Our own deletes may still be queued behind it.
+                for person_id in self.deleted_ids:
+                    apply_journal_names({'op': 'delete', 'id': person_id}, self.name_to_id, self.id_to_name)
+            if op == 'delete':
+                self.deleted_ids.add(int(entry['id']))
+                deleted = True
+            elif op == 'append' and entry.get('segment') and not reload:
+                try:
+                    batch_faces, batch_labels, _ = self.gallery_store.read_batch(entry['segment'])
+                except FileNotFoundError:
+                    # Already compacted into another segment.
+                    reload = True
+                    continue
+                faces.append(resize_samples(batch_faces, self.gallery_settings['crop_size']))
+                labels.append(np.asarray(batch_labels))
+            elif op in ('metadata', 'reset', 'checkpoint'):
+                crop_size = self.gallery_settings['crop_size']
+                if self.apply_journal_metadata(entry):
+                    retrain = True
+                # A checkpoint stands for store changes we never saw.
+                reload = reload or op != 'metadata' or self.gallery_settings['crop_size'] != crop_size
+                self.gallery_writer.shared_metadata = self.shared_metadata()
+                
+        if reload:
+            self.reload_gallery()
+        else:
+            if faces:
+                faces, labels = np.concatenate(faces), np.concatenate(labels)
+                self.gallery.append(faces, labels)
+            if retrain:
+                self.train_recognizer(on_done=self.frontend.on_training_done)
+            elif len(faces) > 0:
+                self.update_recognizer(faces, labels, on_done=self.frontend.on_training_done)
+            if deleted:
+                self.schedule_compaction()
+                
+        self.frontend.gallery_changed()
+        return True
+        
+    def reload_gallery(self):
+        # Another instance rewrote the gallery. The store is read back on a
+        # worker thread and the result swapped in through dispatch(); our
+        # own queued changes must reach the store before it is read.
+        self.reload_generation += 1
+        generation = self.reload_generation
+        state = self.gallery_state()
+        deleted = set(self.deleted_ids)
+        crop_size = self.gallery_settings['crop_size']
+        self.gallery_writer.shared_metadata = self.shared_metadata()
+        
+        def worker():
+            try:
+                self.gallery_writer.flush()
+                self.gallery_store.refresh()
+                face_data_loaded, face_labels_loaded = self.gallery_store.load()
+                loaded = FaceGallery.from_arrays(resize_samples(face_data_loaded, crop_size),
+                                                 face_labels_loaded, crop_size)
+            except Exception as e:
+                print(f"Failed to reload gallery: {str(e)}")
+                return
+            self.frontend.dispatch(lambda: finish(loaded))
+            
+        def finish(loaded):
+            if generation != self.reload_generation:
+                return
+            # Samples added here meanwhile may have missed the read; read
+            # again, now that they are queued before it.
+            if self.gallery_state() != state or self.gallery_settings['crop_size'] != crop_size:
+                self.reload_gallery()
+                return
+            self.gallery = loaded
+            # Deletes made meanwhile are not in what was read yet.
+            self.deleted_ids -= deleted
+            if self.deleted_ids:
+                self.schedule_compaction()
+            self.frontend.gallery_changed()
+            
+            if len(self.gallery) == 0:
+                self.train_recognizer()
+            elif not self.load_model():
+                self.train_recognizer(on_done=self.frontend.on_training_done)
+                
+        self.reload_thread = threading.Thread(target=worker, daemon=True)
+        self.reload_thread.start()
+            
+    def close(self, timeout=10):
+        # Returns False if queued gallery changes could not be written.
+        with self.detector_sets_lock:
+            for detectors in self.detector_sets:
+                detectors.close()
+        # Read-only engines (from_snapshot, follower) have nothing to write.
+        if not hasattr(self, 'gallery_writer'):
+            return True
+        return self.gallery_writer.close(timeout=timeout)
+        
+    def snapshot(self, model_path=None):
+        # Writes the live model to `model_path` and returns everything a
+        # read-only engine in another process needs to recognize with it.
+        # Without a path the snapshot only carries the detector setup.
+        recognizer = None
+        if model_path is not None:
+            if self.training_thread is not None:
+                self.training_thread.join()
+            recognizer = self.face_recognizer
+        if recognizer is not None:
+            with self.recognizer_lock:
+                recognizer.write(model_path)
+        return {
+            'detection_method': self.detection_method,
+            'backend': self.recognizer_backend,
+            'settings': dict(self.gallery_settings),
+            'id_to_name': dict(self.id_to_name),
+            'deleted_ids': sorted(self.deleted_ids),
+            'model': model_path if recognizer is not None else None,
+            'journal_offset': self.journal_offset
+        }
+        
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # A recognition-only engine for worker processes. It has no gallery,
+        # store, writer or journal, so it never trains or writes anything.
+        engine = cls.__new__(cls)
+        engine.frontend = EngineFrontend()
+        engine.setup_detectors()
+        engine.detection_method = snapshot['detection_method']
+        engine.recognizer_backend = snapshot['backend']
+        engine.gallery_settings = dict(snapshot['settings'])
+        engine.id_to_name = dict(snapshot['id_to_name'])
+        engine.deleted_ids = set(snapshot['deleted_ids'])
+        engine.recognizer_lock = threading.Lock()
+        engine.face_recognizer = None
+        if snapshot['model'] is not None:
+            engine.face_recognizer = create_recognizer(snapshot['backend'], snapshot['settings'])
+            engine.face_recognizer.read(snapshot['model'])
+        return engine
+        
+    @classmethod
+    def follower(cls, snapshot):
+        # A recognition-only engine like from_snapshot that keeps up with
+        # the gallery in the current directory: follow_saved_model() loads
+        # each model the writing instance saves. It only ever reads.
+        engine = cls.from_snapshot(snapshot)
+        engine.set_data_paths()
+        engine.journal = GalleryJournal("gallery_journal.log")
+        engine.journal_offset = snapshot['journal_offset']
+        engine.model_save_lock = engine.journal.lock
+        engine.saved_model = None
+        engine.follow_saved_model()
+        return engine
+        
+    def follow_saved_model(self):
+        # Applies recognizer and settings changes from the journal, then
+        # loads the saved model if it changed since the last call. Returns
+        # True if a new model was loaded.
+        entries, self.journal_offset = self.journal.read(self.journal_offset)
+        for entry in entries:
+            if entry['op'] in ('metadata', 'reset', 'checkpoint'):
+                self.apply_journal_metadata(entry)
+                
+        backend = self.recognizer_backend
+        model_path = self.model_path(backend)
+        # The writer replaces the model and its hash under this lock.
+        with self.model_save_lock:
+            saved = (backend, self.saved_model_hash())
+            if saved == self.saved_model or saved[1] is None or not os.path.exists(model_path):
+                return False
+            recognizer = create_recognizer(backend, self.gallery_settings)
+            recognizer.read(model_path)
+        self.saved_model = saved
+        self.face_recognizer = recognizer
+        return True
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def iter_frames(source):
+    # Yields (index, timestamp_ms, path, frame) from a camera index, a
+    # video file or a directory of images (in name order). Camera frames
+    # are mirrored like the GUI preview, which is what enrollment saw.
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(glob.escape(source), '*'))
+                       if p.lower().endswith(IMAGE_EXTENSIONS))
+        for index, path in enumerate(paths):
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"Warning: could not read {path}", file=sys.stderr)
+                continue
+            yield index, None, path, frame
+        return
+        
+    camera = source.isdigit()
+    if not camera and not os.path.exists(source):
+        raise FileNotFoundError(f"No such video file or directory: {source}")
+    cap = cv2.VideoCapture(int(source) if camera else source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {source}")
+    try:
+        index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if camera:
+                yield index, time.time() * 1000.0, None, cv2.flip(frame, 1)
+            else:
+                yield index, cap.get(cv2.CAP_PROP_POS_MSEC), None, frame
+            index += 1
+    finally:
+        cap.release()
+        
+        
+def frame_record(engine, index, timestamp, path, frame):
+    # One JSON-serialisable result line for a frame.
+    start = time.perf_counter()
+    timings = {}
+    faces = engine.recognize_faces(frame, timings=timings)
+    timings['total_ms'] = (time.perf_counter() - start) * 1000.0
+    
+    record = {'frame': index}
+    if timestamp is not None:
+        record['timestamp_ms'] = round(timestamp, 3)
+    if path is not None:
+        record['path'] = path
+    record['faces'] = [{
+        'box': [int(v) for v in box],
+        'name': name,
+        'confidence': None if confidence is None else round(float(confidence), 3)
+    } for box, name, confidence in faces]
+    record['timings'] = {k: round(v, 3) for k, v in timings.items()}
+    return record
+    
+    
+def run_headless(engine, source, output, max_frames=None):
+    # Streams one JSON line per frame to `output` (a text file object).
+    # Returns the number of frames processed.
+    if engine.training_thread is not None:
+        engine.training_thread.join()
+        
+    count = 0
+    for index, timestamp, path, frame in iter_frames(source):
+        if max_frames is not None and count >= max_frames:
+            break
+        output.write(json.dumps(frame_record(engine, index, timestamp, path, frame)) + "\n")
+        output.flush()
+        count += 1
+    return count
+    
+    
+def video_frame_count(path):
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No such video file: {path}")
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+        
+        
+def split_segments(frame_count, segment_frames):
+    return [(start, min(start + segment_frames, frame_count)) for start in range(0, frame_count, segment_frames)]
+    
+    
+# The read-only engine of a pool worker process, set by init_worker.
+worker_engine = None
+
+
+def init_worker(snapshot):
+    global worker_engine
+    # One OpenCV thread per worker; the pool already uses every core.
+    cv2.setNumThreads(1)
+    worker_engine = FaceEngine.from_snapshot(snapshot)
+    
+    
+def process_video_segment(path, start, end, engine=None):
+    # Result records for frames [start, end) of a video file.
+    engine = engine or worker_engine
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    records = []
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for index in range(start, end):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            records.append(frame_record(engine, index, cap.get(cv2.CAP_PROP_POS_MSEC), None, frame))
+    finally:
+        cap.release()
+    return records
+    
+    
+def process_video(engine, path, output, workers=None, segment_frames=500):
+    # Offline recognition over a whole video file. Segments of
+    # `segment_frames` frames run across a process pool, each worker with
+    # its own detectors and a read-only copy of the model, and their
+    # records are written in frame order. workers=0 processes the
+    # segments in this process. Returns the number of frames processed.
+    frame_count = video_frame_count(path)
+    if frame_count <= 0:
+        raise RuntimeError(f"Could not determine the length of {path}; use run --headless instead")
+    segments = split_segments(frame_count, segment_frames)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_ext = RECOGNIZER_BACKENDS[engine.recognizer_backend]['model_ext']
+        snapshot = engine.snapshot(os.path.join(tmp_dir, "model" + model_ext))
+        
+        count = 0
+        if workers == 0:
+            for start, end in segments:
+                for record in process_video_segment(path, start, end, engine):
+                    output.write(json.dumps(record) + "\n")
+                    count += 1
+            output.flush()
+            return count
+            
+        # Spawn rather than fork: this process has writer and training
+        # threads running.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=init_worker, initargs=(snapshot,)) as pool:
+            starts = [start for start, _ in segments]
+            ends = [end for _, end in segments]
+            for records in pool.map(process_video_segment, [path] * len(segments), starts, ends):
+                for record in records:
+                    output.write(json.dumps(record) + "\n")
+                count += len(records)
+                output.flush()
+        return count
+        
+        
+def list_enrollment_images(root):
+    # {name: [image paths]} for root/<name>/<image>, both in name order.
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"No such directory: {root}")
+    images = {}
+    for name in sorted(os.listdir(root)):
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory):
+            continue
+        paths = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                       if f.lower().endswith(IMAGE_EXTENSIONS))
+        if paths:
+            images[name] = paths
+    return images
+    
+    
+def extract_face_crop(path, engine=None):
+    # The largest face in an image file as a gallery crop, or None.
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    return largest_face_crop(engine or worker_engine, image)
+    
+    
+def largest_face_crop(engine, image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    faces = engine.detect_faces(image, gray)
+    if len(faces) == 0:
+        return None
+        
+    x, y, w, h = (int(v) for v in max(faces, key=lambda face: face[2] * face[3]))
+    region = gray[max(y, 0):y+h, max(x, 0):x+w]
+    if region.size == 0:
+        return None
+    crop_size = engine.gallery_settings['crop_size']
+    return cv2.resize(region, (crop_size, crop_size))
+    
+    
+def bulk_enroll(engine, root, workers=None, progress=None):
+    # Enrolls every root/<name>/<image> with detection spread over a
+    # process pool (workers=0 detects in this process), then one store
+    # write and one training run. Returns ({name: samples}, [paths in
+    # which no face was found]).
+    images = list_enrollment_images(root)
+    paths = [path for name_paths in images.values() for path in name_paths]
+    names = [name for name, name_paths in images.items() for _ in name_paths]
+    
+    faces_by_name = {}
+    skipped = []
+    
+    def collect(crops):
+        for done, (path, name, crop) in enumerate(zip(paths, names, crops), 1):
+            if crop is None:
+                skipped.append(path)
+            else:
+                faces_by_name.setdefault(name, []).append(crop)
+            if progress:
+                progress(done / len(paths))
+                
+    if workers == 0:
+        collect(extract_face_crop(path, engine) for path in paths)
+    elif paths:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=init_worker, initargs=(engine.snapshot(),)) as pool:
+            collect(pool.map(extract_face_crop, paths, chunksize=16))
+            
+    engine.enroll_batch(faces_by_name)
+    return {name: len(faces) for name, faces in faces_by_name.items()}, skipped
+    
+    
+def build_parser():
+    parser = argparse.ArgumentParser(description="Face Recognition System")
+    commands = parser.add_subparsers(dest='command')
+    
+    run = commands.add_parser('run', help="run recognition (GUI unless --headless)")
+    run.add_argument('--headless', action='store_true',
+                     help="no window; write per-frame results as JSON lines")
+    run.add_argument('--source', default='0',
+                     help="camera index, video file or image directory (default: camera 0); "
+                          "the GUI also takes several cameras or videos, comma-separated")
+    run.add_argument('--output', default='-', help="JSONL output file (default: stdout)")
+    run.add_argument('--detector', choices=['haar', 'dlib', 'face_recognition', 'mediapipe'],
+                     help="face detection method")
+    run.add_argument('--max-frames', type=int, help="stop after this many frames")
+    run.add_argument('--engine-process', action='store_true',
+                     help="GUI: run detection and recognition in a separate process")
+    run.add_argument('--preview-port', type=int,
+                     help="GUI: also serve the annotated video as MJPEG on this port")
+    run.add_argument('--preview-host', default='127.0.0.1',
+                     help="GUI: address for the MJPEG preview (default: 127.0.0.1)")
+    run.add_argument('--record', metavar='PATH', help="GUI: also write the annotated video to this file")
+    run.add_argument('--record-fps', type=float, default=20.0,
+                     help="frame rate of the recording (default: 20)")
+    run.add_argument('--record-drop', choices=['newest', 'oldest'], default='newest',
+                     help="frame to drop when the encoder falls behind (default: newest)")
+    
+    process = commands.add_parser('process', help="recognize faces in a recorded video using every core")
+    process.add_argument('--source', required=True, help="video file")
+    process.add_argument('--output', default='-', help="JSONL output file (default: stdout)")
+    process.add_argument('--workers', type=int, default=os.cpu_count(),
+                         help="worker processes (default: one per core, 0 to run in-process)")
+    process.add_argument('--segment-frames', type=int, default=500,
+                         help="frames per work unit (default: 500)")
+    process.add_argument('--detector', choices=['haar', 'dlib', 'face_recognition', 'mediapipe'],
+                         help="face detection method")
+    
+    enroll = commands.add_parser('enroll', help="enroll people from a folder of labeled images")
+    enroll.add_argument('--root', required=True, help="directory with one sub-directory of images per person")
+    enroll.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="worker processes for face detection (default: one per core, 0 to run in-process)")
+    enroll.add_argument('--detector', choices=['haar', 'dlib', 'face_recognition', 'mediapipe'],
+                        help="face detection method")
+    
+    serve = commands.add_parser('serve', help="serve detect/recognize/enroll over local HTTP")
+    serve.add_argument('--host', default='127.0.0.1', help="address to bind (default: localhost only)")
+    serve.add_argument('--port', type=int, default=8765, help="port (default: 8765)")
+    serve.add_argument('--max-batch', type=int, default=16, help="most requests handled together (default: 16)")
+    serve.add_argument('--batch-window-ms', type=float, default=5.0,
+                       help="how long to wait for more requests to batch (default: 5)")
+    serve.add_argument('--detector', choices=['haar', 'dlib', 'face_recognition', 'mediapipe'],
+                       help="face detection method")
+    return parser
+    
+    
+def needs_gui(args):
+    return args.command is None or (args.command == 'run' and not args.headless)
+    
+    
+def run_enroll_command(engine, args):
+    counts, skipped = bulk_enroll(engine, args.root, args.workers)
+    if engine.training_thread is not None:
+        engine.training_thread.join()
+    for path in skipped:
+        print(f"No face found in {path}", file=sys.stderr)
+    print(f"Enrolled {sum(counts.values())} samples for {len(counts)} people "
+          f"({len(skipped)} images without a face)")
+    
+    
+def run_command(args):
+    # Runs any command but the GUI. Returns the exit code.
+    if args.command == 'serve':
+        from face_service import serve
+        return serve(args)
+        
+    engine = FaceEngine()
+    if args.detector:
+        if args.detector not in engine.available_methods:
+            print(f"Error: detection method '{args.detector}' is not available", file=sys.stderr)
+            engine.close()
+            return 2
+        engine.detection_method = args.detector
+        
+    output = sys.stdout
+    try:
+        if getattr(args, 'output', '-') != '-':
+            output = open(args.output, 'w')
+        if args.command == 'enroll':
+            run_enroll_command(engine, args)
+        elif args.command == 'process':
+            process_video(engine, args.source, output, args.workers, args.segment_frames)
+        elif ',' in args.source:
+            print("Error: --headless takes a single source", file=sys.stderr)
+            return 2
+        else:
+            run_headless(engine, args.source, output, args.max_frames)
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError, cv2.error) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        engine.close()
+    return 0
+    
+    
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if needs_gui(args):
+        print("Error: 'run' needs --headless here; start face_recognition_opencv.py for the app",
+              file=sys.stderr)
+        return 2
+    return run_command(args)
+    
+    
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import cv2
+import numpy as np
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+
+from face_engine import FaceEngine, JOURNAL_POLL_MS
+
+
+MAX_FACES = 32
+# Header: latest sequence number, slot count, dtype, ndim, max shape (3).
+RING_HEADER_FIELDS = 8
+# Per slot: sequence number (-1 while being written), tag, ndim, shape (3).
+RING_SLOT_FIELDS = 6
+RING_DATA_ALIGN = 64
+
+
+# Latest-value ring of arrays in shared memory, for one writer process and
+# one reader process. The writer never waits: it overwrites the oldest
+# slot. The reader always gets the newest array, copied out, and notices
+# when the writer lapped it mid-copy by checking the slot's sequence
+# number before and after.
+class SharedRing:
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner
+        self.header = header = np.ndarray((RING_HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        self.slots = int(header[1])
+        self.dtype = np.dtype(chr(int(header[2])))
+        self.max_shape = tuple(int(d) for d in header[4:4 + int(header[3])])
+        self.capacity = int(np.prod(self.max_shape))
+        
+        self.slot_meta = np.ndarray((self.slots, RING_SLOT_FIELDS), dtype=np.int64, buffer=memory.buf,
+                                    offset=header.nbytes)
+        data_offset = -(-(header.nbytes + self.slot_meta.nbytes) // RING_DATA_ALIGN) * RING_DATA_ALIGN
+        self.data = np.ndarray((self.slots, self.capacity), dtype=self.dtype, buffer=memory.buf,
+                               offset=data_offset)
+                               
+    @classmethod
+    def create(cls, max_shape, dtype=np.uint8, slots=4):
+        if not 1 <= len(max_shape) <= 3:
+            raise ValueError("Arrays must have one to three dimensions")
+        dtype = np.dtype(dtype)
+        meta_bytes = (RING_HEADER_FIELDS + slots * RING_SLOT_FIELDS) * 8
+        data_offset = -(-meta_bytes // RING_DATA_ALIGN) * RING_DATA_ALIGN
+        size = data_offset + slots * int(np.prod(max_shape)) * dtype.itemsize
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        
+        header = np.ndarray((RING_HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        header[:] = 0
+        header[1] = slots
+        header[2] = ord(dtype.char)
+        header[3] = len(max_shape)
+        header[4:4 + len(max_shape)] = max_shape
+        del header
+        return cls(memory, owner=True)
+        
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+        
+    @property
+    def name(self):
+        return self.memory.name
+        
+    def write(self, array, tag=0):
+        # Returns the array's sequence number (1, 2, ...).
+        array = np.asarray(array, dtype=self.dtype)
+        if array.ndim > 3 or array.size > self.capacity:
+            raise ValueError(f"Array of shape {array.shape} does not fit in a ring of {self.max_shape}")
+        seq = int(self.header[0]) + 1
+        meta = self.slot_meta[seq % self.slots]
+        
+        meta[0] = -1
+        self.data[seq % self.slots, :array.size] = array.ravel()
+        meta[1] = tag
+        meta[2] = array.ndim
+        meta[3:3 + array.ndim] = array.shape
+        meta[0] = seq
+        self.header[0] = seq
+        return seq
+        
+    def read(self, after=0):
+        # The newest (seq, tag, array) written after sequence number
+        # `after`, or None if there is nothing newer.
+        for _ in range(self.slots):
+            seq = int(self.header[0])
+            if seq <= after:
+                return None
+            meta = self.slot_meta[seq % self.slots]
+            if int(meta[0]) != seq:
+                continue
+            tag = int(meta[1])
+            shape = tuple(int(d) for d in meta[3:3 + int(meta[2])])
+            array = self.data[seq % self.slots, :int(np.prod(shape))].reshape(shape).copy()
+            if int(meta[0]) == seq:
+                return seq, tag, array
+        return None
+        
+    def close(self):
+        # Views into the buffer must go before the mapping can be closed.
+        del self.header, self.slot_meta, self.data
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def encode_predictions(faces, predictions):
+    # One row per face: x, y, w, h, label (-1 if not predicted), confidence.
+    rows = np.full((len(faces), 6), np.nan)
+    for row, box, prediction in zip(rows, faces, predictions):
+        row[:4] = box
+        row[4], row[5] = prediction if prediction is not None else (-1, np.nan)
+    return rows
+
+
+def decode_predictions(rows):
+    faces = [tuple(int(v) for v in row[:4]) for row in rows]
+    predictions = [None if row[4] < 0 else (int(row[4]), float(row[5])) for row in rows]
+    return faces, predictions
+
+
+def run_engine_process(frames_name, results_name, frame_ready, connection, snapshot=None, engine=None):
+    # Engine side: detect and predict on the newest frame in `frames_name`,
+    # publish the rows to `results_name` tagged with the frame's sequence
+    # number. The engine is a read-only follower of the parent's gallery
+    # (FaceEngine.follower): it loads each model the parent saves and never
+    # writes to the store. Settings arrive through `connection`; None there
+    # (or EOF) stops the loop.
+    owns_engine = engine is None
+    if owns_engine:
+        engine = FaceEngine.follower(snapshot)
+    frames = SharedRing.attach(frames_name)
+    results = SharedRing.attach(results_name)
+    max_faces = results.max_shape[0]
+    
+    last_seq = 0
+    last_error = None
+    next_poll = time.monotonic() + JOURNAL_POLL_MS / 1000.0
+    try:
+        while True:
+            try:
+                if connection.poll():
+                    message = connection.recv()
+                    if message is None:
+                        break
+                    if message[0] == 'detector' and message[1] in engine.available_methods:
+                        engine.detection_method = message[1]
+            except EOFError:
+                break
+                
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + JOURNAL_POLL_MS / 1000.0
+                try:
+                    engine.follow_saved_model()
+                except Exception as e:
+                    print(f"Failed to load the saved model: {str(e)}", file=sys.stderr)
+                    
+            if not frame_ready.wait(0.1):
+                continue
+            frame_ready.clear()
+            item = frames.read(last_seq)
+            if item is None:
+                continue
+            last_seq, _, frame = item
+            
+            try:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                faces = engine.detect_faces(frame, gray)[:max_faces]
+                predictions = engine.predict_regions(engine.face_regions(gray, faces))
+            except Exception as e:
+                if str(e) != last_error:
+                    print(f"Recognition failed: {str(e)}", file=sys.stderr)
+                last_error = str(e)
+                faces, predictions = [], []
+            results.write(encode_predictions(faces, predictions), tag=last_seq)
+    finally:
+        frames.close()
+        results.close()
+        if owns_engine:
+            engine.close()
+
+
+# GUI side of an engine running in its own process. Frames go in through
+# one shared-memory ring and detections come back through another, so
+# neither process ever waits for the other.
+class EngineProcess:
+    def __init__(self, frame_shape, snapshot, slots=4, max_faces=MAX_FACES):
+        context = multiprocessing.get_context('spawn')
+        self.frame_shape = tuple(frame_shape)
+        self.frames = SharedRing.create(self.frame_shape, np.uint8, slots)
+        self.results = SharedRing.create((max_faces, 6), np.float64, slots)
+        self.frame_ready = context.Event()
+        self.connection, child_connection = context.Pipe()
+        self.last_result = 0
+        self.process = context.Process(
+            target=run_engine_process,
+            args=(self.frames.name, self.results.name, self.frame_ready, child_connection, snapshot),
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        
+    def submit(self, frame):
+        seq = self.frames.write(frame)
+        self.frame_ready.set()
+        return seq
+        
+    def latest(self):
+        # (frame seq, faces, predictions) for the newest frame the engine
+        # finished since the last call, or None.
+        item = self.results.read(self.last_result)
+        if item is None:
+            return None
+        self.last_result, frame_seq, rows = item
+        return (frame_seq,) + decode_predictions(rows)
+        
+    def set_detection_method(self, method):
+        self.connection.send(('detector', method))
+        
+    def close(self, timeout=5):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+        self.frames.close()
+        self.results.close()
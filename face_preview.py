@@ -0,0 +1,156 @@
+import cv2
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+BOUNDARY = b"frame"
+PREVIEW_PAGE = b"""<!DOCTYPE html>
+<html><head><title>Face Recognition Preview</title></head>
+<body style="margin:0;background:#000"><img src="/stream" style="width:100%;height:100vh;object-fit:contain"></body>
+</html>
+"""
+
+
+# Holds the newest published frame as JPEG. Each frame is encoded once, on
+# the publishing thread, no matter how many viewers there are, and not at
+# all while nobody is watching. Viewers wait for a newer frame than the one
+# they last sent; a viewer still busy sending simply misses the frames
+# published meanwhile instead of queueing them.
+class FrameBroadcaster:
+    def __init__(self, quality=80):
+        self.quality = quality
+        self.condition = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.viewers = 0
+        self.encoded = 0
+        self.closed = False
+        
+    def publish(self, frame):
+        # Returns True if the frame was encoded.
+        if self.viewers == 0 or self.closed:
+            return False
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return False
+        with self.condition:
+            self.jpeg = buffer.tobytes()
+            self.seq += 1
+            self.encoded += 1
+            self.condition.notify_all()
+        return True
+        
+    def wait(self, after=0, timeout=None):
+        # (seq, jpeg) of the newest frame after `after`, or None on timeout
+        # or once closed.
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > after or self.closed, timeout)
+            if self.closed or self.seq <= after:
+                return None
+            return self.seq, self.jpeg
+            
+    def add_viewer(self):
+        with self.condition:
+            self.viewers += 1
+            
+    def remove_viewer(self):
+        with self.condition:
+            self.viewers -= 1
+            
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    server_version = "FaceRecognitionPreview/1.0"
+    
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/':
+            self.send_body(200, 'text/html; charset=utf-8', PREVIEW_PAGE)
+        elif path == '/stream':
+            self.stream()
+        elif path == '/snapshot.jpg':
+            self.snapshot()
+        else:
+            self.send_body(404, 'text/plain', b"Not found")
+            
+    def stream(self):
+        broadcaster = self.server.broadcaster
+        self.send_response(200)
+        self.send_header('Content-Type', f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        
+        broadcaster.add_viewer()
+        try:
+            seq = 0
+            while True:
+                item = broadcaster.wait(seq, timeout=self.server.idle_timeout)
+                if item is None:
+                    if broadcaster.closed:
+                        return
+                    continue
+                seq, jpeg = item
+                self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                                 + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            broadcaster.remove_viewer()
+            
+    def snapshot(self):
+        broadcaster = self.server.broadcaster
+        # Count as a viewer until a frame arrives so one gets encoded.
+        broadcaster.add_viewer()
+        try:
+            item = broadcaster.wait(0, timeout=self.server.idle_timeout)
+        finally:
+            broadcaster.remove_viewer()
+        if item is None:
+            return self.send_body(503, 'text/plain', b"No frame available")
+        self.send_body(200, 'image/jpeg', item[1])
+        
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def log_message(self, format, *args):
+        pass
+
+
+# MJPEG preview of whatever frames are passed to publish(), bound to
+# localhost unless told otherwise.
+class PreviewServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self, host='127.0.0.1', port=8080, quality=80, idle_timeout=5.0):
+        super().__init__((host, port), PreviewHandler)
+        self.broadcaster = FrameBroadcaster(quality)
+        self.idle_timeout = idle_timeout
+        self.thread = None
+        
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+        
+    def publish(self, frame):
+        return self.broadcaster.publish(frame)
+        
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+        
+    def close(self):
+        self.broadcaster.close()
+        self.shutdown()
+        self.server_close()
@@ -1,38 +1,28 @@
 import cv2
-import numpy as np
 import customtkinter as ctk
 from tkinter import messagebox, filedialog
 import json
 import os
+import sys
 from PIL import Image, ImageTk
 import threading
 import time
 
-try:
-    import dlib
-    DLIB_AVAILABLE = True
-except ImportError:
-    DLIB_AVAILABLE = False
-    print("Warning: dlib not installed. Haar and dlib detection methods will not be available.")
-
-try:
-    import face_recognition
-    FACE_RECOGNITION_AVAILABLE = True
-except ImportError:
-    FACE_RECOGNITION_AVAILABLE = False
-    print("Warning: face_recognition not installed. face_recognition detection method will not be available.")
-
-try:
-    import mediapipe as mp
-    _ = mp.solutions
-    MEDIAPIPE_AVAILABLE = True
-except (ImportError, AttributeError):
-    MEDIAPIPE_AVAILABLE = False
-    print("Warning: mediapipe not fully installed. MediaPipe detection method will not be available.")
+from face_engine import (
+    GALLERY_SETTING_LIMITS, validate_gallery_settings, resize_samples, model_key, compute_gallery_hash,
+    RECOGNIZER_BACKENDS, feature_key, benchmark_recognizers, benchmark_configurations, describe_settings,
+    format_benchmark_report, FaceGallery, FaceEngine, JOURNAL_POLL_MS, apply_journal_names, journal_next_person_id,
+    atomic_replace, atomic_write, BundleCancelled, write_bundle, read_bundle_metadata, merge_name_maps,
+    import_bundle, build_parser, needs_gui, run_command
+)
+from face_ipc import EngineProcess
+from face_cameras import MultiCamera, compose_grid, stream_name
+from face_preview import PreviewServer
+from face_recorder import VideoRecorder
 
 
 class FaceRecognitionApp:
-    def __init__(self, root):
+    def __init__(self, root, engine_process=False, sources=None, preview=None, recorder=None):
         self.root = root
         self.root.title("Face Recognition System")
         self.root.geometry("1000x750")
@@ -41,54 +31,33 @@ class FaceRecognitionApp:
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("green")
         
-        self.available_methods = ['haar']
-        
-        if DLIB_AVAILABLE:
-            self.available_methods.append('dlib')
-        
-        if FACE_RECOGNITION_AVAILABLE:
-            self.available_methods.append('face_recognition')
-            
-        if MEDIAPIPE_AVAILABLE:
-            self.available_methods.append('mediapipe')
-        
-        if FACE_RECOGNITION_AVAILABLE:
-            self.detection_method = 'face_recognition'
-        else:
-            self.detection_method = 'haar'
-        
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        if DLIB_AVAILABLE:
-            self.dlib_detector = dlib.get_frontal_face_detector()
-        else:
-            self.dlib_detector = None
-        
-        if MEDIAPIPE_AVAILABLE:
-            self.mp_face_detection = mp.solutions.face_detection
-            self.mp_face_detector = self.mp_face_detection.FaceDetection(
-                model_selection=0,
-                min_detection_confidence=0.5
-            )
-        else:
-            self.mp_face_detector = None
-        
-        self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
-        
-        self.face_data = []
-        self.face_labels = []
-        self.name_to_id = {}
-        self.id_to_name = {}
-        self.data_file = "face_data_opencv.json"
+        # The GUI drives the engine and receives its hook calls (dispatch,
+        # gallery_changed, ...; see EngineFrontend).
+        self.engine = FaceEngine(frontend=self)
+        self.compaction_job = None
         
+        # Camera indexes or video files; with more than one they run through
+        # a MultiCamera instead of self.cap.
+        self.sources = sources or ['0']
         self.cap = None
+        self.cameras = None
         self.is_camera_on = False
         self.recognition_active = False
         self.capture_in_progress = False
         
-        self.load_data()
+        # With engine_process, detection and recognition run in a separate
+        # process started on the first recognized frame.
+        self.use_engine_process = engine_process
+        self.engine_process = None
+        self.remote_results = ([], [])
+        # A running PreviewServer and a VideoRecorder that get every frame
+        # shown, or None.
+        self.preview = preview
+        self.recorder = recorder
+        
         self.setup_gui()
         self.bind_shortcuts()
+        self.root.after(JOURNAL_POLL_MS, self.poll_journal_loop)
         
     def bind_shortcuts(self):
         self.root.bind('<space>', lambda e: self.toggle_camera())
@@ -165,7 +134,7 @@ class FaceRecognitionApp:
     def show_info(self):
         info_dialog = ctk.CTkToplevel(self.root)
         info_dialog.title("Information")
-        info_dialog.geometry("450x400")
+        info_dialog.geometry("450x520")
         info_dialog.transient(self.root)
         info_dialog.grab_set()
         
@@ -184,6 +153,13 @@ Detection Methods:
 • face_recognition - dlib with better defaults
 • mediapipe    - Fast MediaPipe detector
 
+Recognition Models:
+
+• lbph         - OpenCV LBPH histograms
+• lbph_numpy   - Batched NumPy LBPH
+• eigen        - Eigenfaces, fast on large galleries
+• fisher       - Fisherfaces, needs 2+ people
+
 Tips:
 • Ensure good lighting for better detection
 • Look directly at the camera when capturing
@@ -228,6 +204,18 @@ Tips:
         )
         self.camera_status_indicator.pack(side="right")
         
+        self.view_var = ctk.StringVar(value="Grid")
+        if len(self.sources) > 1:
+            ctk.CTkOptionMenu(
+                camera_header,
+                values=["Grid"] + [stream_name(source) for source in self.sources],
+                variable=self.view_var,
+                width=140,
+                height=28,
+                font=("Segoe UI", 11),
+                dropdown_font=("Segoe UI", 11)
+            ).pack(side="right", padx=(0, 10))
+            
         camera_frame = ctk.CTkFrame(camera_container, fg_color="#000000", corner_radius=10)
         camera_frame.pack(fill="both", expand=True, padx=15, pady=(0, 15))
         
@@ -334,10 +322,10 @@ Tips:
             font=("Segoe UI", 12)
         ).grid(row=0, column=0, padx=(0, 10), pady=10, sticky="w")
         
-        self.method_var = ctk.StringVar(value=self.detection_method)
+        self.method_var = ctk.StringVar(value=self.engine.detection_method)
         self.method_selector = ctk.CTkOptionMenu(
             detection_frame,
-            values=self.available_methods,
+            values=self.engine.available_methods,
             variable=self.method_var,
             command=self.change_detection_method,
             width=200,
@@ -356,14 +344,69 @@ Tips:
         
         self.method_info_label = ctk.CTkLabel(
             detection_frame,
-            text=method_info.get(self.detection_method, ''),
+            text=method_info.get(self.engine.detection_method, ''),
             font=("Segoe UI", 10),
             text_color="#636e72"
         )
         self.method_info_label.grid(row=0, column=2, pady=10, sticky="w")
         
+        ctk.CTkButton(
+            detection_frame,
+            text="⚙ Settings",
+            command=self.show_settings_dialog,
+            width=130,
+            height=35,
+            font=("Segoe UI", 12, "bold"),
+            text_color="white",
+            fg_color=("#636e72", "#74788d"),
+            hover_color=("#535b66", "#636e72"),
+            corner_radius=8
+        ).grid(row=0, column=3, padx=(15, 0), pady=10, sticky="e")
+        
+        ctk.CTkLabel(
+            detection_frame,
+            text="Recognition Model:",
+            font=("Segoe UI", 12)
+        ).grid(row=1, column=0, padx=(0, 10), pady=10, sticky="w")
+        
+        self.backend_var = ctk.StringVar(value=self.engine.recognizer_backend)
+        self.backend_selector = ctk.CTkOptionMenu(
+            detection_frame,
+            values=list(RECOGNIZER_BACKENDS),
+            variable=self.backend_var,
+            command=self.change_recognizer_backend,
+            width=200,
+            height=35,
+            font=("Segoe UI", 11),
+            dropdown_font=("Segoe UI", 11)
+        )
+        self.backend_selector.grid(row=1, column=1, padx=(0, 15), pady=10, sticky="w")
+        
+        self.backend_info_label = ctk.CTkLabel(
+            detection_frame,
+            text=RECOGNIZER_BACKENDS[self.engine.recognizer_backend]['info'],
+            font=("Segoe UI", 10),
+            text_color="#636e72"
+        )
+        self.backend_info_label.grid(row=1, column=2, pady=10, sticky="w")
+        
+        self.benchmark_btn = ctk.CTkButton(
+            detection_frame,
+            text="📊 Benchmark",
+            command=self.run_benchmark,
+            width=130,
+            height=35,
+            font=("Segoe UI", 12, "bold"),
+            text_color=("#ffffff", "#000000"),
+            fg_color=("#6c5ce7", "#a29bfe"),
+            hover_color=("#5b4cc4", "#6c5ce7"),
+            corner_radius=8
+        )
+        self.benchmark_btn.grid(row=1, column=3, padx=(15, 0), pady=10, sticky="e")
+        detection_frame.grid_columnconfigure(2, weight=1)
+        
     def change_detection_method(self, method):
-        self.detection_method = method
+        self.engine.detection_method = method
         method_info = {
             'haar': 'Basic OpenCV Haar Cascades',
             'dlib': 'HOG-based dlib detector',
@@ -372,6 +415,202 @@ Tips:
         }
         self.method_info_label.configure(text=method_info.get(method, ''))
         self.status_var.set(f"Detection method: {method}")
+        if self.engine_process is not None:
+            self.engine_process.set_detection_method(method)
+        
+    def change_recognizer_backend(self, backend):
+        if backend == self.engine.recognizer_backend:
+            return
+            
+        self.engine.recognizer_backend = backend
+        self.backend_info_label.configure(text=RECOGNIZER_BACKENDS[backend]['info'])
+        self.save_data()
+        
+        if len(self.engine.gallery) > 0:
+            self.update_status(f"Recognition model: {backend} - training...", True)
+            self.engine.train_recognizer(on_done=self.on_training_done)
+        else:
+            self.update_status(f"Recognition model: {backend}", True)
+            
+    def run_benchmark(self):
+        if len(self.engine.gallery) == 0:
+            messagebox.showwarning("Warning", "No faces registered yet. Please add faces first.")
+            return
+            
+        self.benchmark_btn.configure(state="disabled", text="⏳ Running...")
+        self.update_status("Benchmarking recognition models on the current gallery...", True)
+        face_data = self.engine.gallery.faces
+        face_labels = self.engine.gallery.labels
+        
+        settings = dict(self.engine.gallery_settings)
+        backend = self.engine.recognizer_backend
+        
+        def worker():
+            report = "\n\n".join([
+                format_benchmark_report(benchmark_recognizers(face_data, face_labels, settings=settings)),
+                f"Crop size / LBPH grid trade-offs ({backend}):",
+                format_benchmark_report(benchmark_configurations(face_data, face_labels, backend))
+            ])
+            self.root.after(0, lambda: self.show_benchmark_report(report))
+            
+        threading.Thread(target=worker, daemon=True).start()
+        
+    def show_settings_dialog(self):
+        dialog = ctk.CTkToplevel(self.root)
+        dialog.title("Gallery Settings")
+        dialog.geometry("400x380")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        dialog.resizable(False, False)
+        
+        ctk.CTkLabel(
+            dialog,
+            text="⚙ Gallery Settings",
+            font=("Segoe UI", 16, "bold")
+        ).pack(anchor="w", padx=20, pady=(20, 5))
+        
+        ctk.CTkLabel(
+            dialog,
+            text="Smaller crops and coarser grids are faster but less accurate.",
+            font=("Segoe UI", 11),
+            text_color="#b2bec3"
+        ).pack(anchor="w", padx=20, pady=(0, 10))
+        
+        fields_frame = ctk.CTkFrame(dialog, fg_color="transparent")
+        fields_frame.pack(fill="x", padx=20)
+        
+        labels = {
+            'crop_size': "Face crop size (px):",
+            'lbph_radius': "LBPH radius:",
+            'lbph_neighbors': "LBPH neighbors:",
+            'lbph_grid_x': "LBPH grid X:",
+            'lbph_grid_y': "LBPH grid Y:"
+        }
+        setting_vars = {}
+        for row, (key, text) in enumerate(labels.items()):
+            low, high = GALLERY_SETTING_LIMITS[key]
+            ctk.CTkLabel(
+                fields_frame,
+                text=text,
+                font=("Segoe UI", 12)
+            ).grid(row=row, column=0, padx=(0, 10), pady=4, sticky="w")
+            
+            setting_vars[key] = ctk.StringVar(value=str(self.engine.gallery_settings[key]))
+            ctk.CTkEntry(
+                fields_frame,
+                textvariable=setting_vars[key],
+                width=80,
+                height=30,
+                font=("Segoe UI", 12)
+            ).grid(row=row, column=1, pady=4, sticky="w")
+            
+            ctk.CTkLabel(
+                fields_frame,
+                text=f"{low}-{high}",
+                font=("Segoe UI", 10),
+                text_color="#636e72"
+            ).grid(row=row, column=2, padx=(10, 0), pady=4, sticky="w")
+            
+        def apply():
+            try:
+                settings = validate_gallery_settings({key: var.get() for key, var in setting_vars.items()})
+            except ValueError as e:
+                messagebox.showwarning("Warning", f"Invalid settings: {str(e)}")
+                return
+            if not self.confirm_gallery_settings(settings):
+                return
+                
+            dialog.destroy()
+            self.apply_gallery_settings(settings)
+            
+        button_frame = ctk.CTkFrame(dialog, fg_color="transparent")
+        button_frame.pack(pady=(15, 20))
+        
+        ctk.CTkButton(
+            button_frame,
+            text="Apply",
+            command=apply,
+            width=130,
+            height=40,
+            font=("Segoe UI", 13, "bold"),
+            text_color=("#ffffff", "#000000"),
+            fg_color=("#00b894", "#55efc4"),
+            hover_color=("#00a381", "#00b894"),
+            corner_radius=8
+        ).pack(side="left", padx=8)
+        
+        ctk.CTkButton(
+            button_frame,
+            text="Cancel",
+            command=dialog.destroy,
+            width=130,
+            height=40,
+            font=("Segoe UI", 13, "bold"),
+            text_color="white",
+            fg_color=("#636e72", "#74788d"),
+            hover_color=("#535b66", "#636e72"),
+            corner_radius=8
+        ).pack(side="left", padx=8)
+        
+        dialog.bind('<Return>', lambda e: apply())
+        dialog.bind('<Escape>', lambda e: dialog.destroy())
+        
+    def confirm_gallery_settings(self, settings):
+        # Only a smaller crop size loses anything, so only that asks first.
+        if settings['crop_size'] >= self.engine.gallery_settings['crop_size'] or len(self.engine.gallery) == 0:
+            return True
+        return messagebox.askyesno(
+            "Shrink Face Crops",
+            f"Every stored sample will be downscaled to {settings['crop_size']}px. "
+            "Growing the crop size again later cannot bring the lost detail back.\n\n"
+            "Continue?"
+        )
+        
+    def apply_gallery_settings(self, settings):
+        if settings == self.engine.gallery_settings:
+            return
+            
+        # Stored samples are resized in place and the store is rewritten at
+        # the new size; the original crops are not kept. Shrinking therefore
+        # loses detail for good (the settings dialog asks first), and growing
+        # only upscales what is left.
+        if settings['crop_size'] != self.engine.gallery_settings['crop_size']:
+            self.engine.purge_deleted()
+            self.engine.gallery.resize(settings['crop_size'])
+            self.engine.gallery_writer.rewrite(self.engine.gallery.faces, self.engine.gallery.labels)
+            
+        self.engine.gallery_settings = settings
+        self.save_data()
+        
+        if len(self.engine.gallery) > 0:
+            self.update_status(f"Gallery settings updated ({describe_settings(settings)}) - training...", True)
+            self.engine.train_recognizer(on_done=self.on_training_done)
+        else:
+            self.update_status(f"Gallery settings updated ({describe_settings(settings)})", True)
+            
+    def show_benchmark_report(self, report):
+        self.benchmark_btn.configure(state="normal", text="📊 Benchmark")
+        self.update_status("Benchmark finished", True)
+        
+        report_dialog = ctk.CTkToplevel(self.root)
+        report_dialog.title("Recognition Benchmark")
+        report_dialog.geometry("600x520")
+        report_dialog.transient(self.root)
+        
+        ctk.CTkLabel(
+            report_dialog,
+            text=report,
+            font=("Consolas", 11),
+            justify="left",
+            anchor="nw"
+        ).pack(fill="both", expand=True, padx=20, pady=20)
+        
+        ctk.CTkButton(
+            report_dialog,
+            text="Close",
+            command=report_dialog.destroy,
+            width=100
+        ).pack(pady=(0, 20))
         
     def create_face_list_section(self, parent):
         list_container = ctk.CTkFrame(parent, fg_color=("#2d2d2d", "#1a1a1a"), corner_radius=15)
@@ -507,6 +746,22 @@ Tips:
         self.status_var.set(message)
         self.status_icon.configure(text_color="#00b894" if success else "#d63031")
         
+    def dispatch(self, callback):
+        self.root.after(0, callback)
+        
+    def gallery_changed(self):
+        # Also called after changes from another instance, which may have
+        # switched the recognizer.
+        backend = self.engine.recognizer_backend
+        if self.backend_var.get() != backend:
+            self.backend_var.set(backend)
+            self.backend_info_label.configure(text=RECOGNIZER_BACKENDS[backend]['info'])
+        self.recognize_btn.configure(state="normal" if self.engine.name_to_id else "disabled")
+        self.update_face_list()
+        
+    def training_failed(self, message):
+        self.update_status(message, False)
+        
     def toggle_camera(self):
         if not self.is_camera_on:
             self.start_camera()
@@ -515,11 +770,16 @@ Tips:
     
     def start_camera(self):
         try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                messagebox.showerror("Error", "Cannot access camera")
-                return
-                
+            if len(self.sources) > 1:
+                if not self.start_cameras():
+                    return
+            else:
+                source = self.sources[0]
+                self.cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+                if not self.cap.isOpened():
+                    messagebox.showerror("Error", "Cannot access camera")
+                    return
+                    
             self.is_camera_on = True
             self.camera_btn.configure(text="■ Stop Camera")
             self.capture_btn.configure(state="normal")
@@ -533,16 +793,32 @@ Tips:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start camera: {str(e)}")
             
+    def start_cameras(self):
+        self.cameras = MultiCamera(self.engine, self.sources)
+        failed = self.cameras.start()
+        if not self.cameras.streams:
+            self.cameras.stop()
+            self.cameras = None
+            messagebox.showerror("Error", "Cannot access any camera")
+            return False
+        if failed:
+            messagebox.showwarning("Warning", f"Cannot access {', '.join(stream.name for stream in failed)}")
+        self.cameras.set_active(self.recognition_active)
+        return True
+        
     def stop_camera(self):
         self.is_camera_on = False
         self.recognition_active = False
         
         if self.cap:
             self.cap.release()
+        if self.cameras is not None:
+            self.cameras.stop()
+            self.cameras = None
             
         self.camera_btn.configure(text="▶ Start Camera")
         self.capture_btn.configure(state="disabled")
-        self.recognize_btn.configure(text="🎯 Recognize Faces", state="disabled" if len(self.face_data) == 0 else "normal")
+        self.recognize_btn.configure(text="🎯 Recognize Faces", state="disabled" if len(self.engine.gallery) == 0 else "normal")
         self.camera_label.configure(text="Camera Off\n\nClick 'Start Camera' to begin", image="")
         self.camera_status_indicator.configure(text="● OFF", text_color="#d63031")
         self.update_status("Camera stopped", False)
@@ -570,13 +846,20 @@ Tips:
     
     def update_video(self):
         while self.is_camera_on:
-            ret, frame = self.cap.read()
-            if ret:
-                frame = cv2.flip(frame, 1)
-                
-                if self.recognition_active and len(self.face_data) > 0:
+            cameras = self.cameras
+            if cameras is not None:
+                frame = self.compose_camera_view(cameras)
+                ret = frame is not None
+            else:
+                ret, frame = self.read_camera_frame()
+                if ret and self.recognition_active and len(self.engine.gallery) > 0:
                     frame = self.process_recognition(frame)
-                
+                    
+            if ret:
+                if self.preview is not None:
+                    self.preview.publish(frame)
+                if self.recorder is not None:
+                    self.recorder.write(frame)
                 frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 
                 label_w = max(640, self.camera_label.winfo_width() - 20)
@@ -589,75 +872,81 @@ Tips:
                 self.camera_label.image = frame_tk
                 
             self.root.after(30)
-    
-    def detect_faces(self, frame, gray):
-        faces = []
-        
-        if self.detection_method == 'haar':
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-            faces = [(x, y, w, h) for (x, y, w, h) in faces]
-            
-        elif self.detection_method == 'dlib' and DLIB_AVAILABLE:
-            dlib_faces = self.dlib_detector(gray, 1)
-            faces = [(face.left(), face.top(), 
-                     face.right() - face.left(), 
-                     face.bottom() - face.top()) 
-                    for face in dlib_faces]
             
-        elif self.detection_method == 'face_recognition' and FACE_RECOGNITION_AVAILABLE:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame, model='hog')
-            faces = [(left, top, right - left, bottom - top) 
-                    for (top, right, bottom, left) in face_locations]
+    def read_camera_frame(self):
+        # Camera frames are mirrored for the preview; video files are shown
+        # as recorded.
+        ret, frame = self.cap.read()
+        if ret and self.sources[0].isdigit():
+            frame = cv2.flip(frame, 1)
+        return ret, frame
+        
+    def selected_streams(self, cameras):
+        view = self.view_var.get()
+        return [stream for stream in cameras.streams if view in ("Grid", stream.name)]
+        
+    def compose_camera_view(self, cameras):
+        # The selected camera, or all of them tiled, each with the results
+        # of its newest recognized frame drawn on its newest frame.
+        streams = self.selected_streams(cameras)
+        frames = []
+        for stream in streams:
+            frame, results = cameras.latest(stream)
+            if frame is not None and self.recognition_active:
+                frame = self.draw_recognition(frame.copy(), results)
+            frames.append(frame)
             
-        elif self.detection_method == 'mediapipe' and MEDIAPIPE_AVAILABLE:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.mp_face_detector.process(rgb_frame)
-            
-            if results.detections:
-                h, w, _ = frame.shape
-                for detection in results.detections:
-                    bboxC = detection.location_data.relative_bounding_box
-                    x = int(bboxC.xmin * w)
-                    y = int(bboxC.ymin * h)
-                    width = int(bboxC.width * w)
-                    height = int(bboxC.height * h)
-                    faces.append((x, y, width, height))
-        else:
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-            faces = [(x, y, w, h) for (x, y, w, h) in faces]
+        if not streams or all(frame is None for frame in frames):
+            return None
+        if len(streams) == 1:
+            return frames[0]
+        return compose_grid(frames, [stream.name for stream in streams])
         
-        return faces
-            
     def process_recognition(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detect_faces(frame, gray)
+        if self.use_engine_process:
+            results = self.recognize_in_engine_process(frame)
+        else:
+            results = self.engine.recognize_faces(frame)
+        return self.draw_recognition(frame, results)
         
-        for (x, y, w, h) in faces:
-            face_region = gray[y:y+h, x:x+w]
-            face_region = cv2.resize(face_region, (100, 100))
-            
-            if len(self.face_data) > 0:
-                label, confidence = self.face_recognizer.predict(face_region)
-                
-                if confidence < 100:
-                    name = self.id_to_name.get(label, "Unknown")
-                    confidence_text = f"{name} ({100-confidence:.1f}%)"
-                    color = (0, 255, 0)
-                else:
-                    confidence_text = "Unknown"
-                    color = (0, 0, 255)
-                    
-                cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-                cv2.putText(frame, confidence_text, (x, y-10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-            else:
+    def draw_recognition(self, frame, results):
+        for (x, y, w, h), name, confidence in results:
+            if name is None:
+                status_text = "Training..." if len(self.engine.gallery) > 0 else "No training data"
                 cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-                cv2.putText(frame, "No training data", (x, y-10), 
+                cv2.putText(frame, status_text, (x, y-10), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
+                continue
+                
+            if name != "Unknown":
+                confidence_text = f"{name} ({100-confidence:.1f}%)"
+                color = (0, 255, 0)
+            else:
+                confidence_text = "Unknown"
+                color = (0, 0, 255)
+                
+            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+            cv2.putText(frame, confidence_text, (x, y-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
                 
         return frame
         
+    def recognize_in_engine_process(self, frame):
+        if self.engine_process is None or self.engine_process.frame_shape != frame.shape:
+            if self.engine_process is not None:
+                self.engine_process.close()
+            self.engine_process = EngineProcess(frame.shape, self.engine.snapshot())
+            
+        self.engine_process.submit(frame)
+        # Draw the newest finished result, which may be a frame or two
+        # behind, rather than wait for this frame's.
+        latest = self.engine_process.latest()
+        if latest is not None:
+            self.remote_results = latest[1:]
+        # Names come from this process's gallery, which the engine process
+        # follows through the journal.
+        return self.engine.label_predictions(*self.remote_results)
+        
     def add_face_dialog(self):
         if not self.is_camera_on:
             messagebox.showwarning("Warning", "Please start the camera first")
@@ -707,7 +996,7 @@ Tips:
                 messagebox.showwarning("Warning", "Please enter a name")
                 return
                 
-            if name in self.name_to_id:
+            if name in self.engine.name_to_id:
                 if not messagebox.askyesno("Confirm", f"Person '{name}' already exists. Add more samples?"):
                     return
                     
@@ -744,7 +1033,7 @@ Tips:
         dialog.bind('<Escape>', lambda e: dialog.destroy())
         
     def capture_face_samples(self, name):
-        if not self.cap:
+        if not self.cap and self.cameras is None:
             return
             
         samples_captured = 0
@@ -755,18 +1044,18 @@ Tips:
         self.update_status(f"Capturing samples for {name}... Look at camera", True)
         
         captured_faces = []
+        crop_size = self.engine.gallery_settings['crop_size']
         start_time = time.time()
         
         while samples_captured < target_samples and self.is_camera_on and self.capture_in_progress:
-            ret, frame = self.cap.read()
+            ret, frame = self.read_capture_frame()
             if ret:
-                frame = cv2.flip(frame, 1)
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.detect_faces(frame, gray)
+                faces = self.engine.detect_faces(frame, gray)
                 
                 for (x, y, w, h) in faces:
                     face_region = gray[y:y+h, x:x+w]
-                    face_region = cv2.resize(face_region, (100, 100))
+                    face_region = cv2.resize(face_region, (crop_size, crop_size))
                     captured_faces.append(face_region)
                     
                     samples_captured += 1
@@ -798,44 +1087,45 @@ Tips:
         self.capture_progress_label.configure(text="")
         
         if captured_faces:
-            if name not in self.name_to_id:
-                person_id = len(self.name_to_id)
-                self.name_to_id[name] = person_id
-                self.id_to_name[person_id] = name
-            else:
-                person_id = self.name_to_id[name]
-                
-            for face in captured_faces:
-                self.face_data.append(face)
-                self.face_labels.append(person_id)
-                
-            self.train_recognizer()
-            self.save_data()
+            self.engine.enroll(name, captured_faces, on_done=self.on_training_done)
             self.update_face_list()
             
-            if len(self.face_data) > 0:
+            if len(self.engine.gallery) > 0:
                 self.recognize_btn.configure(state="normal")
             
-            self.update_status(f"Successfully added {len(captured_faces)} samples for {name}", True)
+            self.update_status(f"Added {len(captured_faces)} samples for {name} - training model...", True)
             messagebox.showinfo("Success", f"Added {len(captured_faces)} face samples for {name}")
         else:
             self.update_status("No face detected during capture", False)
             messagebox.showwarning("Warning", "No face was detected. Please try again.")
             
-    def train_recognizer(self):
-        if len(self.face_data) > 0:
-            self.face_recognizer.train(self.face_data, np.array(self.face_labels))
-            
+    def read_capture_frame(self):
+        # With several cameras, samples come from the one on screen (the
+        # first one in grid view).
+        cameras = self.cameras
+        if cameras is None:
+            return self.read_camera_frame()
+        streams = self.selected_streams(cameras)
+        if not streams:
+            return False, None
+        return cameras.read(streams[0])
+        
+    def on_training_done(self):
+        self.update_status(f"Model trained on {len(self.engine.gallery)} samples", True)
+        
     def toggle_recognition(self):
         if not self.is_camera_on:
             messagebox.showwarning("Warning", "Please start the camera first")
             return
             
-        if len(self.face_data) == 0:
+        if len(self.engine.gallery) == 0:
             messagebox.showwarning("Warning", "No faces registered yet. Please add faces first.")
             return
             
         self.recognition_active = not self.recognition_active
+        self.remote_results = ([], [])
+        if self.cameras is not None:
+            self.cameras.set_active(self.recognition_active)
         
         if self.recognition_active:
             self.recognize_btn.configure(text="■ Stop Recognition")
@@ -848,20 +1138,19 @@ Tips:
         self.face_listbox.delete("1.0", "end")
         
         person_counts = {}
-        for label in self.face_labels:
-            label_int = int(label)
-            if label_int in self.id_to_name:
-                name = self.id_to_name[label_int]
-                person_counts[name] = person_counts.get(name, 0) + 1
+        for label, count in self.engine.gallery.label_counts().items():
+            if label in self.engine.id_to_name:
+                person_counts[self.engine.id_to_name[label]] = count
         
         if not person_counts:
             self.face_listbox.insert("1.0", "No faces registered yet.\n\nAdd faces using 'Add New Face' button.")
             self.face_count_label.configure(text="0 faces")
         else:
+            total = sum(person_counts.values())
             for name, count in person_counts.items():
                 self.face_listbox.insert("end", f"👤 {name} ({count} samples)\n")
-            self.face_listbox.insert("end", f"\nTotal: {len(person_counts)} people, {len(self.face_data)} samples")
-            self.face_count_label.configure(text=f"{len(person_counts)} people, {len(self.face_data)} samples")
+            self.face_listbox.insert("end", f"\nTotal: {len(person_counts)} people, {total} samples")
+            self.face_count_label.configure(text=f"{len(person_counts)} people, {total} samples")
             
     def delete_selected_face(self):
         try:
@@ -883,159 +1172,347 @@ Tips:
             return
             
         if messagebox.askyesno("Confirm", f"Delete all data for '{name}'?"):
-            person_id = self.name_to_id[name]
-            
-            new_face_data = []
-            new_face_labels = []
+            self.engine.delete_person(name)
             
-            for i, label in enumerate(self.face_labels):
-                if int(label) != person_id:
-                    new_face_data.append(self.face_data[i])
-                    new_face_labels.append(label)
-                    
-            self.face_data = new_face_data
-            self.face_labels = new_face_labels
-            
-            del self.name_to_id[name]
-            del self.id_to_name[person_id]
-            
-            if len(self.face_data) > 0:
-                self.train_recognizer()
-            else:
+            if not self.engine.name_to_id:
                 self.recognize_btn.configure(state="disabled")
-                
-            self.save_data()
             self.update_face_list()
             
             self.update_status(f"Deleted data for {name}", True)
             
+    def schedule_compaction(self, compact, delay):
+        if self.compaction_job is not None:
+            self.root.after_cancel(self.compaction_job)
+            
+        def run():
+            self.compaction_job = None
+            compact()
+            
+        self.compaction_job = self.root.after(delay, run)
+        
     def clear_all_faces(self):
         if messagebox.askyesno("Confirm", "Delete all face data?"):
-            self.face_data = []
-            self.face_labels = []
-            self.name_to_id = {}
-            self.id_to_name = {}
+            self.engine.clear_gallery()
             
             self.recognize_btn.configure(state="disabled", text="🎯 Recognize Faces")
             self.recognition_active = False
-            
-            self.save_data()
             self.update_face_list()
             
             self.update_status("All face data cleared", False)
             
     def export_data(self):
         file_path = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            defaultextension=".fgb",
+            filetypes=[("Face gallery bundles", "*.fgb"), ("All files", "*.*")],
             title="Export Face Data"
         )
         
-        if file_path:
-            try:
-                export_data = {
-                    'name_to_id': self.name_to_id,
-                    'id_to_name': {str(k): v for k, v in self.id_to_name.items()},
-                    'face_count': len(self.face_data),
-                    'exported_at': time.strftime("%Y-%m-%d %H:%M:%S")
-                }
-                
-                with open(file_path, 'w') as f:
-                    json.dump(export_data, f, indent=2)
+        if not file_path:
+            return
+            
+        self.engine.purge_deleted()
+        face_data = self.engine.gallery.faces
+        face_labels = self.engine.gallery.labels
+        state = self.engine.gallery_state()
+        backend = self.engine.recognizer_backend
+        settings = dict(self.engine.gallery_settings)
+        metadata = {
+            'name_to_id': self.engine.name_to_id,
+            'id_to_name': {str(k): v for k, v in self.engine.id_to_name.items()},
+            'recognizer': backend,
+            'settings': settings,
+            'feature_key': feature_key(backend, settings),
+            'next_person_id': self.engine.next_person_id,
+            'exported_at': time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        metadata = json.loads(json.dumps(metadata))
+        
+        def task(progress, cancel):
+            features = self.engine.cached_features(metadata['feature_key'], face_labels, state)
                     
-                self.update_status(f"Data exported to {os.path.basename(file_path)}", True)
-                messagebox.showinfo("Success", f"Data exported successfully to:\n{file_path}")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to export data: {str(e)}")
+            gallery_hash = compute_gallery_hash(face_data, face_labels, model_key(backend, settings))
+            current = self.engine.store_offset(state) is not None
+            with self.engine.model_save_lock:
+                model_file = None
+                if (current and self.engine.saved_model_current(backend, settings) and
+                        os.path.exists(self.engine.model_path(backend))):
+                    model_file = self.engine.model_path(backend)
+                    metadata['model'] = {'hash': gallery_hash}
+                write_bundle(file_path, metadata, face_data, face_labels, features, model_file, progress, cancel)
                 
+        def done(result):
+            self.update_status(f"Data exported to {os.path.basename(file_path)}", True)
+            messagebox.showinfo("Success", f"Data exported successfully to:\n{file_path}")
+            
+        self.run_with_progress("Exporting gallery...", task, done, "Failed to export data")
+        
     def import_data(self):
         file_path = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            filetypes=[("Face gallery bundles", "*.fgb"), ("All files", "*.*")],
             title="Import Face Data"
         )
         
-        if file_path:
-            try:
-                with open(file_path, 'r') as f:
-                    import_data = json.load(f)
-                    
-                self.name_to_id = import_data.get('name_to_id', {})
-                self.id_to_name = {int(k): v for k, v in import_data.get('id_to_name', {}).items()}
+        if not file_path:
+            return
+            
+        if len(self.engine.gallery) > 0:
+            merge = messagebox.askyesnocancel(
+                "Import Face Data",
+                "Merge the imported people into the current gallery?\n\n"
+                "Yes: add them (samples of existing names are combined)\n"
+                "No: replace the current gallery"
+            )
+            if merge is None:
+                return
+            if merge:
+                self.merge_gallery(file_path)
+                return
                 
-                if os.path.exists('face_data_opencv.npy') and os.path.exists('face_labels_opencv.npy'):
-                    face_data_loaded = np.load('face_data_opencv.npy')
-                    face_labels_loaded = np.load('face_labels_opencv.npy')
-                    
-                    self.face_data = [face for face in face_data_loaded]
-                    self.face_labels = [int(label) for label in face_labels_loaded]
+        model_tmp = self.engine.model_file + ".import.tmp"
+        
+        def task(progress, cancel):
+            # The store on disk must include every queued change first.
+            self.engine.gallery_writer.flush()
+            metadata = import_bundle(file_path, self.engine.gallery_store, model_tmp, progress, cancel)
+            
+            with self.engine.training_lock:
+                # Models still training on the replaced gallery are stale.
+                self.engine.training_generation += 1
+                
+            backend = metadata.get('recognizer')
+            with self.engine.model_save_lock:
+                self.engine.journal.append('reset', id_to_name=metadata.get('id_to_name', {}),
+                                    settings=metadata.get('settings'), recognizer=backend)
+                try:
+                    settings = validate_gallery_settings(metadata.get('settings'))
+                except ValueError:
+                    # apply_imported_gallery keeps the current settings.
+                    settings = None
+                if metadata.get('model') and backend in RECOGNIZER_BACKENDS and settings is not None:
+                    # Keyed on the store as the import left it.
+                    token = self.engine.model_token(backend, settings, self.engine.journal.end())
+                    atomic_replace(model_tmp, self.engine.model_path(backend))
+                    atomic_write(self.engine.model_hash_file, lambda f: f.write(token.encode('utf-8')))
+            return metadata
+            
+        def done(metadata):
+            self.apply_imported_gallery(metadata)
+            self.update_status(f"Data imported from {os.path.basename(file_path)}", True)
+            messagebox.showinfo("Success", "Data imported successfully!")
+            
+        self.run_with_progress("Importing gallery...", task, done, "Failed to import data")
+        
+    def merge_gallery(self, file_path):
+        name_to_id = dict(self.engine.name_to_id)
+        id_to_name = dict(self.engine.id_to_name)
+        next_person_id = self.engine.next_person_id
+        journal_offset = self.engine.journal_offset
+        settings = dict(self.engine.gallery_settings)
+        key = feature_key(self.engine.recognizer_backend, settings)
+        
+        def task(progress, cancel):
+            incoming = read_bundle_metadata(file_path)
+            next_id = next_person_id
+            with self.engine.journal.lock:
+                # Map onto the names every instance knows by now and reserve
+                # the new IDs before anyone else can take them.
+                entries, _ = self.engine.journal.read(journal_offset)
+                for entry in entries:
+                    apply_journal_names(entry, name_to_id, id_to_name)
+                    next_id = max(next_id, journal_next_person_id(entry))
+                label_map, merged_names = merge_name_maps(name_to_id, incoming.get('id_to_name', {}), next_id)
+                added = {name: person_id for name, person_id in merged_names.items() if name not in name_to_id}
+                for name, person_id in added.items():
+                    self.engine.journal.append('person', id=person_id, name=name)
                     
-                    if len(self.face_data) > 0:
-                        self.train_recognizer()
-                        self.recognize_btn.configure(state="normal")
-                        
-                self.update_face_list()
-                self.update_status(f"Data imported from {os.path.basename(file_path)}", True)
-                messagebox.showinfo("Success", "Data imported successfully!")
+            self.engine.gallery_writer.flush()
+            metadata = import_bundle(file_path, self.engine.gallery_store, None, progress, cancel,
+                                     label_map, settings['crop_size'], key)
+            if 'segment' not in metadata:
+                return added, None, None, None
+            self.engine.journal.append('append', segment=metadata['segment'])
                 
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to import data: {str(e)}")
+            # The merged samples are exactly the new batch.
+            return (added,) + self.engine.gallery_store.read_batch(metadata['segment'], key)
+            
+        def done(result):
+            added, faces, labels, features = result
+            for name, person_id in added.items():
+                self.engine.name_to_id[name] = person_id
+                self.engine.id_to_name[person_id] = name
+            self.engine.next_person_id = max([self.engine.next_person_id] + [i + 1 for i in self.engine.id_to_name])
+            self.save_data()
+            
+            count = 0
+            if faces is not None:
+                count = len(faces)
+                self.engine.gallery.append(faces, labels)
+                self.engine.update_recognizer(faces, labels, features, on_done=self.on_training_done)
+                self.recognize_btn.configure(state="normal")
                 
-    def save_data(self):
+            self.update_face_list()
+            self.update_status(f"Merged {count} samples from {os.path.basename(file_path)}", True)
+            messagebox.showinfo("Success", "Data merged successfully!")
+            
+        self.run_with_progress("Merging gallery...", task, done, "Failed to merge data")
+        
+    def apply_imported_gallery(self, metadata):
+        self.engine.name_to_id = metadata.get('name_to_id', {})
+        self.engine.id_to_name = {int(k): v for k, v in metadata.get('id_to_name', {}).items()}
+        
+        backend = metadata.get('recognizer', self.engine.recognizer_backend)
+        if backend in RECOGNIZER_BACKENDS:
+            self.engine.recognizer_backend = backend
+            self.backend_var.set(backend)
+            self.backend_info_label.configure(text=RECOGNIZER_BACKENDS[backend]['info'])
+            
         try:
-            data = {
-                'name_to_id': self.name_to_id,
-                'id_to_name': {str(k): v for k, v in self.id_to_name.items()},
-                'face_count': len(self.face_data)
-            }
+            self.engine.gallery_settings = validate_gallery_settings(metadata.get('settings'))
+        except ValueError as e:
+            print(f"Ignoring invalid gallery settings: {str(e)}")
             
-            with open(self.data_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
-            if len(self.face_data) > 0:
-                np.save('face_data_opencv.npy', np.array(self.face_data))
-                np.save('face_labels_opencv.npy', np.array(self.face_labels))
-                
+        face_data_loaded, face_labels_loaded = self.engine.gallery_store.load()
+        self.engine.gallery = FaceGallery.from_arrays(
+            resize_samples(face_data_loaded, self.engine.gallery_settings['crop_size']),
+            face_labels_loaded,
+            self.engine.gallery_settings['crop_size']
+        )
+        self.engine.deleted_ids.clear()
+        self.engine.gallery_writer.shared_metadata = self.engine.shared_metadata()
+        self.engine.next_person_id = max([self.engine.next_person_id, metadata.get('next_person_id', 0)] +
+                                  [i + 1 for i in self.engine.id_to_name] +
+                                  [int(face_labels_loaded.max()) + 1 if len(face_labels_loaded) else 0])
+        self.save_data()
+        self.update_face_list()
+        
+        if len(self.engine.gallery) > 0:
+            if not self.engine.load_model():
+                self.engine.train_recognizer(on_done=self.on_training_done)
+            self.recognize_btn.configure(state="normal")
+        else:
+            self.engine.face_recognizer = None
+            
+    def run_with_progress(self, title, task, on_done, error_text):
+        cancel = threading.Event()
+        
+        dialog = ctk.CTkToplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("380x160")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        dialog.resizable(False, False)
+        
+        ctk.CTkLabel(
+            dialog,
+            text=title,
+            font=("Segoe UI", 14, "bold")
+        ).pack(anchor="w", padx=20, pady=(20, 10))
+        
+        progress_bar = ctk.CTkProgressBar(dialog, width=340)
+        progress_bar.set(0)
+        progress_bar.pack(padx=20)
+        
+        ctk.CTkButton(
+            dialog,
+            text="Cancel",
+            command=cancel.set,
+            width=130,
+            height=36,
+            font=("Segoe UI", 13, "bold"),
+            text_color="white",
+            fg_color=("#636e72", "#74788d"),
+            hover_color=("#535b66", "#636e72"),
+            corner_radius=8
+        ).pack(pady=(15, 20))
+        dialog.protocol("WM_DELETE_WINDOW", cancel.set)
+        
+        def progress(fraction):
+            self.root.after(0, lambda: progress_bar.set(fraction))
+            
+        def finish(callback):
+            dialog.grab_release()
+            dialog.destroy()
+            callback()
+            
+        def worker():
+            try:
+                result = task(progress, cancel)
+            except BundleCancelled:
+                self.root.after(0, lambda: finish(lambda: self.update_status(f"{title.rstrip('.')} cancelled", False)))
+                return
+            except Exception as e:
+                message = f"{error_text}: {str(e)}"
+                self.root.after(0, lambda: finish(lambda: messagebox.showerror("Error", message)))
+                return
+            self.root.after(0, lambda: finish(lambda: on_done(result)))
+            
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+        
+    def save_data(self):
+        try:
+            self.engine.save_data()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save data: {str(e)}")
             
-    def load_data(self):
+    def on_save_error(self, error):
+        # Called from the writer thread.
+        self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to save data: {str(error)}"))
+        
+    def poll_journal_loop(self):
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    
-                self.name_to_id = data.get('name_to_id', {})
-                self.id_to_name = {int(k): v for k, v in data.get('id_to_name', {}).items()}
-                
-                if os.path.exists('face_data_opencv.npy') and os.path.exists('face_labels_opencv.npy'):
-                    face_data_loaded = np.load('face_data_opencv.npy')
-                    face_labels_loaded = np.load('face_labels_opencv.npy')
-                    
-                    self.face_data = [face for face in face_data_loaded]
-                    self.face_labels = [int(label) for label in face_labels_loaded]
-                    
-                    if len(self.face_data) > 0:
-                        self.train_recognizer()
-                        
+            self.engine.poll_journal()
         except Exception as e:
-            print(f"Failed to load data: {str(e)}")
-            self.face_data = []
-            self.face_labels = []
-            self.name_to_id = {}
-            self.id_to_name = {}
-            
+            print(f"Failed to apply gallery changes from another instance: {str(e)}")
+        self.root.after(JOURNAL_POLL_MS, self.poll_journal_loop)
+        
     def on_closing(self):
         self.capture_in_progress = False
         self.stop_camera()
-        if self.mp_face_detector:
-            self.mp_face_detector.close()
+        if self.engine_process is not None:
+            self.engine_process.close()
+        if self.preview is not None:
+            self.preview.close()
+        if self.recorder is not None:
+            if not self.recorder.close(timeout=10):
+                print("Warning: the recording could not be finished before exit")
+            elif self.recorder.encoded:
+                print(f"Recorded {self.recorder.encoded} frames to {self.recorder.path} "
+                      f"({self.recorder.dropped} dropped)")
+        if not self.engine.close(timeout=10):
+            print("Warning: pending gallery changes could not be written before exit")
         self.root.destroy()
 
 
-def main():
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not needs_gui(args):
+        return run_command(args)
+        
+    preview = None
+    if getattr(args, 'preview_port', None) is not None:
+        try:
+            preview = PreviewServer(args.preview_host, args.preview_port).start()
+        except OSError as e:
+            print(f"Error: could not start the preview server: {str(e)}", file=sys.stderr)
+            return 1
+        print(f"Preview at {preview.url}/", file=sys.stderr)
+        
+    recorder = None
+    if getattr(args, 'record', None):
+        try:
+            recorder = VideoRecorder(args.record, fps=args.record_fps, drop=args.record_drop)
+        except ValueError as e:
+            print(f"Error: could not start recording: {str(e)}", file=sys.stderr)
+            if preview is not None:
+                preview.close()
+            return 1
+        
     root = ctk.CTk()
-    app = FaceRecognitionApp(root)
+    sources = [source.strip() for source in getattr(args, 'source', '0').split(',') if source.strip()]
+    app = FaceRecognitionApp(root, engine_process=getattr(args, 'engine_process', False), sources=sources,
+                             preview=preview, recorder=recorder)
     
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
@@ -1048,4 +1525,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import cv2
+import math
+import queue
+import sys
+import threading
+import time
+
+
+DROP_POLICIES = ('newest', 'oldest')
+# Gaps longer than this (camera stopped, app paused) are cut from the
+# recording instead of being filled with the last frame.
+MAX_GAP_SECONDS = 1.0
+
+
+# Writes frames to a video file from its own thread. write() never blocks:
+# frames wait in a bounded queue, and when the encoder falls behind and
+# the queue is full the drop policy decides which frame is lost ('newest'
+# drops the incoming frame, 'oldest' the longest-waiting one). Frames are
+# placed by their capture time, so the video keeps wall-clock timing: a
+# dropped or late frame shows as the previous one held a little longer.
+class VideoRecorder:
+    def __init__(self, path, fps=20.0, fourcc='mp4v', queue_size=64, drop='newest'):
+        if drop not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop}' (expected one of {', '.join(DROP_POLICIES)})")
+        if not (fps > 0 and math.isfinite(fps)):
+            raise ValueError(f"Frame rate must be a positive number, got {fps}")
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.drop = drop
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer = None
+        self.frame_size = None
+        self.error = None
+        self.closed = False
+        # Frames handed to write(), frames lost to the drop policy, frames
+        # encoded from the queue and frames in the output file.
+        self.received = 0
+        self.dropped = 0
+        self.encoded = 0
+        self.frames_out = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        
+    def write(self, frame, timestamp=None):
+        # Queues a BGR frame; the caller must not modify it afterwards.
+        # Returns False if it was dropped.
+        if self.closed or self.error is not None:
+            return False
+        self.received += 1
+        item = (time.monotonic() if timestamp is None else timestamp, frame)
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+            
+        self.dropped += 1
+        if self.drop == 'newest':
+            return False
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+        
+    def run(self):
+        start = None
+        last = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            timestamp, frame = item
+            
+            try:
+                if self.writer is None:
+                    self.open(frame)
+                    start = timestamp
+                if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                    frame = cv2.resize(frame, self.frame_size)
+                    
+                index = round((timestamp - start) * self.fps)
+                if index - self.frames_out > self.fps * MAX_GAP_SECONDS:
+                    start = timestamp - self.frames_out / self.fps
+                    index = self.frames_out
+                # Arrived faster than the file's frame rate: this slot is taken.
+                if index < self.frames_out:
+                    continue
+                while last is not None and self.frames_out < index:
+                    self.writer.write(last)
+                    self.frames_out += 1
+                self.writer.write(frame)
+                self.frames_out += 1
+                self.encoded += 1
+                last = frame
+            except (OSError, RuntimeError, cv2.error) as e:
+                self.error = e
+                print(f"Recording stopped: {str(e)}", file=sys.stderr)
+                
+    def open(self, frame):
+        self.frame_size = (frame.shape[1], frame.shape[0])
+        self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.frame_size)
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Could not open {self.path} for writing")
+            
+    def close(self, timeout=None):
+        # Writes what is still queued and closes the file. Returns False if
+        # the writer thread did not finish in time.
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            return False
+        if self.writer is not None:
+            self.writer.release()
+        return True
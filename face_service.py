@@ -0,0 +1,250 @@
+import cv2
+import numpy as np
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from face_engine import FaceEngine, JOURNAL_POLL_MS, largest_face_crop
+
+
+MAX_IMAGE_BYTES = 10 << 20
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Runs every engine call on one thread. Requests that arrive within
+# `window` seconds of each other (up to `max_batch`) are handled together:
+# the faces of all recognize requests go through the model in one call.
+# Enrollments run last, one at a time, in arrival order, and add their
+# sample to the live model instead of retraining it where the backend
+# allows.
+class MicroBatcher:
+    def __init__(self, engine, max_batch=16, window=0.005, poll_interval=JOURNAL_POLL_MS / 1000.0):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.window = window
+        self.poll_interval = poll_interval
+        self.requests = queue.Queue()
+        self.batch_sizes = []
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        
+    def submit(self, kind, frame, name=None):
+        if self.closed:
+            raise ServiceError(503, "Service is shutting down")
+        future = Future()
+        self.requests.put((kind, frame, name, future))
+        return future
+        
+    def run(self):
+        # Changes other instances made to the gallery are picked up every
+        # poll_interval, whether or not requests keep arriving.
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + self.poll_interval
+                with self.engine.frontend.lock:
+                    self.poll()
+            try:
+                first = self.requests.get(timeout=max(next_poll - time.monotonic(), 0))
+            except queue.Empty:
+                continue
+            if first is None:
+                return
+                
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.requests.put(None)
+                    break
+                batch.append(item)
+                
+            # Training and compaction callbacks land between batches.
+            with self.engine.frontend.lock:
+                self.process(batch)
+            
+    def poll(self):
+        try:
+            self.engine.poll_journal()
+        except Exception as e:
+            print(f"Failed to apply gallery changes from another instance: {str(e)}", file=sys.stderr)
+            
+    def process(self, batch):
+        self.batch_sizes.append(len(batch))
+        recognitions = [item for item in batch if item[0] == 'recognize']
+        if recognitions:
+            try:
+                # Wait for the model rather than answer without names while
+                # an update holds it.
+                results = self.engine.recognize_batch([frame for _, frame, _, _ in recognitions], wait=True)
+            except Exception as e:
+                for *_, future in recognitions:
+                    future.set_exception(e)
+            else:
+                for (_, _, _, future), faces in zip(recognitions, results):
+                    future.set_result(faces)
+                    
+        for kind, frame, name, future in batch:
+            if kind == 'recognize':
+                continue
+            try:
+                if kind == 'detect':
+                    future.set_result(self.detect(frame))
+                else:
+                    future.set_result(self.enroll(frame, name))
+            except Exception as e:
+                future.set_exception(e)
+                
+    def detect(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return [(tuple(box), None, None) for box in self.engine.detect_faces(frame, gray)]
+        
+    def enroll(self, frame, name):
+        crop = largest_face_crop(self.engine, frame)
+        if crop is None:
+            raise ServiceError(422, "No face found in the image")
+        person_id = self.engine.enroll(name, [crop], incremental=True)
+        return {'name': name, 'id': person_id, 'samples': self.engine.gallery.label_counts()[person_id]}
+        
+    def close(self, timeout=None):
+        self.closed = True
+        self.requests.put(None)
+        self.thread.join(timeout)
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    server_version = "FaceRecognition/1.0"
+    
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            return self.send_json(404, {'error': "Not found"})
+        engine = self.server.engine
+        self.send_json(200, {'people': len(engine.name_to_id), 'samples': len(engine.gallery)})
+        
+    def do_POST(self):
+        url = urlparse(self.path)
+        kind = url.path.strip('/')
+        try:
+            if kind not in ('detect', 'recognize', 'enroll'):
+                raise ServiceError(404, "Not found")
+            name = parse_qs(url.query).get('name', [''])[0].strip()
+            if kind == 'enroll' and not name:
+                raise ServiceError(400, "Missing ?name=")
+                
+            frame = self.read_image()
+            result = self.server.batcher.submit(kind, frame, name).result(self.server.timeout_seconds)
+        except ServiceError as e:
+            return self.send_json(e.status, {'error': str(e)})
+        except TimeoutError:
+            return self.send_json(504, {'error': "Timed out waiting for the engine"})
+        except Exception as e:
+            return self.send_json(500, {'error': str(e)})
+            
+        if kind == 'enroll':
+            return self.send_json(200, result)
+        faces = [{'box': [int(v) for v in box]} for box, _, _ in result]
+        if kind == 'recognize':
+            for face, (_, name, confidence) in zip(faces, result):
+                face['name'] = name
+                face['confidence'] = None if confidence is None else round(float(confidence), 3)
+        self.send_json(200, {'faces': faces})
+        
+    def read_image(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise ServiceError(400, "Request body must be an image")
+        if length > MAX_IMAGE_BYTES:
+            raise ServiceError(413, "Image is too large")
+        frame = cv2.imdecode(np.frombuffer(self.rfile.read(length), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ServiceError(400, "Could not decode the image")
+        return frame
+        
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def log_message(self, format, *args):
+        pass
+
+
+# HTTP front end for an engine, bound to localhost unless told otherwise.
+class RecognitionService(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self, engine, host='127.0.0.1', port=8765, max_batch=16, window=0.005, timeout_seconds=30):
+        super().__init__((host, port), RecognitionHandler)
+        self.engine = engine
+        self.batcher = MicroBatcher(engine, max_batch, window)
+        self.timeout_seconds = timeout_seconds
+        self.thread = None
+        
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+        
+    def start(self):
+        # Serves on a background thread; returns immediately.
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+        
+    def close(self):
+        # shutdown() waits for serve_forever, so only call it if that runs.
+        if self.thread is not None:
+            self.shutdown()
+        self.server_close()
+        self.batcher.close(timeout=10)
+
+
+def serve(args):
+    engine = FaceEngine()
+    if args.detector:
+        if args.detector not in engine.available_methods:
+            print(f"Error: detection method '{args.detector}' is not available", file=sys.stderr)
+            engine.close()
+            return 2
+        engine.detection_method = args.detector
+        
+    try:
+        service = RecognitionService(engine, args.host, args.port, args.max_batch, args.batch_window_ms / 1000.0)
+    except OSError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        engine.close()
+        return 1
+        
+    print(f"Serving on {service.url} (POST /detect, /recognize, /enroll?name=...; GET /health)", file=sys.stderr)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        service.batcher.close(timeout=10)
+        if engine.training_thread is not None:
+            engine.training_thread.join()
+        engine.close()
+    return 0
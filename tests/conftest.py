@@ -77,6 +77,81 @@ def mock_tkinter():
         yield mock_root
 
 
+@pytest.fixture
+def engine_factory(temp_data_dir):
+    """Build FaceEngine instances working in the temporary data directory.
+
+    Every instance shares the current directory, like several copies of the
+    app started from the same folder.
+    """
+    from face_engine import FaceEngine
+    engines = []
+    
+    def build(**kwargs):
+        engine = FaceEngine(**kwargs)
+        engines.append(engine)
+        return engine
+        
+    yield build
+    for engine in engines:
+        if engine.frontend.compaction_timer is not None:
+            engine.frontend.compaction_timer.cancel()
+        if engine.reload_thread is not None:
+            engine.reload_thread.join()
+        if engine.compaction_thread is not None:
+            engine.compaction_thread.join()
+        if engine.training_thread is not None:
+            engine.training_thread.join()
+        engine.close()
+
+
+@pytest.fixture
+def engine(engine_factory):
+    """Create a GUI-free engine working in the temporary data directory."""
+    return engine_factory()
+
+
+@pytest.fixture
+def app_factory(temp_data_dir):
+    """Build FaceRecognitionApp instances on a real engine but without the GUI.
+
+    The widgets the app updates are mocks, and callbacks it schedules on the
+    event loop run right away.
+    """
+    from face_recognition_opencv import FaceRecognitionApp
+    apps = []
+    
+    def setup_widgets(app):
+        for widget in ('status_var', 'status_icon', 'recognize_btn', 'capture_btn', 'camera_label',
+                       'capture_progress_label', 'face_listbox', 'face_count_label', 'backend_var',
+                       'backend_info_label'):
+            setattr(app, widget, MagicMock())
+            
+    def build():
+        root = MagicMock()
+        with patch.object(FaceRecognitionApp, 'setup_gui', setup_widgets), patch('face_recognition_opencv.ctk'):
+            app = FaceRecognitionApp(root)
+        root.after.side_effect = lambda delay, callback: callback()
+        apps.append(app)
+        return app
+        
+    yield build
+    for app in apps:
+        if app.engine.reload_thread is not None:
+            app.engine.reload_thread.join()
+        if app.engine.compaction_thread is not None:
+            app.engine.compaction_thread.join()
+        if app.engine.training_thread is not None:
+            app.engine.training_thread.join()
+        app.engine.close()
+
+
+@pytest.fixture
+def app_without_gui(app_factory):
+    """Create a FaceRecognitionApp with its state set up but no GUI built."""
+    return app_factory()
+
+
 @pytest.fixture
 def camera_available():
     """Check if a camera is available for testing."""
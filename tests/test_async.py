@@ -0,0 +1,201 @@
+"""
+Unit tests for the asyncio front end of the recognition engine.
+Tests concurrency limits, backpressure and cancellation.
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+import numpy as np
+import cv2
+from unittest.mock import MagicMock
+
+
+def make_face(seed):
+    """Create a reproducible random colour face image."""
+    gray = np.random.RandomState(seed).randint(0, 255, (100, 100), dtype=np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+@pytest.fixture
+def faces_everywhere(engine):
+    """Make the engine find one face in every non-blank image."""
+    engine.detect_faces = MagicMock(side_effect=lambda frame, gray: [(0, 0, 100, 100)] if gray.max() > 0 else [])
+    return engine
+
+
+class TestAsyncFaceEngine:
+    """Test the async detect/recognize/enroll entry points."""
+
+    def test_detect(self, faces_everywhere):
+        """Test detect returns integer boxes."""
+        from face_async import AsyncFaceEngine
+
+        async def scenario():
+            async with AsyncFaceEngine(faces_everywhere) as api:
+                return await api.detect(make_face(1))
+
+        assert asyncio.run(scenario()) == [(0, 0, 100, 100)]
+
+    def test_enroll_then_recognize(self, faces_everywhere):
+        """Test faces enrolled through the async API are recognized through it."""
+        from face_async import AsyncFaceEngine
+
+        async def scenario():
+            async with AsyncFaceEngine(faces_everywhere) as api:
+                for seed, name in ((1, 'Alice'), (2, 'Bob')):
+                    await asyncio.gather(api.enroll(name, make_face(seed)), api.enroll(name, make_face(seed)))
+                await asyncio.get_running_loop().run_in_executor(None, faces_everywhere.training_thread.join)
+                return await api.recognize(make_face(2))
+
+        results = asyncio.run(scenario())
+
+        assert results[0][1] == 'Bob'
+        assert faces_everywhere.gallery.label_counts() == {0: 2, 1: 2}
+
+    def test_enroll_updates_the_live_model(self, faces_everywhere):
+        """Test enrolling into a trained gallery adds to the model instead of retraining."""
+        from face_async import AsyncFaceEngine
+        engine = faces_everywhere
+
+        async def scenario():
+            async with AsyncFaceEngine(engine) as api:
+                await api.enroll('Alice', make_face(1))
+                await asyncio.get_running_loop().run_in_executor(None, engine.training_thread.join)
+                engine.train_recognizer = MagicMock(wraps=engine.train_recognizer)
+                await api.enroll('Bob', make_face(2))
+                await asyncio.get_running_loop().run_in_executor(None, engine.training_thread.join)
+
+        asyncio.run(scenario())
+
+        engine.train_recognizer.assert_not_called()
+        bob = cv2.cvtColor(make_face(2), cv2.COLOR_BGR2GRAY)
+        assert engine.face_recognizer.predict(bob)[0] == engine.name_to_id['Bob']
+
+    def test_enroll_without_face(self, faces_everywhere):
+        """Test enrolling an image without a face returns None and adds nothing."""
+        from face_async import AsyncFaceEngine
+
+        async def scenario():
+            async with AsyncFaceEngine(faces_everywhere) as api:
+                return await api.enroll('Alice', np.zeros((50, 50, 3), dtype=np.uint8))
+
+        assert asyncio.run(scenario()) is None
+        assert len(faces_everywhere.gallery) == 0
+
+    def test_recognize_waits_for_model(self, faces_everywhere):
+        """Test recognize waits out an in-place model update instead of skipping it."""
+        from face_async import AsyncFaceEngine
+
+        faces_everywhere.enroll('Alice', [make_face(1)[:, :, 0]] * 2)
+        faces_everywhere.training_thread.join()
+
+        async def scenario():
+            async with AsyncFaceEngine(faces_everywhere) as api:
+                faces_everywhere.recognizer_lock.acquire()
+                threading.Timer(0.1, faces_everywhere.recognizer_lock.release).start()
+                return await api.recognize(make_face(1))
+
+        assert asyncio.run(scenario())[0][1] == 'Alice'
+
+    def test_bounded_concurrency(self, engine):
+        """Test no more than max_concurrency calls run at once."""
+        from face_async import AsyncFaceEngine
+
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_detect(frame, gray):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+            return []
+
+        engine.detect_faces = slow_detect
+
+        async def scenario():
+            async with AsyncFaceEngine(engine, max_concurrency=2, max_pending=10) as api:
+                await asyncio.gather(*(api.detect(make_face(i)) for i in range(10)))
+
+        asyncio.run(scenario())
+
+        assert len(peak) == 10
+        assert max(peak) == 2
+
+    def test_backpressure(self, engine):
+        """Test calls beyond max_pending fail fast with EngineBusy."""
+        from face_async import AsyncFaceEngine, EngineBusy
+
+        release = threading.Event()
+        engine.detect_faces = MagicMock(side_effect=lambda frame, gray: release.wait(5) and [])
+
+        async def scenario():
+            async with AsyncFaceEngine(engine, max_concurrency=1, max_pending=2) as api:
+                first = asyncio.ensure_future(api.detect(make_face(1)))
+                second = asyncio.ensure_future(api.detect(make_face(2)))
+                await asyncio.sleep(0.05)
+                with pytest.raises(EngineBusy):
+                    await api.detect(make_face(3))
+                release.set()
+                await asyncio.gather(first, second)
+                return api.pending
+
+        assert asyncio.run(scenario()) == 0
+        assert engine.detect_faces.call_count == 2
+
+    def test_cancel_waiting_call(self, engine):
+        """Test a call cancelled while waiting for a slot never runs."""
+        from face_async import AsyncFaceEngine
+
+        release = threading.Event()
+        engine.detect_faces = MagicMock(side_effect=lambda frame, gray: release.wait(5) and [])
+
+        async def scenario():
+            async with AsyncFaceEngine(engine, max_concurrency=1) as api:
+                running = asyncio.ensure_future(api.detect(make_face(1)))
+                waiting = asyncio.ensure_future(api.detect(make_face(2)))
+                await asyncio.sleep(0.05)
+                waiting.cancel()
+                await asyncio.sleep(0)
+                pending = api.pending
+                release.set()
+                await running
+                return pending, waiting.cancelled()
+
+        assert asyncio.run(scenario()) == (1, True)
+        assert engine.detect_faces.call_count == 1
+
+    def test_cancel_running_call(self, engine):
+        """Test a cancelled running call keeps its slot until the work finishes."""
+        from face_async import AsyncFaceEngine
+
+        release = threading.Event()
+        engine.detect_faces = MagicMock(side_effect=lambda frame, gray: release.wait(5) and [])
+
+        async def scenario():
+            async with AsyncFaceEngine(engine, max_concurrency=1) as api:
+                running = asyncio.ensure_future(api.detect(make_face(1)))
+                await asyncio.sleep(0.05)
+                running.cancel()
+                await asyncio.sleep(0.05)
+                held = api.pending
+                release.set()
+                result = await asyncio.wait_for(api.detect(make_face(2)), 5)
+                return held, result, api.pending
+
+        assert asyncio.run(scenario()) == (1, [], 0)
+
+    def test_closed(self, engine):
+        """Test calls after close are refused."""
+        from face_async import AsyncFaceEngine
+
+        api = AsyncFaceEngine(engine)
+        api.close()
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(api.detect(make_face(1)))
@@ -0,0 +1,292 @@
+"""
+Unit tests for running several cameras against one engine.
+Tests the fair detector scheduler, per-stream state and the grid view.
+"""
+
+import threading
+import time
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+
+class FakeCapture:
+    """A capture that yields `count` frames of its source's brightness, `interval` apart."""
+
+    def __init__(self, source, count=50, interval=0.002):
+        self.source = source
+        self.count = count
+        self.interval = interval
+        self.released = False
+
+    def isOpened(self):
+        return self.source != 99
+
+    def read(self):
+        if self.count == 0 or self.released:
+            return False, None
+        self.count -= 1
+        time.sleep(self.interval)
+        value = self.source if isinstance(self.source, int) else 200
+        return True, np.full((48, 64, 3), value, dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def start_cameras(engine, sources, workers=1, count=50, active=True, **kwargs):
+    """Start a MultiCamera over fake captures."""
+    from face_cameras import MultiCamera
+
+    cameras = MultiCamera(engine, sources, workers=workers, **kwargs)
+    cameras.active = active
+    with patch('face_cameras.cv2.VideoCapture', side_effect=lambda source: FakeCapture(source, count)):
+        failed = cameras.start()
+    return cameras, failed
+
+
+def wait_until(condition, timeout=10):
+    """Poll until `condition()` is true or the timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def slow_engine(delay=0.01):
+    """An engine stand-in that takes `delay` per frame and finds Alice in it."""
+    engine = MagicMock()
+    engine.recognize_faces.side_effect = lambda frame, wait: time.sleep(delay) or [((0, 0, 10, 10), 'Alice', 20.0)]
+    return engine
+
+
+class TestCameraStream:
+    """Test per-source settings."""
+
+    def test_names_and_mirroring(self):
+        """Test cameras are named by index and mirrored, files by name and not."""
+        from face_cameras import CameraStream
+
+        camera = CameraStream(2)
+        video = CameraStream('/videos/lobby.mp4')
+
+        assert (camera.name, camera.mirror) == ("Camera 2", True)
+        assert (video.name, video.mirror) == ("lobby.mp4", False)
+
+
+class TestMultiCamera:
+    """Test the capture threads and the shared detector scheduler."""
+
+    def test_unavailable_sources_are_left_out(self):
+        """Test sources that cannot be opened are reported and skipped."""
+        cameras, failed = start_cameras(slow_engine(), [1, 99, 2])
+        try:
+            assert [stream.name for stream in failed] == ["Camera 99"]
+            assert [stream.name for stream in cameras.streams] == ["Camera 1", "Camera 2"]
+        finally:
+            cameras.stop()
+
+    def test_results_and_last_seen_per_stream(self):
+        """Test every stream gets its own results and sightings."""
+        cameras, _ = start_cameras(slow_engine(0.001), [1, 2], workers=2)
+        try:
+            assert wait_until(lambda: all(stream.processed > 0 for stream in cameras.streams))
+            for stream in cameras.streams:
+                frame, results = cameras.latest(stream)
+                assert frame is not None
+                assert results == [((0, 0, 10, 10), 'Alice', 20.0)]
+                assert 'Alice' in stream.last_seen
+        finally:
+            cameras.stop()
+
+    def test_detector_time_is_shared_fairly(self):
+        """Test streams get equal detector time when detection is the bottleneck."""
+        cameras, _ = start_cameras(slow_engine(0.01), [1, 2, 3], workers=1, count=1000)
+        try:
+            assert wait_until(lambda: sum(stream.processed for stream in cameras.streams) >= 30)
+        finally:
+            cameras.stop()
+
+        processed = [stream.processed for stream in cameras.streams]
+        assert max(processed) - min(processed) <= 2
+        assert all(stream.dropped > 0 for stream in cameras.streams)
+
+    def test_idle_stream_leaves_its_share(self):
+        """Test a stream that stops producing frames does not hold up the others."""
+        from face_cameras import MultiCamera
+
+        engine = slow_engine(0.005)
+        cameras = MultiCamera(engine, [1, 2], workers=1)
+        captures = {1: FakeCapture(1, 1000), 2: FakeCapture(2, 1)}
+        with patch('face_cameras.cv2.VideoCapture', side_effect=lambda source: captures[source]):
+            cameras.start()
+        try:
+            assert wait_until(lambda: cameras.streams[0].processed >= 20)
+            assert cameras.streams[1].ended
+            assert cameras.streams[1].processed == 1
+        finally:
+            cameras.stop()
+
+    def test_one_frame_in_flight_per_stream(self):
+        """Test two workers never recognize frames of the same stream at once."""
+        in_flight = {}
+        overlaps = []
+        lock = threading.Lock()
+
+        def recognize(frame, wait):
+            source = int(frame[0, 0, 0])
+            with lock:
+                if in_flight.get(source):
+                    overlaps.append(source)
+                in_flight[source] = True
+            time.sleep(0.005)
+            with lock:
+                in_flight[source] = False
+            return []
+
+        engine = MagicMock()
+        engine.recognize_faces.side_effect = recognize
+        cameras, _ = start_cameras(engine, [1], workers=4, count=1000)
+        try:
+            assert wait_until(lambda: cameras.streams[0].processed >= 20)
+        finally:
+            cameras.stop()
+
+        assert overlaps == []
+
+    def test_workers_detect_with_their_own_models(self, engine):
+        """Test several workers on a real engine never call the same detector from two threads."""
+        users = {}
+        lock = threading.Lock()
+
+        class RecordingDetectors:
+            """Detector models that remember which threads called them."""
+
+            def __init__(self):
+                self.face_cascade = MagicMock()
+                self.face_cascade.detectMultiScale.side_effect = self.detect
+
+            def detect(self, gray, scale, neighbors):
+                with lock:
+                    users.setdefault(id(self), set()).add(threading.get_ident())
+                time.sleep(0.002)
+                return []
+
+            def close(self):
+                pass
+
+        engine.detection_method = 'haar'
+        with patch('face_engine.FaceDetectors', RecordingDetectors):
+            cameras, _ = start_cameras(engine, [1, 2, 3], workers=3, count=1000)
+            try:
+                assert wait_until(lambda: all(stream.processed >= 5 for stream in cameras.streams))
+            finally:
+                cameras.stop()
+
+        assert len(users) >= 2
+        assert all(len(threads) == 1 for threads in users.values())
+
+    def test_inactive_cameras_skip_recognition(self):
+        """Test frames are captured but not recognized until activated."""
+        engine = slow_engine(0.001)
+        cameras, _ = start_cameras(engine, [1], count=1000, active=False)
+        try:
+            stream = cameras.streams[0]
+            assert wait_until(lambda: stream.frames >= 10)
+            assert engine.recognize_faces.call_count == 0
+
+            cameras.set_active(True)
+            assert wait_until(lambda: stream.processed > 0)
+            cameras.set_active(False)
+            assert cameras.latest(stream)[1] == []
+        finally:
+            cameras.stop()
+
+    def test_read_returns_each_frame_once(self):
+        """Test read waits for a new frame and hands out a private copy."""
+        cameras, _ = start_cameras(slow_engine(), [7], count=3, active=False)
+        try:
+            stream = cameras.streams[0]
+            frames = []
+            while True:
+                ret, frame = cameras.read(stream, timeout=1)
+                if not ret:
+                    break
+                frames.append(frame)
+        finally:
+            cameras.stop()
+
+        assert 1 <= len(frames) <= 3
+        assert stream.ended
+        frames[-1][:] = 0
+        assert stream.frame[0, 0, 0] == 7
+
+    def test_stop_releases_captures(self):
+        """Test stopping joins the threads and releases every capture."""
+        cameras, _ = start_cameras(slow_engine(), [1, 2], count=1000)
+        captures = [stream.capture for stream in cameras.streams]
+
+        cameras.stop()
+
+        assert cameras.threads == []
+        assert all(capture.released for capture in captures)
+
+
+class TestAppCameras:
+    """Test the app running several sources through a MultiCamera."""
+
+    def test_grid_mode_recognizes_every_stream(self, app_without_gui):
+        """Test start_cameras hands the app's engine to the workers and every stream gets detections."""
+        app = app_without_gui
+        app.sources = ['1', '2']
+        app.recognition_active = True
+        app.engine.detect_faces = MagicMock(return_value=[(0, 0, 20, 20)])
+
+        with patch('face_cameras.cv2.VideoCapture', side_effect=lambda source: FakeCapture(source, 1000)):
+            assert app.start_cameras()
+        try:
+            assert wait_until(lambda: all(stream.processed > 0 for stream in app.cameras.streams))
+            for stream in app.cameras.streams:
+                assert [box for box, _, _ in app.cameras.latest(stream)[1]] == [(0, 0, 20, 20)]
+        finally:
+            app.cameras.stop()
+
+
+class TestComposeGrid:
+    """Test tiling several frames into one view."""
+
+    def test_layout(self):
+        """Test frames are tiled as close to square as possible."""
+        from face_cameras import compose_grid
+
+        frames = [np.full((48, 64, 3), 50 * (i + 1), dtype=np.uint8) for i in range(3)]
+
+        grid = compose_grid(frames, tile_size=(64, 48))
+
+        assert grid.shape == (96, 128, 3)
+        assert grid[0, 0, 0] == 50
+        assert grid[0, 64, 0] == 100
+        assert grid[48, 0, 0] == 150
+        assert grid[48, 64, 0] == 0
+
+    def test_letterbox_and_missing_frames(self):
+        """Test frames keep their aspect ratio and missing frames stay black."""
+        from face_cameras import compose_grid
+
+        tall = np.full((100, 50, 3), 255, dtype=np.uint8)
+
+        grid = compose_grid([tall, None], tile_size=(100, 100))
+
+        assert grid.shape == (100, 200, 3)
+        assert grid[50, 10, 0] == 0
+        assert grid[50, 50, 0] == 255
+        assert grid[:, 100:].max() == 0
+
+    def test_labels(self):
+        """Test stream names are drawn on their tiles."""
+        from face_cameras import compose_grid
+
+        grid = compose_grid([None], labels=["Camera 0"], tile_size=(200, 100))
+
+        assert grid.max() > 0
@@ -1,6 +1,6 @@
 """
 Unit tests for data management (save, load, export, import).
-Tests JSON format, numpy arrays, and file operations.
+Tests JSON format, numpy arrays, file operations and the gallery bundle.
 """
 
 import pytest
@@ -284,3 +284,339 @@ class TestExportImport:
         
         assert name_to_id['Alice'] == 0
         assert id_to_name[0] == 'Alice'
+
+
+class TestGalleryBundle:
+    """Test the chunked, checksummed gallery bundle used for export/import."""
+
+    @pytest.fixture
+    def gallery(self):
+        """Create a small random gallery of 10 samples for 2 people."""
+        rng = np.random.default_rng(0)
+        faces = rng.integers(0, 255, (10, 100, 100), dtype=np.uint8)
+        labels = np.array([0] * 5 + [1] * 5, dtype=np.int32)
+        return faces, labels
+
+    @pytest.fixture
+    def metadata(self):
+        """Create bundle metadata for the gallery."""
+        return {'name_to_id': {'Alice': 0, 'Bob': 1}, 'id_to_name': {'0': 'Alice', '1': 'Bob'},
+                'recognizer': 'lbph', 'settings': {'crop_size': 100}}
+
+    def test_roundtrip(self, tmp_path, gallery, metadata):
+        """Test samples and metadata survive export and import."""
+        from face_engine import write_bundle, import_bundle, SegmentedGalleryStore
+        
+        path = str(tmp_path / "gallery.fgb")
+        write_bundle(path, metadata, *gallery, chunk_samples=3)
+        store = SegmentedGalleryStore(str(tmp_path / "store"))
+        
+        imported = import_bundle(path, store)
+        
+        faces, labels = store.load()
+        np.testing.assert_array_equal(faces, gallery[0])
+        np.testing.assert_array_equal(labels, gallery[1])
+        assert imported['name_to_id'] == metadata['name_to_id']
+        assert imported['face_count'] == 10
+
+    def test_features_and_model_are_bundled(self, tmp_path, gallery, metadata):
+        """Test optional features and model bytes are carried along."""
+        from face_engine import write_bundle, import_bundle, SegmentedGalleryStore
+        
+        features = np.arange(40, dtype=np.float32).reshape(10, 4)
+        model_file = tmp_path / "model.yml"
+        model_file.write_bytes(b"model" * 1000)
+        path = str(tmp_path / "gallery.fgb")
+        write_bundle(path, dict(metadata, feature_key='k', model={'hash': 'abc'}), *gallery,
+                     features=features, model_file=str(model_file), chunk_samples=4)
+        store = SegmentedGalleryStore(str(tmp_path / "store"))
+        model_tmp = str(tmp_path / "model.tmp")
+        
+        imported = import_bundle(path, store, model_tmp)
+        
+        np.testing.assert_array_equal(store.load_features('k')[0], features)
+        with open(model_tmp, 'rb') as f:
+            assert f.read() == b"model" * 1000
+        assert imported['model'] == {'hash': 'abc'}
+
+    def test_progress_is_reported(self, tmp_path, gallery, metadata):
+        """Test both directions report increasing progress ending at 1."""
+        from face_engine import write_bundle, import_bundle, SegmentedGalleryStore
+        
+        path = str(tmp_path / "gallery.fgb")
+        exported, imported = [], []
+        write_bundle(path, metadata, *gallery, progress=exported.append, chunk_samples=2)
+        import_bundle(path, SegmentedGalleryStore(str(tmp_path / "store")), progress=imported.append)
+        
+        for values in (exported, imported):
+            assert len(values) > 2
+            assert values == sorted(values)
+            assert values[-1] == 1.0
+
+    def test_cancelled_export_leaves_no_file(self, tmp_path, gallery, metadata):
+        """Test cancelling an export removes the partial bundle."""
+        import threading
+        from face_engine import write_bundle, BundleCancelled
+        
+        cancel = threading.Event()
+        path = tmp_path / "gallery.fgb"
+        
+        with pytest.raises(BundleCancelled):
+            write_bundle(str(path), metadata, *gallery, progress=lambda fraction: cancel.set(),
+                         cancel=cancel, chunk_samples=2)
+        
+        assert os.listdir(tmp_path) == []
+
+    def test_cancelled_import_keeps_gallery(self, tmp_path, gallery, metadata):
+        """Test cancelling an import leaves the existing store untouched."""
+        import threading
+        from face_engine import write_bundle, import_bundle, BundleCancelled, SegmentedGalleryStore
+        
+        path = str(tmp_path / "gallery.fgb")
+        write_bundle(path, metadata, *gallery, chunk_samples=2)
+        store = SegmentedGalleryStore(str(tmp_path / "store"))
+        store.append(np.zeros((1, 100, 100), dtype=np.uint8), [7])
+        cancel = threading.Event()
+        
+        with pytest.raises(BundleCancelled):
+            import_bundle(path, store, progress=lambda fraction: cancel.set(), cancel=cancel)
+        
+        assert list(store.load()[1]) == [7]
+        assert sorted(os.listdir(store.directory)) == ['manifest.json', 'seg_000000_faces.npy',
+                                                       'seg_000000_labels.npy']
+
+    @pytest.mark.parametrize("damage", ["flip", "truncate"])
+    def test_damaged_bundle_is_rejected(self, tmp_path, gallery, metadata, damage):
+        """Test a corrupted or truncated bundle fails without touching the store."""
+        from face_engine import write_bundle, import_bundle, SegmentedGalleryStore
+        
+        path = tmp_path / "gallery.fgb"
+        write_bundle(str(path), metadata, *gallery, chunk_samples=3)
+        data = bytearray(path.read_bytes())
+        if damage == "flip":
+            data[len(data) // 2] ^= 0xFF
+        else:
+            data = data[:-40]
+        path.write_bytes(bytes(data))
+        store = SegmentedGalleryStore(str(tmp_path / "store"))
+        
+        with pytest.raises(ValueError):
+            import_bundle(str(path), store)
+        
+        assert not store.exists()
+
+    def test_non_bundle_is_rejected(self, tmp_path):
+        """Test an old JSON export is not mistaken for a bundle."""
+        from face_engine import import_bundle, SegmentedGalleryStore
+        
+        path = tmp_path / "export.json"
+        path.write_text(json.dumps({'name_to_id': {}}))
+        
+        with pytest.raises(ValueError, match="Not a face gallery bundle"):
+            import_bundle(str(path), SegmentedGalleryStore(str(tmp_path / "store")))
+
+    @staticmethod
+    def run_task(app, action):
+        """Run the task that `action` hands to run_with_progress synchronously."""
+        with patch.object(app, 'run_with_progress') as run:
+            action()
+        title, task, on_done, error_text = run.call_args[0]
+        on_done(task(lambda fraction: None, None))
+
+    def test_app_export_import_roundtrip(self, app_without_gui, tmp_path, gallery):
+        """Test the app exports its gallery and model and restores them on import."""
+        app = app_without_gui
+        app.engine.gallery.append(*gallery)
+        app.engine.gallery_writer.append(*gallery)
+        app.engine.name_to_id = {'Alice': 0, 'Bob': 1}
+        app.engine.id_to_name = {0: 'Alice', 1: 'Bob'}
+        app.engine.train_recognizer(wait=True)
+        path = str(tmp_path / "gallery.fgb")
+        
+        with patch('face_recognition_opencv.messagebox') as messagebox, \
+                patch('face_recognition_opencv.filedialog') as filedialog:
+            filedialog.asksaveasfilename.return_value = path
+            filedialog.askopenfilename.return_value = path
+            self.run_task(app, app.export_data)
+            
+            app.engine.gallery_writer.clear()
+            app.engine.gallery.clear()
+            app.engine.name_to_id, app.engine.id_to_name = {}, {}
+            app.engine.face_recognizer = None
+            app.engine.train_recognizer = MagicMock()
+            self.run_task(app, app.import_data)
+        
+        messagebox.showerror.assert_not_called()
+        assert app.engine.id_to_name == {0: 'Alice', 1: 'Bob'}
+        np.testing.assert_array_equal(app.engine.gallery.faces, gallery[0])
+        app.engine.train_recognizer.assert_not_called()
+        assert app.engine.face_recognizer.predict(gallery[0][7])[0] == 1
+
+    def test_progress_dialog_reports_errors(self, app_without_gui):
+        """Test a failing task closes the dialog and shows the error."""
+        def task(progress, cancel):
+            progress(0.5)
+            raise ValueError("Bundle is truncated")
+            
+        with patch('face_recognition_opencv.ctk') as ctk, patch('face_recognition_opencv.messagebox') as messagebox:
+            app_without_gui.run_with_progress("Importing gallery...", task, MagicMock(), "Failed to import data").join()
+        
+        ctk.CTkProgressBar.return_value.set.assert_called_with(0.5)
+        ctk.CTkToplevel.return_value.destroy.assert_called_once()
+        messagebox.showerror.assert_called_once_with("Error", "Failed to import data: Bundle is truncated")
+
+    def test_progress_dialog_cancel(self, app_without_gui):
+        """Test cancelling stops the task without reporting an error."""
+        from face_engine import BundleCancelled
+        
+        def task(progress, cancel):
+            cancel.set()
+            if cancel.is_set():
+                raise BundleCancelled()
+                
+        on_done = MagicMock()
+        with patch('face_recognition_opencv.ctk'), patch('face_recognition_opencv.messagebox') as messagebox:
+            app_without_gui.run_with_progress("Exporting gallery...", task, on_done, "Failed to export data").join()
+        
+        on_done.assert_not_called()
+        messagebox.showerror.assert_not_called()
+        app_without_gui.status_var.set.assert_called()
+
+
+class TestMergeImport:
+    """Test merging a bundle into the existing gallery."""
+
+    @staticmethod
+    def make_gallery(people, count=6, size=100, seed=0):
+        """Create `count` random crops for each label in `people`."""
+        rng = np.random.default_rng(seed)
+        faces = rng.integers(0, 255, (len(people) * count, size, size), dtype=np.uint8)
+        labels = np.repeat(np.array(people, dtype=np.int32), count)
+        return faces, labels
+
+    def test_merge_name_maps(self):
+        """Test existing names keep their ID and new names get fresh ones."""
+        from face_engine import merge_name_maps
+        
+        label_map, merged = merge_name_maps({'Alice': 0, 'Carol': 4}, {'0': 'Bob', '1': 'Alice', '2': 'Dave'})
+        
+        assert label_map == {0: 5, 1: 0, 2: 6}
+        assert merged == {'Alice': 0, 'Carol': 4, 'Bob': 5, 'Dave': 6}
+
+    def test_merge_appends_remapped_samples(self, tmp_path):
+        """Test merged samples are remapped, resized and appended as a segment."""
+        from face_engine import write_bundle, import_bundle, SegmentedGalleryStore
+        
+        store = SegmentedGalleryStore(str(tmp_path / "store"))
+        store.append(np.zeros((2, 64, 64), dtype=np.uint8), [0, 0])
+        faces, labels = self.make_gallery([0, 1], count=2)
+        path = str(tmp_path / "site.fgb")
+        write_bundle(path, {'id_to_name': {'0': 'Bob', '1': 'Alice'}, 'feature_key': 'k'}, faces, labels,
+                     features=np.ones((4, 3), dtype=np.float32))
+        
+        metadata = import_bundle(path, store, label_map={0: 1, 1: 0}, crop_size=64, key='k')
+        
+        stored_faces, stored_labels = store.load()
+        assert stored_faces.shape == (6, 64, 64)
+        assert list(stored_labels) == [0, 0, 1, 1, 0, 0]
+        assert len(store.manifest['segments']) == 2
+        assert metadata['segment'] == store.manifest['segments'][-1]['name']
+        assert store.load_features('k') is None
+
+    def test_unmapped_label_is_rejected(self, tmp_path):
+        """Test a sample whose label has no name fails without changing the store."""
+        from face_engine import write_bundle, import_bundle, SegmentedGalleryStore
+        
+        store = SegmentedGalleryStore(str(tmp_path / "store"))
+        store.append(np.zeros((1, 100, 100), dtype=np.uint8), [0])
+        path = str(tmp_path / "site.fgb")
+        write_bundle(path, {'id_to_name': {'0': 'Bob'}}, *self.make_gallery([0, 1], count=1))
+        
+        with pytest.raises(ValueError, match="has no name"):
+            import_bundle(path, store, label_map={0: 1}, crop_size=100)
+        
+        assert list(store.load()[1]) == [0]
+
+    @pytest.fixture
+    def local_app(self, app_without_gui):
+        """Create an app with a trained local gallery of Alice (ID 0)."""
+        app = app_without_gui
+        faces, labels = self.make_gallery([0], seed=1)
+        app.engine.gallery.append(faces, labels)
+        app.engine.gallery_writer.append(faces, labels)
+        app.engine.name_to_id = {'Alice': 0}
+        app.engine.id_to_name = {0: 'Alice'}
+        return app
+
+    def merge(self, app, path):
+        """Merge the bundle at `path` into the app synchronously."""
+        with patch('face_recognition_opencv.messagebox') as messagebox, \
+                patch('face_recognition_opencv.filedialog') as filedialog, \
+                patch.object(app, 'run_with_progress') as run:
+            filedialog.askopenfilename.return_value = path
+            messagebox.askyesnocancel.return_value = True
+            app.import_data()
+            title, task, on_done, error_text = run.call_args[0]
+            on_done(task(lambda fraction: None, None))
+            if app.engine.training_thread is not None:
+                app.engine.training_thread.join()
+        return messagebox
+
+    def test_app_merge_trains_only_the_delta(self, local_app, tmp_path):
+        """Test a merge remaps IDs and updates the model instead of retraining."""
+        from face_engine import write_bundle
+        
+        local_app.engine.train_recognizer(wait=True)
+        recognizer = local_app.engine.face_recognizer
+        site_faces, site_labels = self.make_gallery([0, 1], size=64, seed=2)
+        path = str(tmp_path / "site.fgb")
+        write_bundle(path, {'id_to_name': {'0': 'Bob', '1': 'Alice'}}, site_faces, site_labels)
+        local_app.engine.train_recognizer = MagicMock()
+        
+        messagebox = self.merge(local_app, path)
+        
+        messagebox.showerror.assert_not_called()
+        local_app.engine.train_recognizer.assert_not_called()
+        assert local_app.engine.face_recognizer is not recognizer
+        assert local_app.engine.name_to_id == {'Alice': 0, 'Bob': 1}
+        assert local_app.engine.gallery.label_counts() == {0: 12, 1: 6}
+        bob = np.array(local_app.engine.gallery.faces[6])
+        assert local_app.engine.face_recognizer.predict(bob)[0] == 1
+        assert recognizer.predict(bob)[0] == 0
+        assert local_app.engine.load_model()
+
+    def test_numpy_merge_reuses_bundled_features(self, local_app, tmp_path):
+        """Test the NumPy backend updates from the bundle's features."""
+        from face_engine import write_bundle, feature_key, NumpyLBPHRecognizer
+        
+        local_app.engine.recognizer_backend = 'lbph_numpy'
+        local_app.engine.train_recognizer(wait=True)
+        recognizer = local_app.engine.face_recognizer
+        site_faces, site_labels = self.make_gallery([0], seed=3)
+        key = feature_key('lbph_numpy', local_app.engine.gallery_settings)
+        features = local_app.engine.face_recognizer.extract_features(site_faces)
+        path = str(tmp_path / "site.fgb")
+        write_bundle(path, {'id_to_name': {'0': 'Bob'}, 'feature_key': key}, site_faces, site_labels,
+                     features=features)
+        
+        with patch.object(NumpyLBPHRecognizer, 'extract_features_parallel') as extract:
+            self.merge(local_app, path)
+        
+        extract.assert_not_called()
+        assert len(local_app.engine.face_recognizer.labels) == 12
+        assert len(recognizer.labels) == 6
+        assert local_app.engine.face_recognizer.predict(site_faces[2])[0] == 1
+
+    def test_non_incremental_backend_retrains(self, local_app, tmp_path):
+        """Test backends without an update path fall back to a full retrain."""
+        from face_engine import write_bundle
+        
+        local_app.engine.recognizer_backend = 'eigen'
+        local_app.engine.train_recognizer(wait=True)
+        path = str(tmp_path / "site.fgb")
+        write_bundle(path, {'id_to_name': {'0': 'Bob'}}, *self.make_gallery([0], seed=4))
+        local_app.engine.train_recognizer = MagicMock()
+        
+        self.merge(local_app, path)
+        
+        local_app.engine.train_recognizer.assert_called_once()
@@ -0,0 +1,465 @@
+"""
+Unit tests for the GUI-free recognition engine.
+Tests importing without GUI modules, enrollment, recognition, deletes
+and the headless command.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import pytest
+import numpy as np
+import cv2
+from unittest.mock import MagicMock, patch
+
+
+def make_face(seed):
+    """Create a reproducible random face crop."""
+    return np.random.RandomState(seed).randint(0, 255, (100, 100), dtype=np.uint8)
+
+
+def enroll(engine, name, seed, count=4):
+    """Enroll `count` noisy copies of one face and wait for training."""
+    base = make_face(seed)
+    faces = [np.clip(base.astype(int) + np.random.RandomState(i).randint(-5, 5, base.shape), 0, 255).astype(np.uint8)
+             for i in range(count)]
+    person_id = engine.enroll(name, faces)
+    engine.training_thread.join()
+    return person_id
+
+
+class TestFaceEngine:
+    """Test the engine on its own, without the Tk app."""
+
+    def test_import_does_not_load_gui_modules(self):
+        """Test importing the engine pulls in no GUI toolkit."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys, face_engine; "
+                "print([m for m in ('customtkinter', 'tkinter', 'PIL.ImageTk') if m in sys.modules])")
+
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+
+    def test_app_drives_an_engine(self, app_without_gui):
+        """Test the Tk app holds an engine and receives its hook calls instead of being one."""
+        from face_engine import FaceEngine
+        from face_recognition_opencv import FaceRecognitionApp
+
+        assert not issubclass(FaceRecognitionApp, FaceEngine)
+        assert isinstance(app_without_gui.engine, FaceEngine)
+        assert app_without_gui.engine.frontend is app_without_gui
+
+    def test_enroll_and_recognize(self, engine):
+        """Test an enrolled face is recognized in a frame."""
+        person_id = enroll(engine, 'Alice', 1)
+        enroll(engine, 'Bob', 2)
+        frame = cv2.cvtColor(make_face(1), cv2.COLOR_GRAY2BGR)
+        engine.detect_faces = MagicMock(return_value=[(0, 0, 100, 100)])
+
+        results = engine.recognize_faces(frame)
+
+        assert engine.name_to_id['Alice'] == person_id
+        assert [(box, name) for box, name, _ in results] == [((0, 0, 100, 100), 'Alice')]
+
+    def test_update_leaves_live_model_usable(self, engine):
+        """Test an incremental update builds a new model while the old one keeps predicting."""
+        import threading
+        from face_engine import NumpyLBPHRecognizer
+
+        engine.recognizer_backend = 'lbph_numpy'
+        alice = enroll(engine, 'Alice', 1)
+        live = engine.face_recognizer
+        release = threading.Event()
+        train_features = NumpyLBPHRecognizer.train_features
+
+        def slow_train_features(recognizer, features, labels):
+            release.wait(5)
+            train_features(recognizer, features, labels)
+
+        with patch.object(NumpyLBPHRecognizer, 'train_features', slow_train_features):
+            engine.update_recognizer([make_face(2)] * 2, [alice + 1] * 2)
+            predictions = engine.predict_regions([make_face(1)])
+            release.set()
+            engine.training_thread.join()
+
+        assert predictions[0][0] == alice
+        assert len(live.labels) == 4
+        assert engine.face_recognizer is not live
+        assert list(engine.face_recognizer.labels) == [alice] * 4 + [alice + 1] * 2
+
+    def test_recognize_without_model(self, engine):
+        """Test faces are reported with no name while there is no model."""
+        engine.detect_faces = MagicMock(return_value=[(5, 5, 20, 20)])
+
+        results = engine.recognize_faces(np.zeros((50, 50, 3), dtype=np.uint8))
+
+        assert results == [((5, 5, 20, 20), None, None)]
+
+    def test_enrollment_is_persisted(self, engine):
+        """Test a new engine loads the enrolled gallery from disk."""
+        from face_engine import FaceEngine
+
+        enroll(engine, 'Alice', 1)
+        engine.gallery_writer.flush()
+
+        reloaded = FaceEngine()
+        try:
+            assert reloaded.name_to_id == {'Alice': 0}
+            assert len(reloaded.gallery) == 4
+        finally:
+            if reloaded.training_thread is not None:
+                reloaded.training_thread.join()
+            reloaded.close()
+
+    def test_delete_person_compacts(self, engine):
+        """Test deleting drops the person's samples without an event loop."""
+        enroll(engine, 'Alice', 1)
+        bob = enroll(engine, 'Bob', 2)
+
+        engine.delete_person('Alice')
+        engine.frontend.compaction_timer.join()
+        engine.compaction_thread.join()
+
+        assert engine.name_to_id == {'Bob': bob}
+        assert engine.gallery.label_counts() == {bob: 4}
+        assert not engine.deleted_ids
+
+    def test_deletes_compact_once(self, engine):
+        """Test a burst of deletes is compacted once, after the last of them."""
+        engine.compact_gallery = MagicMock()
+        for delay in (50, 50, 50):
+            engine.schedule_compaction(delay)
+
+        engine.frontend.compaction_timer.join()
+
+        engine.compact_gallery.assert_called_once()
+
+    def test_callbacks_wait_for_the_driving_thread(self, engine):
+        """Test a worker's callback never runs while another thread drives the engine."""
+        calls = []
+        with engine.frontend.lock:
+            worker = threading.Thread(target=engine.frontend.dispatch, args=(lambda: calls.append('callback'),))
+            worker.start()
+            worker.join(0.2)
+            calls.append('engine call')
+        worker.join(5)
+
+        assert calls == ['engine call', 'callback']
+
+    def test_clear_gallery(self, engine):
+        """Test clearing removes every person and the model."""
+        enroll(engine, 'Alice', 1)
+
+        engine.clear_gallery()
+
+        assert len(engine.gallery) == 0
+        assert engine.name_to_id == {}
+        assert engine.face_recognizer is None
+
+
+class TestHeadlessRun:
+    """Test the headless command that streams results as JSON lines."""
+
+    @pytest.fixture
+    def image_dir(self, tmp_path):
+        """Create a directory with two face images and a stray text file."""
+        directory = tmp_path / "frames"
+        directory.mkdir()
+        for i in range(2):
+            cv2.imwrite(str(directory / f"frame_{i}.png"), cv2.cvtColor(make_face(1), cv2.COLOR_GRAY2BGR))
+        (directory / "notes.txt").write_text("not an image")
+        return directory
+
+    def test_iter_frames_from_directory(self, image_dir):
+        """Test a directory yields its images in name order."""
+        from face_engine import iter_frames
+
+        frames = list(iter_frames(str(image_dir)))
+
+        assert [os.path.basename(path) for _, _, path, _ in frames] == ['frame_0.png', 'frame_1.png']
+        assert frames[0][3].shape == (100, 100, 3)
+
+    def test_iter_frames_from_video(self, tmp_path):
+        """Test a video file yields every frame with its timestamp."""
+        from face_engine import iter_frames
+
+        path = str(tmp_path / "clip.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+        for i in range(5):
+            writer.write(np.full((48, 64, 3), i * 40, dtype=np.uint8))
+        writer.release()
+
+        frames = list(iter_frames(path))
+
+        assert [index for index, _, _, _ in frames] == [0, 1, 2, 3, 4]
+        assert frames[1][1] > frames[0][1]
+
+    def test_missing_source_raises(self, tmp_path):
+        """Test a source that is neither a camera, file nor directory fails."""
+        from face_engine import iter_frames
+
+        with pytest.raises(FileNotFoundError):
+            list(iter_frames(str(tmp_path / "missing.mp4")))
+
+    def test_run_writes_one_line_per_frame(self, engine, image_dir):
+        """Test each frame becomes a JSON line with faces and timings."""
+        import io
+        import json
+        from face_engine import run_headless
+
+        enroll(engine, 'Alice', 1)
+        enroll(engine, 'Bob', 2)
+        engine.detect_faces = MagicMock(return_value=[(0, 0, 100, 100)])
+        output = io.StringIO()
+
+        count = run_headless(engine, str(image_dir), output)
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert count == 2 and len(records) == 2
+        assert records[0]['faces'][0]['box'] == [0, 0, 100, 100]
+        assert records[0]['faces'][0]['name'] == 'Alice'
+        assert set(records[0]['timings']) == {'detect_ms', 'recognize_ms', 'total_ms'}
+
+    def test_max_frames(self, engine, image_dir):
+        """Test --max-frames stops the stream early."""
+        import io
+        from face_engine import run_headless
+
+        engine.detect_faces = MagicMock(return_value=[])
+        output = io.StringIO()
+
+        assert run_headless(engine, str(image_dir), output, max_frames=1) == 1
+        assert len(output.getvalue().splitlines()) == 1
+
+    def test_command_line(self, temp_data_dir, image_dir):
+        """Test the run --headless command writes to the output file."""
+        from face_engine import FaceEngine, main
+
+        output = temp_data_dir / "results.jsonl"
+        with patch.object(FaceEngine, 'detect_faces', return_value=[]):
+            code = main(['run', '--headless', '--source', str(image_dir), '--output', str(output)])
+
+        assert code == 0
+        assert len(output.read_text().splitlines()) == 2
+
+    def test_command_line_reports_bad_source(self, temp_data_dir, capsys):
+        """Test an unreadable source exits with an error message."""
+        from face_engine import main
+
+        assert main(['run', '--headless', '--source', 'missing.mp4']) == 1
+        assert "missing.mp4" in capsys.readouterr().err
+
+    def test_command_line_reports_unwritable_output(self, temp_data_dir, image_dir, capsys):
+        """Test an output file that cannot be opened is reported and the engine is still closed."""
+        from face_engine import FaceEngine, main
+
+        output = temp_data_dir / "missing" / "results.jsonl"
+        with patch.object(FaceEngine, 'close', autospec=True, return_value=True) as close:
+            code = main(['run', '--headless', '--source', str(image_dir), '--output', str(output)])
+
+        assert code == 1
+        assert "results.jsonl" in capsys.readouterr().err
+        close.assert_called_once()
+
+    def test_command_line_rejects_several_sources(self, temp_data_dir, capsys):
+        """Test --headless refuses a comma-separated list of sources."""
+        from face_engine import main
+
+        assert main(['run', '--headless', '--source', '0,1']) == 2
+        assert "single source" in capsys.readouterr().err
+
+    def test_gui_gets_every_source(self, temp_data_dir):
+        """Test the app is built with each comma-separated source."""
+        import face_recognition_opencv
+
+        with patch('face_recognition_opencv.FaceRecognitionApp') as app, \
+             patch('face_recognition_opencv.ctk'):
+            face_recognition_opencv.main(['run', '--source', '0, 2,lobby.mp4'])
+
+        assert app.call_args[1]['sources'] == ['0', '2', 'lobby.mp4']
+
+    def test_gui_entry_point_runs_headless(self, temp_data_dir, image_dir):
+        """Test the app's main() hands run --headless to the engine without a window."""
+        import face_recognition_opencv
+
+        with patch('face_recognition_opencv.run_command', return_value=0) as command, \
+             patch('face_recognition_opencv.ctk') as ctk:
+            assert face_recognition_opencv.main(['run', '--headless', '--source', str(image_dir)]) == 0
+
+        command.assert_called_once()
+        ctk.CTk.assert_not_called()
+
+
+HAAR_AVAILABLE = not cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml').empty()
+
+
+class TestVideoProcessing:
+    """Test offline video processing split into segments."""
+
+    @pytest.fixture
+    def video(self, tmp_path):
+        """Write a 25-frame video whose frames differ in brightness."""
+        path = str(tmp_path / "footage.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+        for i in range(25):
+            writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+        writer.release()
+        return path
+
+    def test_split_segments(self):
+        """Test segments cover every frame exactly once."""
+        from face_engine import split_segments
+
+        assert split_segments(25, 10) == [(0, 10), (10, 20), (20, 25)]
+        assert split_segments(0, 10) == []
+
+    def test_segment_reads_its_own_frames(self, engine, video):
+        """Test a segment starts at its first frame, not at the start of the video."""
+        from face_engine import process_video_segment
+
+        engine.detect_faces = MagicMock(return_value=[])
+        records = process_video_segment(video, 10, 15, engine)
+
+        assert [record['frame'] for record in records] == [10, 11, 12, 13, 14]
+        brightness = [int(call[0][1].mean()) for call in engine.detect_faces.call_args_list]
+        assert abs(brightness[0] - 100) <= 3
+
+    def test_segments_match_sequential_run(self, engine, video):
+        """Test segmented output is the same stream a sequential run produces."""
+        import io
+        import json
+        from face_engine import process_video, run_headless
+
+        engine.detect_faces = MagicMock(return_value=[])
+        sequential, segmented = io.StringIO(), io.StringIO()
+        run_headless(engine, video, sequential)
+
+        count = process_video(engine, video, segmented, workers=0, segment_frames=7)
+
+        def frames(output):
+            return [(r['frame'], r['timestamp_ms']) for r in map(json.loads, output.getvalue().splitlines())]
+        assert count == 25
+        assert frames(segmented) == frames(sequential)
+
+    def test_snapshot_round_trip(self, engine, tmp_path):
+        """Test a worker engine rebuilt from a snapshot recognizes the same face."""
+        from face_engine import FaceEngine
+
+        enroll(engine, 'Alice', 1)
+        enroll(engine, 'Bob', 2)
+        worker = FaceEngine.from_snapshot(engine.snapshot(str(tmp_path / "model.yml")))
+        worker.detect_faces = MagicMock(return_value=[(0, 0, 100, 100)])
+
+        results = worker.recognize_faces(cv2.cvtColor(make_face(2), cv2.COLOR_GRAY2BGR))
+
+        assert results[0][1] == 'Bob'
+        assert not hasattr(worker, 'gallery_writer')
+
+    @pytest.mark.skipif(not HAAR_AVAILABLE, reason="Haar cascade file not installed")
+    def test_process_pool(self, engine, video):
+        """Test worker processes return every frame in time order."""
+        import io
+        import json
+        from face_engine import process_video
+
+        engine.detection_method = 'haar'
+        output = io.StringIO()
+
+        count = process_video(engine, video, output, workers=2, segment_frames=6)
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert count == 25
+        assert [record['frame'] for record in records] == list(range(25))
+
+
+class TestBulkEnrollment:
+    """Test enrolling people from a directory tree of labeled images."""
+
+    @pytest.fixture
+    def photos(self, tmp_path):
+        """Create photos/<name>/*.jpg with one blank photo for Bob."""
+        root = tmp_path / "photos"
+        for name, seed in (('Alice', 1), ('Bob', 2)):
+            (root / name).mkdir(parents=True)
+            for i in range(3):
+                cv2.imwrite(str(root / name / f"{i}.png"), cv2.cvtColor(make_face(seed), cv2.COLOR_GRAY2BGR))
+        cv2.imwrite(str(root / "Bob" / "blank.png"), np.zeros((100, 100, 3), dtype=np.uint8))
+        (root / "Bob" / "notes.txt").write_text("badge scans")
+        (root / "Empty").mkdir()
+        (root / "readme.txt").write_text("one folder per person")
+        return root
+
+    @staticmethod
+    def detect_unless_blank(frame, gray):
+        """Find one face anywhere in an image that is not all black."""
+        return [(0, 0, 100, 100)] if gray.max() > 0 else []
+
+    def test_list_enrollment_images(self, photos):
+        """Test only image files inside per-person folders are listed."""
+        from face_engine import list_enrollment_images
+
+        images = list_enrollment_images(str(photos))
+
+        assert list(images) == ['Alice', 'Bob']
+        assert [os.path.basename(p) for p in images['Bob']] == ['0.png', '1.png', '2.png', 'blank.png']
+
+    def test_extract_face_crop_takes_largest_face(self, engine, tmp_path):
+        """Test the largest detection is cropped, clipped to the image."""
+        from face_engine import extract_face_crop
+
+        image = np.zeros((120, 120, 3), dtype=np.uint8)
+        image[:60, :60] = 200
+        path = str(tmp_path / "group.png")
+        cv2.imwrite(path, image)
+        engine.detect_faces = MagicMock(return_value=[(100, 100, 10, 10), (-10, -10, 70, 70)])
+
+        crop = extract_face_crop(path, engine)
+
+        assert crop.shape == (100, 100)
+        assert crop.min() == 200
+
+    def test_bulk_enroll_writes_once_and_trains_once(self, engine, photos):
+        """Test every person lands in one store segment and one training run."""
+        from face_engine import bulk_enroll
+
+        engine.detect_faces = MagicMock(side_effect=self.detect_unless_blank)
+        train = MagicMock(wraps=engine.train_recognizer)
+        engine.train_recognizer = train
+
+        counts, skipped = bulk_enroll(engine, str(photos), workers=0)
+        engine.training_thread.join()
+        engine.gallery_writer.flush()
+
+        assert counts == {'Alice': 3, 'Bob': 3}
+        assert [os.path.basename(p) for p in skipped] == ['blank.png']
+        assert train.call_count == 1
+        assert len(engine.gallery_store.manifest['segments']) == 1
+        assert engine.gallery.label_counts() == {engine.name_to_id['Alice']: 3, engine.name_to_id['Bob']: 3}
+        assert engine.face_recognizer is not None
+
+    def test_bulk_enroll_adds_to_existing_people(self, engine, photos):
+        """Test photos for a known name are added under the existing ID."""
+        from face_engine import bulk_enroll
+
+        alice = enroll(engine, 'Alice', 1)
+        engine.detect_faces = MagicMock(side_effect=self.detect_unless_blank)
+
+        bulk_enroll(engine, str(photos), workers=0)
+        engine.training_thread.join()
+
+        assert engine.name_to_id['Alice'] == alice
+        assert engine.gallery.label_counts()[alice] == 7
+
+    def test_enroll_command(self, temp_data_dir, photos, capsys):
+        """Test the enroll command reports what it enrolled."""
+        from face_engine import FaceEngine, main
+
+        with patch.object(FaceEngine, 'detect_faces', side_effect=self.detect_unless_blank):
+            assert main(['enroll', '--root', str(photos), '--workers', '0']) == 0
+
+        captured = capsys.readouterr()
+        assert "Enrolled 6 samples for 2 people (1 images without a face)" in captured.out
+        assert "blank.png" in captured.err
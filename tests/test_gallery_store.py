@@ -0,0 +1,1225 @@
+"""
+Unit tests for the append-only segmented gallery store.
+Tests segment appends, tombstones, rewrites, compaction, legacy migration,
+the write-behind writer and sharing a gallery between app instances.
+"""
+
+import pytest
+import json
+import numpy as np
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+from face_engine import (FaceGallery, SegmentedGalleryStore, SQLiteGalleryStore, SQLiteBatchBuilder,
+                         GalleryWriter, GalleryJournal, ProcessLock, apply_journal_names, atomic_write)
+
+
+def make_faces(count, value=0, size=100):
+    """Create `count` uniform face crops filled with `value`."""
+    return np.full((count, size, size), value, dtype=np.uint8)
+
+
+class TestSegmentAppend:
+    """Test appending captures as new segments."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create an empty store in a temporary directory."""
+        return SegmentedGalleryStore(str(tmp_path / "gallery"))
+
+    def test_empty_store_loads_nothing(self, store):
+        """Test a new store has no samples and no manifest."""
+        faces, labels = store.load()
+        
+        assert len(faces) == 0
+        assert len(labels) == 0
+        assert not store.exists()
+
+    def test_append_creates_segment(self, store):
+        """Test each append writes one segment and updates the manifest."""
+        store.append(make_faces(3), [0, 0, 0])
+        store.append(make_faces(2, 1), [1, 1])
+        
+        assert [segment['count'] for segment in store.manifest['segments']] == [3, 2]
+        faces, labels = store.load()
+        assert faces.shape == (5, 100, 100)
+        assert list(labels) == [0, 0, 0, 1, 1]
+
+    def test_append_does_not_rewrite_existing_segments(self, store):
+        """Test earlier segment files are untouched by later appends."""
+        store.append(make_faces(3), [0, 0, 0])
+        first_faces, _ = store.segment_paths(store.manifest['segments'][0]['name'])
+        mtime = os.stat(first_faces).st_mtime_ns
+        
+        store.append(make_faces(2, 1), [1, 1])
+        
+        assert os.stat(first_faces).st_mtime_ns == mtime
+
+    def test_empty_append_is_ignored(self, store):
+        """Test appending no samples writes nothing."""
+        store.append([], [])
+        
+        assert store.manifest['segments'] == []
+
+    def test_manifest_survives_reopen(self, store):
+        """Test a reopened store sees the same samples."""
+        store.append(make_faces(3), [0, 0, 0])
+        
+        reopened = SegmentedGalleryStore(store.directory)
+        
+        assert len(reopened.load()[0]) == 3
+
+
+class TestTombstones:
+    """Test tombstone deletes."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a store with two people in separate segments."""
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"))
+        store.append(make_faces(3), [0, 0, 0])
+        store.append(make_faces(2, 1), [1, 1])
+        return store
+
+    def test_delete_hides_samples(self, store):
+        """Test a tombstoned label disappears from loads."""
+        store.delete_label(0)
+        
+        faces, labels = store.load()
+        
+        assert list(labels) == [1, 1]
+        assert len(store.manifest['tombstones']) == 1
+
+    def test_tombstone_does_not_hide_later_segments(self, store):
+        """Test samples added after a delete under the same ID stay visible."""
+        store.delete_label(0)
+        store.append(make_faces(1, 5), [0])
+        
+        _, labels = store.load()
+        
+        assert sorted(labels) == [0, 1, 1]
+
+    def test_delete_keeps_segment_files(self, store):
+        """Test a delete only writes the manifest."""
+        names = [segment['name'] for segment in store.manifest['segments']]
+        
+        store.delete_label(1)
+        
+        assert [segment['name'] for segment in store.manifest['segments']] == names
+
+
+class TestRewriteAndCompaction:
+    """Test full rewrites and segment compaction."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a store with several small segments."""
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"), max_segments=2, max_tombstones=1)
+        for label in range(4):
+            store.append(make_faces(2, label), [label, label])
+        return store
+
+    def test_rewrite_replaces_all_segments(self, store):
+        """Test rewrite leaves a single segment and removes old files."""
+        old_files = [path for segment in store.manifest['segments'] for path in store.segment_paths(segment['name'])]
+        
+        store.rewrite(make_faces(1, 9), [7])
+        
+        assert len(store.manifest['segments']) == 1
+        assert list(store.load()[1]) == [7]
+        assert not any(os.path.exists(path) for path in old_files)
+
+    def test_clear_empties_store(self, store):
+        """Test clear removes every sample."""
+        store.clear()
+        
+        assert len(store.load()[0]) == 0
+        assert store.manifest['tombstones'] == []
+
+    def test_compact_merges_segments_and_applies_tombstones(self, store):
+        """Test compaction merges into one segment and drops deleted samples."""
+        store.delete_label(2)
+        expected_faces, expected_labels = store.load()
+        
+        assert store.needs_compaction()
+        assert store.compact() is True
+        
+        faces, labels = store.load()
+        assert len(store.manifest['segments']) == 1
+        assert store.manifest['tombstones'] == []
+        assert np.array_equal(faces, expected_faces)
+        assert np.array_equal(labels, expected_labels)
+        assert len(os.listdir(store.directory)) == 3
+
+    def test_compact_keeps_concurrent_appends(self, store):
+        """Test segments appended during compaction are kept."""
+        real_read = store.read_segment
+        
+        def read_and_append(segment, tombstones):
+            if not hasattr(read_and_append, 'done'):
+                read_and_append.done = True
+                store.append(make_faces(1, 8), [8])
+            return real_read(segment, tombstones)
+        
+        with patch.object(store, 'read_segment', side_effect=read_and_append):
+            store.compact()
+        
+        _, labels = store.load()
+        assert sorted(labels) == [0, 0, 1, 1, 2, 2, 3, 3, 8]
+        assert len(store.manifest['segments']) == 2
+
+    def test_compact_aborts_after_rewrite(self, store):
+        """Test a rewrite during compaction wins over the merged result."""
+        real_read = store.read_segment
+        
+        def read_and_clear(segment, tombstones):
+            if not hasattr(read_and_clear, 'done'):
+                read_and_clear.done = True
+                store.rewrite(make_faces(1, 6), [6])
+            return real_read(segment, tombstones)
+        
+        with patch.object(store, 'read_segment', side_effect=read_and_clear):
+            assert store.compact() is False
+        
+        assert list(store.load()[1]) == [6]
+
+    def test_background_compaction(self, store):
+        """Test compaction can run on a background thread."""
+        store.compact_in_background()
+        store.compaction_thread.join()
+        
+        assert len(store.manifest['segments']) == 1
+
+
+class TestMemoryMappedLoading:
+    """Test the gallery is opened memory-mapped as one (N, H, W) array."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a store with a single compacted segment."""
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"))
+        store.append(make_faces(4, 3), [0, 0, 1, 1])
+        return store
+
+    def test_single_segment_is_memory_mapped(self, store):
+        """Test a one-segment gallery loads as a read-only memory map."""
+        faces, labels = store.load()
+        
+        assert isinstance(faces, np.memmap)
+        assert faces.shape == (4, 100, 100)
+        assert faces.dtype == np.uint8
+        assert not faces.flags.writeable
+
+    def test_mmap_can_be_disabled(self, store):
+        """Test load can read the gallery fully into memory."""
+        faces, _ = store.load(mmap=False)
+        
+        assert not isinstance(faces, np.memmap)
+
+    def test_multiple_segments_load_as_one_array(self, store):
+        """Test several segments are joined into one contiguous array."""
+        store.append(make_faces(2, 7), [2, 2])
+        
+        faces, labels = store.load()
+        
+        assert faces.shape == (6, 100, 100)
+        assert faces.flags['C_CONTIGUOUS']
+        assert list(labels) == [0, 0, 1, 1, 2, 2]
+
+    def test_engine_keeps_gallery_as_array(self, engine, store):
+        """Test load_data keeps the mapped array instead of a per-sample list."""
+        engine.gallery_store = SegmentedGalleryStore(store.directory)
+        with open(engine.data_file, 'w') as f:
+            json.dump({'name_to_id': {'A': 0, 'B': 1}, 'id_to_name': {'0': 'A', '1': 'B'}}, f)
+        
+        engine.load_data()
+        
+        assert isinstance(engine.gallery.faces, np.memmap)
+        assert engine.gallery.labels.dtype == np.int32
+
+    def test_delete_from_mapped_gallery(self, app_without_gui, store):
+        """Test deleting a person from a mapped gallery uses a mask."""
+        app_without_gui.engine.gallery_store = SegmentedGalleryStore(store.directory)
+        app_without_gui.engine.gallery_writer.store = app_without_gui.engine.gallery_store
+        app_without_gui.engine.gallery = FaceGallery.from_arrays(*app_without_gui.engine.gallery_store.load())
+        app_without_gui.engine.name_to_id = {'A': 0, 'B': 1}
+        app_without_gui.engine.id_to_name = {0: 'A', 1: 'B'}
+        app_without_gui.face_listbox.tag_ranges.return_value = ('1.0', '1.5')
+        app_without_gui.face_listbox.get.return_value = "👤 A (2 samples)"
+        
+        with patch('face_recognition_opencv.messagebox') as messagebox:
+            messagebox.askyesno.return_value = True
+            app_without_gui.delete_selected_face()
+        app_without_gui.engine.compaction_thread.join()
+        
+        assert list(app_without_gui.engine.gallery.labels) == [1, 1]
+        assert app_without_gui.engine.gallery.faces.shape == (2, 100, 100)
+        app_without_gui.engine.gallery_writer.flush()
+        assert list(app_without_gui.engine.gallery_store.load()[1]) == [1, 1]
+
+    def test_gallery_hash_matches_list_form(self, store):
+        """Test hashing the mapped array equals hashing per-sample crops."""
+        from face_engine import compute_gallery_hash
+        
+        faces, labels = store.load()
+        
+        assert compute_gallery_hash(faces, labels) == compute_gallery_hash(list(np.array(faces)), labels)
+
+
+class TestAppIntegration:
+    """Test the app persists gallery changes through the store."""
+
+    def test_legacy_npy_files_are_migrated(self, engine):
+        """Test an old whole-gallery .npy pair is imported into the store."""
+        with open(engine.data_file, 'w') as f:
+            json.dump({'name_to_id': {'Alice': 0}, 'id_to_name': {'0': 'Alice'}}, f)
+        np.save(engine.legacy_face_file, make_faces(3))
+        np.save(engine.legacy_label_file, np.array([0, 0, 0]))
+        
+        engine.load_data()
+        
+        assert len(engine.gallery) == 3
+        assert engine.gallery_store.exists()
+
+    def test_save_data_writes_only_metadata(self, engine):
+        """Test save_data no longer rewrites the sample arrays."""
+        engine.gallery.append(make_faces(2), 0)
+        
+        engine.save_data()
+        engine.gallery_writer.flush()
+        
+        assert os.path.exists(engine.data_file)
+        assert not os.path.exists(engine.legacy_face_file)
+
+    def test_failed_write_is_reported(self, app_without_gui):
+        """Test a failing store operation is shown to the user."""
+        app_without_gui.engine.gallery_store.append = MagicMock(side_effect=OSError("disk full"))
+        
+        with patch('face_recognition_opencv.messagebox') as messagebox:
+            app_without_gui.engine.gallery_writer.append(make_faces(1), [0])
+            app_without_gui.engine.gallery_writer.flush()
+        
+        messagebox.showerror.assert_called_once()
+
+
+class TestGalleryWriter:
+    """Test the debounced write-behind writer and atomic file replacement."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create an empty store in a temporary directory."""
+        return SegmentedGalleryStore(str(tmp_path / "gallery"))
+
+    @pytest.fixture
+    def writer(self, store):
+        """Create a writer with a long debounce so bursts stay queued."""
+        writer = GalleryWriter(store, debounce=60, max_delay=60)
+        yield writer
+        writer.close()
+
+    def test_changes_are_written_behind(self, writer, store):
+        """Test queued changes only reach disk once the writer runs."""
+        writer.append(make_faces(2), [0, 0])
+        
+        assert not store.exists()
+        assert writer.flush(timeout=5)
+        assert list(store.load()[1]) == [0, 0]
+
+    def test_burst_of_appends_becomes_one_segment(self, writer, store):
+        """Test adjacent appends are coalesced into a single segment."""
+        for label in range(3):
+            writer.append(make_faces(2, label), [label, label])
+        writer.flush(timeout=5)
+        
+        assert len(store.manifest['segments']) == 1
+        assert list(store.load()[1]) == [0, 0, 1, 1, 2, 2]
+
+    def test_rewrite_supersedes_queued_changes(self, writer, store):
+        """Test a rewrite or clear drops the changes queued before it."""
+        store.append = MagicMock(wraps=store.append)
+        writer.append(make_faces(2), [0, 0])
+        writer.delete_label(0)
+        writer.clear()
+        writer.flush(timeout=5)
+        
+        store.append.assert_not_called()
+        assert len(store.load()[0]) == 0
+
+    def test_only_latest_metadata_is_written(self, writer, tmp_path):
+        """Test metadata saves coalesce and are snapshotted when queued."""
+        path = str(tmp_path / "data.json")
+        data = {'face_count': 1}
+        writer.save_metadata(path, data)
+        data['face_count'] = 2
+        writer.save_metadata(path, {'face_count': 3})
+        data['face_count'] = 4
+        writer.flush(timeout=5)
+        
+        with open(path) as f:
+            assert json.load(f) == {'face_count': 3}
+
+    def test_queueing_does_not_wait_on_disk(self, writer, store):
+        """Test queueing returns while a slow write is still in progress."""
+        started, release = threading.Event(), threading.Event()
+        
+        def slow_append(faces, labels, on_commit=None):
+            started.set()
+            release.wait(5)
+            
+        store.append = slow_append
+        writer.append(make_faces(1), [0])
+        writer.flush(timeout=0)
+        assert started.wait(5)
+        
+        writer.append(make_faces(1), [1])
+        writer.save_metadata(str(store.directory) + ".json", {})
+        release.set()
+
+    def test_close_flushes_pending_changes(self, store):
+        """Test closing the writer writes everything still queued."""
+        writer = GalleryWriter(store, debounce=60, max_delay=60)
+        writer.append(make_faces(1), [0])
+        
+        assert writer.close(timeout=5)
+        assert store.exists()
+        with pytest.raises(RuntimeError):
+            writer.append(make_faces(1), [0])
+
+    def test_atomic_write_keeps_old_file_on_failure(self, tmp_path):
+        """Test a failed write leaves the previous contents and no temp files."""
+        path = str(tmp_path / "data.json")
+        atomic_write(path, lambda f: f.write(b"old"))
+        
+        def failing(f):
+            f.write(b"partial")
+            raise OSError("disk full")
+            
+        with pytest.raises(OSError):
+            atomic_write(path, failing)
+            
+        with open(path, 'rb') as f:
+            assert f.read() == b"old"
+        assert os.listdir(tmp_path) == ["data.json"]
+
+
+class TestFeatureCache:
+    """Test per-sample features cached next to the segment crops."""
+
+    KEY = "lbph_numpy_test"
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a store holding two segments."""
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"))
+        store.append(make_faces(2, 10), [0, 0])
+        store.append(make_faces(3, 20), [1, 1, 1])
+        return store
+
+    @staticmethod
+    def extract(faces):
+        """Return one small feature row per crop."""
+        return np.asarray(faces, dtype=np.float32)[:, 0, :4]
+
+    def test_features_are_written_per_segment(self, store):
+        """Test each segment gets its own feature file."""
+        assert store.load_features(self.KEY) is None
+        
+        assert store.ensure_features(self.KEY, self.extract)
+        
+        features, labels = store.load_features(self.KEY)
+        assert features.shape == (5, 4)
+        assert list(labels) == [0, 0, 1, 1, 1]
+        assert list(features[:, 0]) == [10, 10, 20, 20, 20]
+
+    def test_cached_features_are_not_recomputed(self, store):
+        """Test only segments without features are extracted."""
+        store.ensure_features(self.KEY, self.extract)
+        store.append(make_faces(1, 30), [2])
+        extract = MagicMock(side_effect=self.extract)
+        
+        store.ensure_features(self.KEY, extract)
+        
+        assert extract.call_count == 1
+        assert len(extract.call_args[0][0]) == 1
+
+    def test_tombstones_filter_features(self, store):
+        """Test features of deleted people are hidden like their crops."""
+        store.ensure_features(self.KEY, self.extract)
+        store.delete_label(0)
+        
+        features, labels = store.load_features(self.KEY)
+        
+        assert list(labels) == [1, 1, 1]
+        assert len(features) == 3
+
+    def test_compaction_carries_features(self, store):
+        """Test compaction merges the cached features with the crops."""
+        store.ensure_features(self.KEY, self.extract)
+        store.delete_label(1)
+        
+        assert store.compact()
+        
+        features, labels = store.load_features(self.KEY)
+        assert list(labels) == [0, 0]
+        assert list(features[:, 0]) == [10, 10]
+
+    def test_rewrite_removes_feature_files(self, store):
+        """Test replaced segments take their feature files with them."""
+        store.ensure_features(self.KEY, self.extract)
+        
+        store.rewrite(make_faces(1), [0])
+        
+        assert not any("_features_" in name for name in os.listdir(store.directory))
+        assert store.load_features(self.KEY) is None
+
+    def test_feature_key_tracks_configuration(self):
+        """Test the key changes with the parameters and is None without feature support."""
+        from face_engine import feature_key, DEFAULT_GALLERY_SETTINGS
+        
+        settings = dict(DEFAULT_GALLERY_SETTINGS)
+        key = feature_key('lbph_numpy', settings)
+        
+        assert key.startswith('lbph_numpy_')
+        assert feature_key('lbph_numpy', dict(settings, lbph_radius=2)) != key
+        assert feature_key('lbph', settings) is None
+
+    def test_retrain_reuses_cached_features(self, engine):
+        """Test a second training run skips feature extraction."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        faces = np.random.randint(0, 255, (6, 100, 100), dtype=np.uint8)
+        labels = [0, 0, 0, 1, 1, 1]
+        engine.recognizer_backend = 'lbph_numpy'
+        engine.gallery.append(faces, labels)
+        engine.gallery_writer.append(faces, labels)
+        engine.train_recognizer(wait=True)
+        first = engine.face_recognizer.histograms.copy()
+        
+        with patch.object(NumpyLBPHRecognizer, 'extract_features_parallel') as extract:
+            engine.train_recognizer(wait=True)
+        
+        extract.assert_not_called()
+        np.testing.assert_allclose(engine.face_recognizer.histograms, first)
+        assert engine.face_recognizer.predict(faces[4])[0] == 1
+
+    def test_cached_features_do_not_read_back_crops(self, engine):
+        """Test deciding the store is current reads only the features, never the crops."""
+        from face_engine import feature_key
+        
+        faces = np.random.randint(0, 255, (4, 100, 100), dtype=np.uint8)
+        engine.recognizer_backend = 'lbph_numpy'
+        engine.gallery.append(faces, [0, 0, 1, 1])
+        engine.gallery_writer.append(faces, [0, 0, 1, 1])
+        engine.train_recognizer(wait=True)
+        key = feature_key('lbph_numpy', engine.gallery_settings)
+        
+        with patch.object(engine.gallery_store, 'load', wraps=engine.gallery_store.load) as load:
+            features = engine.cached_features(key, engine.gallery.labels, engine.gallery_state())
+        
+        assert features.shape[0] == 4
+        assert [call.args[1] for call in load.call_args_list] == [key]
+
+    def test_stale_store_falls_back_to_extraction(self, engine):
+        """Test features are extracted from the snapshot when the store differs."""
+        faces = np.random.randint(0, 255, (4, 100, 100), dtype=np.uint8)
+        engine.recognizer_backend = 'lbph_numpy'
+        engine.gallery.append(faces, [0, 0, 1, 1])
+        
+        engine.train_recognizer(wait=True)
+        
+        assert engine.face_recognizer.predict(faces[3])[0] == 1
+        assert not engine.gallery_store.exists()
+
+
+class TestStoreInterface:
+    """Test both gallery stores behave the same through the shared interface."""
+
+    @pytest.fixture(params=['segments', 'sqlite'])
+    def store(self, request, tmp_path):
+        """Create an empty store of each kind."""
+        if request.param == 'segments':
+            return SegmentedGalleryStore(str(tmp_path / "gallery"))
+        return SQLiteGalleryStore(str(tmp_path / "gallery.db"))
+
+    def test_append_delete_rewrite(self, store):
+        """Test appends, per-person deletes and rewrites."""
+        assert not store.exists()
+        assert len(store.load()[0]) == 0
+        
+        store.append(make_faces(2, 1), [0, 0])
+        store.append(make_faces(3, 2), [1, 1, 1])
+        store.delete_label(0)
+        faces, labels = store.load()
+        
+        assert store.exists()
+        assert list(labels) == [1, 1, 1]
+        assert faces.shape == (3, 100, 100) and faces[0, 0, 0] == 2
+        
+        store.rewrite(make_faces(1, 5, size=64), [3])
+        faces, labels = store.load()
+        assert faces.shape == (1, 64, 64) and list(labels) == [3]
+
+    def test_feature_cache(self, store):
+        """Test features are computed once and follow deletes."""
+        store.append(make_faces(2, 1), [0, 0])
+        store.append(make_faces(1, 2), [1])
+        extract = MagicMock(side_effect=lambda faces: np.asarray(faces, dtype=np.float32)[:, 0, :3])
+        
+        store.ensure_features('k', extract)
+        store.ensure_features('k', extract)
+        store.delete_label(0)
+        features, labels = store.load_features('k')
+        
+        assert sum(len(call[0][0]) for call in extract.call_args_list) == 3
+        assert list(labels) == [1]
+        assert list(features[0]) == [2, 2, 2]
+
+    def test_builder_commit_and_abort(self, store):
+        """Test streamed batches stay invisible until committed."""
+        store.append(make_faces(1, 9), [9])
+        builder = store.create_builder(2, (100, 100), 'k', 3)
+        builder.add(make_faces(2, 4), [4, 4])
+        builder.add_features(np.ones((2, 3), dtype=np.float32))
+        
+        assert list(store.load()[1]) == [9]
+        builder.commit()
+        faces, labels, features = store.read_batch(builder.name, 'k')
+        assert list(labels) == [4, 4] and features.shape == (2, 3)
+        assert list(store.load()[1]) == [9, 4, 4]
+        
+        aborted = store.create_builder(1, (100, 100))
+        aborted.add(make_faces(1), [7])
+        aborted.abort()
+        replacing = store.create_builder(1, (100, 100))
+        replacing.add(make_faces(1), [8])
+        replacing.commit(replace=True)
+        assert list(store.load()[1]) == [8]
+
+
+class TestSQLiteGalleryStore:
+    """Test the SQLite-specific parts of the optional SQLite store."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create an SQLite store holding two people."""
+        store = SQLiteGalleryStore(str(tmp_path / "gallery.db"))
+        store.append(make_faces(2, 1), [0, 0])
+        store.append(make_faces(3, 2), [1, 1, 1])
+        return store
+
+    def test_wal_mode_and_indexes(self, store):
+        """Test the database uses WAL and indexes samples by person."""
+        connection = store.connection()
+        
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        plan = connection.execute("EXPLAIN QUERY PLAN DELETE FROM samples WHERE person_id = 1").fetchall()
+        assert any('samples_person' in row[-1] for row in plan)
+
+    def test_per_person_queries(self, store):
+        """Test counts and per-person lookups come from the indexed table."""
+        assert store.label_counts() == {0: 2, 1: 3}
+        assert store.person_samples(1).shape == (3, 100, 100)
+        assert store.person_samples(5).shape[0] == 0
+
+    def test_people_table(self, store):
+        """Test the name map is mirrored into the people table."""
+        store.set_people({0: 'Alice', 1: 'Bob'})
+        store.delete_label(0)
+        
+        assert store.people() == {1: 'Bob'}
+
+    def test_reader_in_another_thread_sees_committed_data(self, store):
+        """Test a second connection reads while a batch is being written."""
+        builder = store.create_builder(1, (100, 100))
+        builder.add(make_faces(1), [2])
+        seen = []
+        
+        reader = threading.Thread(target=lambda: seen.append(list(store.load()[1])))
+        reader.start()
+        reader.join(5)
+        builder.commit()
+        
+        assert seen == [[0, 0, 1, 1, 1]]
+        assert list(store.load()[1]) == [0, 0, 1, 1, 1, 2]
+
+    def test_builder_commits_in_chunks(self, store):
+        """Test a long import lets other writers in between chunks but stays hidden."""
+        builder = SQLiteBatchBuilder(store, 3, (100, 100), chunk_samples=2)
+        builder.add(make_faces(2, 4), [4, 4])
+        
+        other = sqlite3.connect(store.path, timeout=0)
+        other.execute("BEGIN IMMEDIATE")
+        other.rollback()
+        other.close()
+        store.append(make_faces(1, 5), [5])
+        assert list(store.load()[1]) == [0, 0, 1, 1, 1, 5]
+        assert store.label_counts() == {0: 2, 1: 3, 5: 1}
+        
+        builder.add(make_faces(1, 4), [4])
+        builder.commit()
+        assert list(store.load()[1]) == [0, 0, 1, 1, 1, 4, 4, 5, 4]
+        
+    def test_abort_removes_committed_chunks(self, store):
+        """Test aborting an import deletes the rows its chunks already committed."""
+        builder = SQLiteBatchBuilder(store, 4, (100, 100), 'k', 3, chunk_samples=1)
+        builder.add(make_faces(2, 4), [4, 4])
+        builder.add_features(np.ones((2, 3), dtype=np.float32))
+        builder.abort()
+        
+        connection = store.connection()
+        assert connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0] == 5
+        assert connection.execute("SELECT COUNT(*) FROM features").fetchone()[0] == 0
+        assert connection.execute("SELECT COUNT(*) FROM imports").fetchone()[0] == 0
+        
+    def test_interrupted_import_is_rolled_back(self, store):
+        """Test the rows of an import whose process died are dropped by the next import."""
+        builder = SQLiteBatchBuilder(store, 4, (100, 100), chunk_samples=1)
+        builder.add(make_faces(2, 4), [4, 4])
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        with builder.connection:
+            builder.connection.execute("UPDATE imports SET pid = ?", (dead.pid,))
+        builder.connection.close()
+        
+        assert list(store.load()[1]) == [0, 0, 1, 1, 1]
+        store.create_builder(1, (100, 100)).abort()
+        assert store.connection().execute("SELECT COUNT(*) FROM samples").fetchone()[0] == 5
+
+    def test_create_gallery_store_from_environment(self, temp_data_dir, monkeypatch):
+        """Test FACE_GALLERY_STORE selects the backend."""
+        from face_engine import create_gallery_store
+        
+        monkeypatch.setenv("FACE_GALLERY_STORE", "sqlite")
+        assert isinstance(create_gallery_store(), SQLiteGalleryStore)
+        assert isinstance(create_gallery_store('segments'), SegmentedGalleryStore)
+        with pytest.raises(ValueError):
+            create_gallery_store('redis')
+
+    def test_engine_migrates_segments_to_sqlite(self, engine):
+        """Test switching an existing gallery to SQLite copies its samples."""
+        SegmentedGalleryStore("face_gallery").append(make_faces(2), [0, 0])
+        with open(engine.data_file, 'w') as f:
+            json.dump({'name_to_id': {'Alice': 0}, 'id_to_name': {'0': 'Alice'}}, f)
+        engine.gallery_store = SQLiteGalleryStore("face_gallery.db")
+        engine.gallery_writer.store = engine.gallery_store
+        
+        engine.load_data()
+        engine.save_data()
+        engine.gallery_writer.flush()
+        
+        assert len(engine.gallery) == 2
+        assert engine.gallery_store.label_counts() == {0: 2}
+        assert engine.gallery_store.people() == {0: 'Alice'}
+
+
+class TestGalleryJournal:
+    """Test the cross-process lock and the shared change journal."""
+
+    def test_process_lock_is_reentrant(self, tmp_path):
+        """Test the owning thread can take the lock again while holding it."""
+        lock = ProcessLock(str(tmp_path / "gallery.lock"))
+        
+        with lock:
+            with lock:
+                assert lock.depth == 2
+        assert lock.depth == 0 and lock.file is None
+
+    def test_process_lock_excludes_other_holders(self, tmp_path):
+        """Test a second lock on the same file waits for the first."""
+        first = ProcessLock(str(tmp_path / "gallery.lock"))
+        second = ProcessLock(str(tmp_path / "gallery.lock"))
+        acquired = threading.Event()
+        
+        def take():
+            with second:
+                acquired.set()
+                
+        with first:
+            thread = threading.Thread(target=take)
+            thread.start()
+            assert not acquired.wait(0.2)
+        thread.join(5)
+        
+        assert acquired.is_set()
+
+    def test_read_skips_partial_lines(self, tmp_path):
+        """Test a reader never sees a half-written entry."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        journal.append('person', id=0, name='Alice')
+        with open(journal.path, 'ab') as f:
+            f.write(b'{"op": "delete"')
+            
+        entries, offset = journal.read()
+        
+        assert [entry['name'] for entry in entries] == ['Alice']
+        assert entries[0]['instance'] == journal.instance
+        assert journal.read(offset) == ([], offset)
+
+    def test_writer_logs_changes_after_writing_them(self, tmp_path):
+        """Test appends, deletes and rewrites are journaled once on disk."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"), lock=journal.lock)
+        writer = GalleryWriter(store, debounce=0.01, journal=journal)
+        
+        writer.append(make_faces(2), [0, 0])
+        writer.flush()
+        writer.delete_label(0)
+        writer.flush()
+        writer.rewrite(make_faces(1), [1])
+        writer.close()
+        
+        entries, _ = journal.read()
+        assert [entry['op'] for entry in entries] == ['append', 'delete', 'reset']
+        assert entries[0]['segment'].startswith('seg_')
+
+    def test_writer_only_locks_to_commit(self, tmp_path):
+        """Test the shared lock is free while a segment's samples are written."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"), lock=journal.lock)
+        writer = GalleryWriter(store, debounce=0.01, journal=journal)
+        other = ProcessLock(journal.lock.path)
+        free = []
+        real_write_segment = store.write_segment
+        
+        def take_lock(acquired):
+            with other:
+                acquired.set()
+                
+        def write_segment(name, faces, labels):
+            acquired = threading.Event()
+            threading.Thread(target=take_lock, args=(acquired,), daemon=True).start()
+            free.append(acquired.wait(5))
+            real_write_segment(name, faces, labels)
+            
+        store.write_segment = write_segment
+        writer.append(make_faces(2), [0, 0])
+        writer.close()
+        
+        assert free == [True]
+        entries, _ = journal.read()
+        assert [entry['segment'] for entry in entries] == ['seg_000000']
+        assert [segment['name'] for segment in store.manifest['segments']] == ['seg_000000']
+
+
+    def test_checkpoint_keeps_offsets_valid(self, tmp_path):
+        """Test readers continue from their offset after the file is checkpointed."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        journal.append('person', id=0, name='Alice')
+        journal.append('person', id=1, name='Bob')
+        _, offset = journal.read()
+        journal.append('delete', id=0)
+        size = os.path.getsize(journal.path)
+        
+        assert journal.checkpoint(offset)
+        
+        entries, end = journal.read(offset)
+        assert [entry['op'] for entry in entries] == ['delete']
+        assert end == journal.end() == size
+        journal.append('person', id=2, name='Carol')
+        assert [entry['name'] for entry in journal.read(end)[0]] == ['Carol']
+
+    def test_reader_behind_a_checkpoint_gets_it_first(self, tmp_path):
+        """Test a reader that missed folded entries gets their checkpoint in their place."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        journal.append('person', id=0, name='Alice')
+        _, lagging = journal.read()
+        journal.append('person', id=3, name='Bob')
+        journal.append('metadata', recognizer='eigen', settings=None)
+        journal.append('delete', id=0)
+        journal.checkpoint(journal.end())
+        journal.append('person', id=4, name='Carol')
+        
+        entries, _ = journal.read(lagging)
+        
+        checkpoint = entries[0]
+        assert [entry['op'] for entry in entries] == ['checkpoint', 'person']
+        assert checkpoint['people'] == {'3': 'Bob'} and checkpoint['deleted'] == [0]
+        assert checkpoint['next_person_id'] == 4 and checkpoint['recognizer'] == 'eigen'
+        assert not checkpoint['reset']
+
+    def test_checkpoint_folds_the_previous_one(self, tmp_path):
+        """Test a second checkpoint keeps what the first one folded."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        journal.append('reset', id_to_name={'5': 'Alice'}, settings=None, recognizer='lbph')
+        journal.checkpoint(journal.end())
+        journal.append('person', id=6, name='Bob')
+        
+        assert journal.checkpoint(journal.end())
+        
+        entries, _ = journal.read()
+        name_to_id, id_to_name = {'Old': 1}, {1: 'Old'}
+        apply_journal_names(entries[0], name_to_id, id_to_name)
+        assert len(entries) == 1
+        assert id_to_name == {5: 'Alice', 6: 'Bob'}
+        assert name_to_id == {'Alice': 5, 'Bob': 6}
+
+    def test_checkpoint_skips_small_journals(self, tmp_path):
+        """Test nothing is rewritten until enough can be dropped."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        journal.append('person', id=0, name='Alice')
+        
+        assert not journal.checkpoint(journal.end(), min_bytes=1 << 20)
+        assert journal.read()[0][0]['op'] == 'person'
+
+    def test_compaction_checkpoints_the_journal(self, tmp_path):
+        """Test compacting records the journal offset in the manifest and truncates behind it."""
+        journal = GalleryJournal(str(tmp_path / "journal.log"))
+        store = SegmentedGalleryStore(str(tmp_path / "gallery"), lock=journal.lock)
+        writer = GalleryWriter(store, debounce=0.01, journal=journal)
+        for label in range(3):
+            writer.append(make_faces(1, label), [label])
+            writer.flush()
+            
+        with patch('face_engine.JOURNAL_CHECKPOINT_BYTES', 0):
+            assert store.compact(journal)
+        writer.close()
+        
+        assert store.manifest['journal_offset'] == journal.end()
+        entries, _ = journal.read()
+        assert [entry['op'] for entry in entries] == ['checkpoint']
+        assert list(store.load()[1]) == [0, 1, 2]
+
+
+class TestSharedGallery:
+    """Test two engines working on the same gallery directory."""
+
+    @pytest.fixture
+    def engines(self, engine_factory):
+        """Create two engines sharing the current directory."""
+        return engine_factory(), engine_factory()
+
+    def add_person(self, engine, name, count, value=0):
+        """Register `name` and queue `count` samples for them."""
+        person_id = engine.register_person(name)
+        engine.gallery.append(make_faces(count, value), person_id)
+        engine.gallery_writer.append(make_faces(count, value), [person_id] * count)
+        engine.save_data()
+        engine.gallery_writer.flush()
+        return person_id
+
+    def test_person_ids_never_collide(self, engines):
+        """Test both instances allocate distinct IDs for different names."""
+        first, second = engines
+        
+        alice = self.add_person(first, 'Alice', 2)
+        bob = self.add_person(second, 'Bob', 2)
+        
+        assert alice != bob
+        assert second.name_to_id == {'Alice': alice, 'Bob': bob}
+
+    def test_same_name_gets_the_same_id(self, engines):
+        """Test a name registered elsewhere is reused rather than duplicated."""
+        first, second = engines
+        
+        alice = self.add_person(first, 'Alice', 2)
+        
+        assert second.register_person('Alice') == alice
+
+    def test_poll_picks_up_appended_samples(self, engines):
+        """Test samples captured in one instance appear in the other."""
+        first, second = engines
+        alice = self.add_person(first, 'Alice', 3, value=7)
+        
+        assert second.poll_journal()
+        if second.training_thread is not None:
+            second.training_thread.join()
+            
+        assert second.gallery.label_counts() == {alice: 3}
+        assert second.id_to_name == {alice: 'Alice'}
+        assert second.face_recognizer is not None
+        assert not second.poll_journal()
+
+    def test_unpolled_change_invalidates_cached_features(self, engines):
+        """Test the store no longer counts as current once another instance changed it."""
+        first, second = engines
+        self.add_person(first, 'Alice', 2)
+        state = first.gallery_state()
+        
+        assert first.store_offset(state) is not None
+        
+        self.add_person(second, 'Bob', 2, value=9)
+        
+        assert first.store_offset(state) is None
+        first.poll_journal()
+        assert first.store_offset(first.gallery_state()) is not None
+
+    def test_poll_applies_deletes(self, engines):
+        """Test a delete in one instance drops the person in the other."""
+        first, second = engines
+        alice = self.add_person(first, 'Alice', 2)
+        bob = self.add_person(first, 'Bob', 2, value=9)
+        second.poll_journal()
+        if second.training_thread is not None:
+            second.training_thread.join()
+            
+        first.gallery_writer.delete_label(alice)
+        first.gallery_writer.flush()
+        second.poll_journal()
+        second.frontend.compaction_timer.join()
+        second.compaction_thread.join()
+            
+        assert second.name_to_id == {'Bob': bob}
+        assert second.gallery.label_counts() == {bob: 2}
+
+    def test_rewrite_reloads_the_gallery(self, engines):
+        """Test a clear in one instance reloads the other from disk."""
+        first, second = engines
+        self.add_person(first, 'Alice', 2)
+        second.poll_journal()
+        
+        first.gallery_writer.clear()
+        first.name_to_id, first.id_to_name = {}, {}
+        first.save_data()
+        first.gallery_writer.flush()
+        second.poll_journal()
+        second.reload_thread.join()
+        
+        assert len(second.gallery) == 0
+        assert second.name_to_id == {}
+
+    def test_reload_reads_the_store_off_the_caller_thread(self, engines):
+        """Test polling returns while a reset's reload is still reading the store."""
+        first, second = engines
+        alice = self.add_person(first, 'Alice', 2)
+        second.poll_journal()
+        started, release = threading.Event(), threading.Event()
+        real_load = second.gallery_store.load
+        
+        def slow_load(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return real_load(*args, **kwargs)
+            
+        first.gallery_writer.rewrite(make_faces(3, 4), [alice] * 3)
+        first.save_data()
+        first.gallery_writer.flush()
+        with patch.object(second.gallery_store, 'load', side_effect=slow_load):
+            assert second.poll_journal()
+            assert started.wait(5)
+            assert second.gallery.label_counts() == {alice: 2}
+            release.set()
+            second.reload_thread.join()
+            
+        assert second.gallery.label_counts() == {alice: 3}
+
+    def test_reload_reads_again_after_local_changes(self, engines):
+        """Test samples captured while a reload is reading are not lost."""
+        first, second = engines
+        alice = self.add_person(first, 'Alice', 2)
+        second.poll_journal()
+        release = threading.Event()
+        real_load = second.gallery_store.load
+        
+        def slow_load(*args, **kwargs):
+            loaded = real_load(*args, **kwargs)
+            release.wait(5)
+            return loaded
+            
+        first.gallery_writer.rewrite(make_faces(1, 4), [alice])
+        first.save_data()
+        first.gallery_writer.flush()
+        with patch.object(second.gallery_store, 'load', side_effect=slow_load):
+            second.poll_journal()
+            self.add_person(second, 'Bob', 2, value=9)
+            release.set()
+            # The first read missed Bob's samples, so a second one follows.
+            second.reload_thread.join()
+            second.reload_thread.join()
+            
+        assert second.gallery.label_counts() == {alice: 1, second.name_to_id['Bob']: 2}
+
+    def test_register_after_remote_reset_with_queued_append(self, engines):
+        """Test registering a name doesn't deadlock on a reload while our own append is queued."""
+        first, second = engines
+        alice = self.add_person(first, 'Alice', 2)
+        second.poll_journal()
+
+        second.gallery_writer.clear()
+        second.name_to_id, second.id_to_name = {}, {}
+        second.save_data()
+        second.gallery_writer.flush()
+        first.gallery_writer.debounce = 0.2
+        first.gallery_writer.append(make_faces(2, 5), [alice] * 2)
+
+        result = []
+        thread = threading.Thread(target=lambda: result.append(first.register_person('Bob')), daemon=True)
+        thread.start()
+        thread.join(10)
+
+        assert not thread.is_alive()
+        assert result[0] not in (None, alice)
+        assert first.name_to_id['Bob'] == result[0]
+
+    def test_settings_change_is_shared(self, engines):
+        """Test switching the backend in one instance switches the other."""
+        first, second = engines
+        first.load_data()
+        second.load_data()
+        
+        first.recognizer_backend = 'eigen'
+        first.save_data()
+        first.gallery_writer.flush()
+        second.poll_journal()
+        
+        assert second.recognizer_backend == 'eigen'
+        
+    def test_settings_change_updates_the_app(self, engines, app_factory):
+        """Test the app shows a backend another instance switched to."""
+        first, _ = engines
+        app = app_factory()
+        app.backend_var.get.return_value = 'lbph'
+        
+        first.recognizer_backend = 'eigen'
+        first.save_data()
+        first.gallery_writer.flush()
+        app.engine.poll_journal()
+        
+        assert app.engine.recognizer_backend == 'eigen'
+        app.backend_var.set.assert_called_with('eigen')
+
+    def test_startup_replays_newer_journal_entries(self, engines, engine_factory):
+        """Test a new instance sees names the data file does not have yet."""
+        first, _ = engines
+        alice = self.add_person(first, 'Alice', 2)
+        with open(first.data_file, 'w') as f:
+            json.dump({'name_to_id': {}, 'id_to_name': {}}, f)
+            
+        late = engine_factory()
+        late.load_data()
+        
+        assert late.name_to_id == {'Alice': alice}
+        assert late.next_person_id == alice + 1
+        assert len(late.gallery) == 2
+
+
+    def test_startup_after_a_checkpoint(self, engines, engine_factory):
+        """Test a new instance gets the names folded into a checkpoint."""
+        first, _ = engines
+        alice = self.add_person(first, 'Alice', 2)
+        bob = self.add_person(first, 'Bob', 2, value=9)
+        first.delete_person('Alice')
+        first.gallery_writer.flush()
+        with open(first.data_file, 'w') as f:
+            json.dump({'name_to_id': {'Old': 40}, 'id_to_name': {'40': 'Old'}}, f)
+        first.journal.checkpoint(first.journal.end())
+        
+        late = engine_factory()
+        
+        assert late.name_to_id == {'Old': 40, 'Bob': bob}
+        assert late.next_person_id == 41
+        assert alice not in late.gallery.label_counts()
+
+    def test_poll_behind_a_checkpoint_reloads(self, engines):
+        """Test an instance that missed folded entries reloads the gallery."""
+        first, second = engines
+        second.poll_journal()
+        alice = self.add_person(first, 'Alice', 2)
+        first.journal.checkpoint(first.journal.end())
+        
+        assert second.poll_journal()
+        second.reload_thread.join()
+        
+        assert second.name_to_id == {'Alice': alice}
+        assert second.gallery.label_counts() == {alice: 2}
+
+class TestFaceGallery:
+    """Test the contiguous, capacity-doubling in-memory gallery."""
+
+    def test_new_gallery_is_empty(self):
+        """Test a new gallery has no samples and the right crop size."""
+        gallery = FaceGallery(64)
+        
+        assert len(gallery) == 0
+        assert gallery.faces.shape == (0, 64, 64)
+        assert gallery.labels.dtype == np.int32
+
+    def test_append_grows_capacity_by_doubling(self):
+        """Test capacity grows geometrically instead of per capture."""
+        gallery = FaceGallery()
+        capacities = set()
+        
+        for label in range(40):
+            gallery.append(make_faces(1, label), label)
+            capacities.add(gallery.capacity)
+        
+        assert len(gallery) == 40
+        assert sorted(capacities) == [16, 32, 64]
+        assert list(gallery.labels) == list(range(40))
+
+    def test_append_keeps_existing_views_valid(self):
+        """Test a snapshot taken before an append is not modified."""
+        gallery = FaceGallery()
+        gallery.append(make_faces(2, 1), 0)
+        snapshot = gallery.faces
+        
+        gallery.append(make_faces(3, 9), 1)
+        
+        assert snapshot.shape == (2, 100, 100)
+        assert (snapshot == 1).all()
+
+    def test_from_arrays_wraps_without_copy(self):
+        """Test wrapping loaded arrays does not copy them."""
+        faces = make_faces(3)
+        
+        gallery = FaceGallery.from_arrays(faces, [0, 1, 2])
+        
+        assert np.shares_memory(gallery.faces, faces)
+
+    def test_append_to_read_only_map_copies_once(self, tmp_path):
+        """Test appending to a memory-mapped gallery moves it into a writable buffer."""
+        path = str(tmp_path / "faces.npy")
+        np.save(path, make_faces(3, 4))
+        mapped = np.load(path, mmap_mode='r')
+        gallery = FaceGallery.from_arrays(mapped, [0, 0, 0])
+        
+        gallery.append(make_faces(1, 5), 1)
+        
+        assert len(gallery) == 4
+        assert not np.shares_memory(gallery.faces, mapped)
+        assert list(gallery.labels) == [0, 0, 0, 1]
+
+    def test_delete_labels_uses_mask(self):
+        """Test deleting removes every sample of the given people."""
+        gallery = FaceGallery()
+        gallery.append(make_faces(2, 1), 0)
+        gallery.append(make_faces(3, 2), 1)
+        gallery.append(make_faces(1, 3), 2)
+        
+        removed = gallery.delete_labels([0, 2])
+        
+        assert removed == 3
+        assert list(gallery.labels) == [1, 1, 1]
+        assert (gallery.faces == 2).all()
+
+    def test_delete_does_not_touch_snapshots(self):
+        """Test a training snapshot survives a delete."""
+        gallery = FaceGallery()
+        gallery.append(make_faces(2, 1), 0)
+        gallery.append(make_faces(2, 2), 1)
+        snapshot = gallery.faces
+        
+        gallery.delete_labels([0])
+        gallery.append(make_faces(2, 7), 3)
+        
+        assert (snapshot[:2] == 1).all()
+
+    def test_resize_changes_crop_size(self):
+        """Test resizing re-derives every sample at the new size."""
+        gallery = FaceGallery()
+        gallery.append(make_faces(3), [0, 1, 2])
+        
+        gallery.resize(48)
+        
+        assert gallery.faces.shape == (3, 48, 48)
+        assert list(gallery.labels) == [0, 1, 2]
+
+    def test_label_counts(self):
+        """Test per-person sample counts."""
+        gallery = FaceGallery()
+        gallery.append(make_faces(3), [0, 0, 1])
+        
+        assert gallery.label_counts() == {0: 2, 1: 1}
@@ -0,0 +1,227 @@
+"""
+Unit tests for the shared-memory split between the GUI and engine processes.
+Tests the frame ring and the engine loop that serves it.
+"""
+
+import threading
+import time
+import multiprocessing
+import pytest
+import numpy as np
+from unittest.mock import MagicMock
+
+
+@pytest.fixture
+def ring():
+    """Create a four-slot ring of small colour frames."""
+    from face_ipc import SharedRing
+
+    ring = SharedRing.create((4, 5, 3))
+    yield ring
+    ring.close()
+
+
+class TestSharedRing:
+    """Test the latest-value ring in shared memory."""
+
+    def test_attached_reader_sees_writes(self, ring):
+        """Test a reader attached by name gets what the writer wrote."""
+        from face_ipc import SharedRing
+
+        reader = SharedRing.attach(ring.name)
+        try:
+            assert reader.read() is None
+            seq = ring.write(np.full((4, 5, 3), 7), tag=42)
+            read_seq, tag, array = reader.read()
+        finally:
+            reader.close()
+
+        assert (read_seq, tag) == (seq, 42)
+        assert array.dtype == np.uint8
+        assert np.all(array == 7)
+
+    def test_reader_gets_newest(self, ring):
+        """Test the reader skips to the newest array once the writer laps it."""
+        for i in range(10):
+            ring.write(np.full((4, 5, 3), i), tag=i)
+
+        seq, tag, array = ring.read()
+
+        assert (seq, tag) == (10, 9)
+        assert np.all(array == 9)
+        assert ring.read(after=seq) is None
+
+    def test_smaller_arrays(self, ring):
+        """Test arrays smaller than the ring's shape keep their own shape."""
+        ring.write(np.ones((2, 2, 3)))
+        ring.write(np.zeros((0, 5, 3)))
+
+        assert ring.read(after=1)[2].shape == (0, 5, 3)
+        assert ring.read(after=0)[2].shape == (0, 5, 3)
+
+    def test_too_large(self, ring):
+        """Test arrays that do not fit are refused."""
+        with pytest.raises(ValueError):
+            ring.write(np.zeros((8, 5, 3)))
+
+    def test_torn_read_is_retried(self, ring):
+        """Test a slot overwritten during the copy is not returned."""
+        ring.write(np.full((4, 5, 3), 1))
+        ring.slot_meta[1][0] = -1
+
+        assert ring.read() is None
+
+    def test_predictions_round_trip(self):
+        """Test faces and predictions survive the row encoding."""
+        from face_ipc import encode_predictions, decode_predictions
+
+        faces = [(1, 2, 3, 4), (5, 6, 7, 8)]
+        predictions = [None, (3, 41.5)]
+
+        assert decode_predictions(encode_predictions(faces, predictions)) == (faces, predictions)
+        assert encode_predictions([], []).shape == (0, 6)
+
+
+def wait_for_result(results, after=0, timeout=10):
+    """Poll a results ring until something newer than `after` arrives."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        item = results.read(after)
+        if item is not None:
+            return item
+        time.sleep(0.01)
+    return None
+
+
+class TestEngineLoop:
+    """Test the engine-process loop, run on a thread."""
+
+    @pytest.fixture
+    def loop(self, engine):
+        """Serve a follower of `engine` that finds one face everywhere over a pair of rings."""
+        from face_engine import FaceEngine
+        from face_ipc import SharedRing, run_engine_process
+
+        follower = FaceEngine.follower(engine.snapshot())
+        follower.detect_faces = MagicMock(side_effect=lambda frame, gray: [(0, 0, 100, 100)])
+        frames = SharedRing.create((100, 100, 3))
+        results = SharedRing.create((32, 6), np.float64)
+        frame_ready = threading.Event()
+        connection, child_connection = multiprocessing.Pipe()
+        thread = threading.Thread(target=run_engine_process,
+                                  args=(frames.name, results.name, frame_ready, child_connection, None, follower))
+        thread.start()
+        yield follower, frames, results, frame_ready, connection
+        connection.send(None)
+        thread.join(10)
+        frames.close()
+        results.close()
+        assert not thread.is_alive()
+
+    def test_results_are_tagged_with_frame(self, loop):
+        """Test each result carries the sequence number of its frame."""
+        from face_ipc import decode_predictions
+
+        engine, frames, results, frame_ready, _ = loop
+
+        seq = frames.write(np.zeros((100, 100, 3), dtype=np.uint8))
+        frame_ready.set()
+        _, tag, rows = wait_for_result(results)
+
+        assert tag == seq
+        assert decode_predictions(rows) == ([(0, 0, 100, 100)], [None])
+
+    def test_predictions_use_saved_model(self, loop, engine):
+        """Test the engine process picks up the model the writing instance saves."""
+        from face_ipc import decode_predictions
+
+        _, frames, results, frame_ready, _ = loop
+        face = np.random.RandomState(1).randint(0, 255, (100, 100), dtype=np.uint8)
+        engine.enroll('Alice', [face] * 2)
+        engine.training_thread.join()
+
+        seq, predictions = 0, [None]
+        deadline = time.monotonic() + 10
+        while predictions[0] is None and time.monotonic() < deadline:
+            frames.write(np.dstack([face] * 3))
+            frame_ready.set()
+            seq, _, rows = wait_for_result(results, after=seq)
+            _, predictions = decode_predictions(rows)
+
+        assert predictions[0][0] == engine.name_to_id['Alice']
+
+    def test_follower_never_writes(self, engine, temp_data_dir):
+        """Test following the gallery leaves every file of it untouched."""
+        from face_engine import FaceEngine
+
+        face = np.random.RandomState(1).randint(0, 255, (100, 100), dtype=np.uint8)
+        engine.enroll('Alice', [face] * 2)
+        engine.training_thread.join()
+        engine.gallery_writer.flush()
+
+        def files():
+            return {path: path.stat().st_mtime_ns for path in temp_data_dir.rglob("*")
+                    if path.is_file() and path.suffix != ".lock"}
+
+        before = files()
+        follower = FaceEngine.follower(engine.snapshot())
+        follower.follow_saved_model()
+        follower.close()
+
+        assert files() == before
+        assert follower.face_recognizer.predict(face)[0] == engine.name_to_id['Alice']
+        assert not hasattr(follower, 'gallery_store')
+
+    def test_detector_message(self, loop):
+        """Test settings sent over the pipe reach the engine."""
+        engine, frames, results, frame_ready, connection = loop
+        engine.available_methods = ['haar', 'dlib']
+
+        connection.send(('detector', 'dlib'))
+        frames.write(np.zeros((100, 100, 3), dtype=np.uint8))
+        frame_ready.set()
+        wait_for_result(results)
+
+        assert engine.detection_method == 'dlib'
+
+    def test_errors_do_not_stop_the_loop(self, loop, capsys):
+        """Test a failing frame yields an empty result and the loop carries on."""
+        engine, frames, results, frame_ready, _ = loop
+        engine.detect_faces.side_effect = RuntimeError("detector broke")
+
+        frames.write(np.zeros((100, 100, 3), dtype=np.uint8))
+        frame_ready.set()
+        seq, _, rows = wait_for_result(results)
+        frames.write(np.zeros((100, 100, 3), dtype=np.uint8))
+        frame_ready.set()
+        wait_for_result(results, after=seq)
+
+        assert rows.shape == (0, 6)
+        assert capsys.readouterr().err.count("detector broke") == 1
+
+
+class TestEngineProcess:
+    """Test the engine running in a spawned process."""
+
+    def test_round_trip(self, engine):
+        """Test frames reach the child and results come back for them."""
+        from face_ipc import EngineProcess
+
+        engine_process = EngineProcess((48, 64, 3), engine.snapshot())
+        try:
+            seq = engine_process.submit(np.zeros((48, 64, 3), dtype=np.uint8))
+            deadline = time.monotonic() + 60
+            latest = None
+            while latest is None and time.monotonic() < deadline:
+                latest = engine_process.latest()
+                if latest is None:
+                    # The child may still be starting; keep offering frames.
+                    seq = engine_process.submit(np.zeros((48, 64, 3), dtype=np.uint8))
+                    time.sleep(0.05)
+        finally:
+            engine_process.close()
+
+        assert latest is not None
+        assert latest[0] <= seq
+        assert latest[1:] == ([], [])
+        assert not engine_process.process.is_alive()
@@ -0,0 +1,173 @@
+"""
+Integration tests for the MJPEG preview stream.
+Tests encode-once fan-out to viewers over loopback.
+"""
+
+import threading
+import time
+import pytest
+import numpy as np
+import cv2
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+
+def make_frame(value):
+    """Create a small BGR frame of one brightness."""
+    return np.full((48, 64, 3), value, dtype=np.uint8)
+
+
+def read_part(response):
+    """Read one JPEG part of a multipart MJPEG response."""
+    headers = {}
+    while True:
+        line = response.readline().strip()
+        if not line:
+            if headers:
+                break
+            continue
+        if b":" in line:
+            key, value = line.split(b":", 1)
+            headers[key.strip().lower()] = value.strip()
+    jpeg = response.read(int(headers[b"content-length"]))
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def wait_until(condition, timeout=10):
+    """Poll until `condition()` is true or the timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def preview():
+    """Serve an MJPEG preview on an ephemeral loopback port."""
+    from face_preview import PreviewServer
+
+    server = PreviewServer(port=0, idle_timeout=0.5).start()
+    yield server
+    server.close()
+
+
+class TestFrameBroadcaster:
+    """Test the encode-once latest-frame holder."""
+
+    def test_no_encoding_without_viewers(self):
+        """Test frames are not encoded while nobody watches."""
+        from face_preview import FrameBroadcaster
+
+        broadcaster = FrameBroadcaster()
+
+        assert broadcaster.publish(make_frame(10)) is False
+        assert broadcaster.encoded == 0
+
+    def test_waiters_get_newest_frame(self):
+        """Test a viewer that fell behind skips straight to the newest frame."""
+        from face_preview import FrameBroadcaster
+
+        broadcaster = FrameBroadcaster()
+        broadcaster.add_viewer()
+        for value in (10, 20, 30):
+            broadcaster.publish(make_frame(value))
+
+        seq, jpeg = broadcaster.wait(0)
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        assert seq == 3
+        assert abs(int(frame[0, 0, 0]) - 30) <= 2
+        assert broadcaster.wait(seq, timeout=0.01) is None
+
+    def test_close_wakes_waiters(self):
+        """Test closing releases viewers blocked waiting for a frame."""
+        from face_preview import FrameBroadcaster
+
+        broadcaster = FrameBroadcaster()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(broadcaster.wait(0)))
+        waiter.start()
+
+        broadcaster.close()
+        waiter.join(5)
+
+        assert results == [None]
+
+
+class TestPreviewServer:
+    """Test the HTTP endpoints over loopback."""
+
+    def test_binds_to_loopback(self, preview):
+        """Test the preview listens on localhost by default."""
+        assert preview.server_address[0] == '127.0.0.1'
+
+    def test_index_page(self, preview):
+        """Test the index page embeds the stream."""
+        with urlopen(preview.url + '/', timeout=5) as response:
+            assert b'src="/stream"' in response.read()
+
+    def test_unknown_path(self, preview):
+        """Test unknown paths are 404."""
+        with pytest.raises(HTTPError) as error:
+            urlopen(preview.url + '/nope', timeout=5)
+        assert error.value.code == 404
+
+    def test_frames_encoded_once_for_all_viewers(self, preview):
+        """Test every viewer gets the stream while each frame is encoded once."""
+        viewers = [urlopen(preview.url + '/stream', timeout=5) for _ in range(3)]
+        try:
+            assert viewers[0].headers['Content-Type'].startswith('multipart/x-mixed-replace')
+            assert wait_until(lambda: preview.broadcaster.viewers == 3)
+
+            received = []
+            readers = [threading.Thread(target=lambda v=viewer: received.append(read_part(v))) for viewer in viewers]
+            for reader in readers:
+                reader.start()
+            preview.publish(make_frame(100))
+            for reader in readers:
+                reader.join(5)
+        finally:
+            for viewer in viewers:
+                viewer.close()
+
+        assert preview.broadcaster.encoded == 1
+        assert len(received) == 3
+        assert all(frame.shape == (48, 64, 3) for frame in received)
+
+    def test_disconnected_viewers_are_dropped(self, preview):
+        """Test encoding stops once the last viewer goes away."""
+        viewer = urlopen(preview.url + '/stream', timeout=5)
+        assert wait_until(lambda: preview.broadcaster.viewers == 1)
+        viewer.close()
+
+        assert wait_until(lambda: preview.publish(make_frame(1)) is False and preview.broadcaster.viewers == 0)
+
+    def test_snapshot(self, preview):
+        """Test a single frame can be fetched as a JPEG."""
+        publisher_done = threading.Event()
+
+        def publish():
+            while not publisher_done.is_set():
+                preview.publish(make_frame(50))
+                time.sleep(0.01)
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        try:
+            with urlopen(preview.url + '/snapshot.jpg', timeout=5) as response:
+                content_type = response.headers['Content-Type']
+                frame = cv2.imdecode(np.frombuffer(response.read(), dtype=np.uint8), cv2.IMREAD_COLOR)
+        finally:
+            publisher_done.set()
+            publisher.join()
+
+        assert content_type == 'image/jpeg'
+        assert frame.shape == (48, 64, 3)
+
+    def test_snapshot_without_frames(self, preview):
+        """Test a snapshot before any frame is published reports unavailable."""
+        with pytest.raises(HTTPError) as error:
+            urlopen(preview.url + '/snapshot.jpg', timeout=5)
+        assert error.value.code == 503
@@ -321,3 +321,733 @@ class TestRecognitionStates:
         
         recognition_active = not recognition_active
         assert recognition_active is False
+
+
+class TestBackgroundTraining:
+    """Test training on a worker thread with atomic model swap."""
+
+    @pytest.fixture
+    def engine(self, engine):
+        """Create an engine with a small two-person gallery."""
+        faces = np.random.randint(0, 255, (4, 100, 100), dtype=np.uint8)
+        engine.gallery.append(faces, [0, 0, 1, 1])
+        engine.gallery_writer.append(faces, [0, 0, 1, 1])
+        engine.gallery_writer.flush()
+        return engine
+
+    def test_training_swaps_in_new_model(self, engine):
+        """Test a finished training run replaces the live recognizer."""
+        on_done = MagicMock()
+        engine.train_recognizer(on_done=on_done, wait=True)
+        
+        assert engine.face_recognizer is not None
+        label, confidence = engine.face_recognizer.predict(engine.gallery.faces[2])
+        assert label == 1
+        on_done.assert_called_once()
+
+    @staticmethod
+    def blocking_recognizer(release):
+        """Create a recognizer whose training waits for an event."""
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        real_train = recognizer.train
+        
+        blocked = MagicMock()
+        blocked.predict = recognizer.predict
+        blocked.train.side_effect = lambda data, labels: (release.wait(5), real_train(data, labels))
+        return blocked
+
+    def test_old_model_kept_until_training_finishes(self, engine):
+        """Test recognition keeps using the previous snapshot during training."""
+        import threading
+        
+        engine.train_recognizer(wait=True)
+        old_model = engine.face_recognizer
+        release = threading.Event()
+        
+        with patch('cv2.face.LBPHFaceRecognizer_create', return_value=self.blocking_recognizer(release)):
+            engine.train_recognizer()
+            assert engine.face_recognizer is old_model
+            
+            release.set()
+            engine.training_thread.join()
+        
+        assert engine.face_recognizer is not old_model
+
+    def test_stale_training_result_is_discarded(self, engine):
+        """Test a superseded training run does not overwrite a newer model."""
+        import threading
+        
+        release = threading.Event()
+        slow = self.blocking_recognizer(release)
+        fast = cv2.face.LBPHFaceRecognizer_create()
+        
+        with patch('cv2.face.LBPHFaceRecognizer_create', side_effect=[slow, fast]):
+            engine.train_recognizer()
+            stale_thread = engine.training_thread
+            engine.train_recognizer(wait=True)
+            
+            release.set()
+            stale_thread.join()
+        
+        assert engine.face_recognizer is fast
+
+    def test_empty_gallery_clears_model(self, engine):
+        """Test training with no samples clears the live recognizer."""
+        engine.train_recognizer(wait=True)
+        engine.gallery.clear()
+        
+        engine.train_recognizer()
+        
+        assert engine.face_recognizer is None
+
+
+class TestModelPersistence:
+    """Test the trained model is stored and reused across launches."""
+
+    @pytest.fixture
+    def engine(self, engine):
+        """Create an engine with a small two-person gallery."""
+        faces = np.random.randint(0, 255, (4, 100, 100), dtype=np.uint8)
+        engine.gallery.append(faces, [0, 0, 1, 1])
+        engine.gallery_writer.append(faces, [0, 0, 1, 1])
+        engine.gallery_writer.flush()
+        return engine
+
+    def test_gallery_hash_is_stable(self, engine):
+        """Test the same gallery always hashes to the same value."""
+        from face_engine import compute_gallery_hash
+        
+        first = compute_gallery_hash(engine.gallery.faces, engine.gallery.labels)
+        second = compute_gallery_hash([face.copy() for face in engine.gallery.faces], list(engine.gallery.labels))
+        
+        assert first == second
+
+    def test_gallery_hash_changes_with_labels(self, engine):
+        """Test relabeling samples changes the gallery hash."""
+        from face_engine import compute_gallery_hash
+        
+        faces = engine.gallery.faces
+        assert compute_gallery_hash(faces, [0, 0, 1, 1]) != compute_gallery_hash(faces, [0, 1, 1, 1])
+
+    def test_training_writes_model_and_hash(self, engine):
+        """Test a finished training run persists the model and its hash."""
+        import os
+        
+        engine.train_recognizer(wait=True)
+        
+        assert os.path.exists(engine.model_path('lbph'))
+        assert os.path.exists(engine.model_hash_file)
+
+    def test_load_model_reuses_matching_model(self, engine):
+        """Test a stored model is loaded when the gallery is unchanged."""
+        engine.train_recognizer(wait=True)
+        engine.face_recognizer = None
+        
+        assert engine.load_model() is True
+        label, _ = engine.face_recognizer.predict(engine.gallery.faces[0])
+        assert label == 0
+
+    def test_load_model_rejects_changed_gallery(self, engine):
+        """Test a stored model is ignored after the gallery changes."""
+        engine.train_recognizer(wait=True)
+        engine.face_recognizer = None
+        engine.gallery.append(np.zeros((100, 100), dtype=np.uint8), 2)
+        engine.gallery_writer.append(np.zeros((1, 100, 100), dtype=np.uint8), [2])
+        engine.gallery_writer.flush()
+        
+        assert engine.load_model() is False
+        assert engine.face_recognizer is None
+
+    def test_load_model_without_files(self, engine):
+        """Test loading fails cleanly when no model was stored."""
+        assert engine.load_model() is False
+
+    def test_load_model_does_not_read_the_gallery(self, engine):
+        """Test the saved model is matched on store state, not by hashing the samples."""
+        engine.train_recognizer(wait=True)
+        engine.face_recognizer = None
+        
+        with patch('face_engine.compute_gallery_hash', side_effect=AssertionError):
+            assert engine.load_model() is True
+
+    def test_new_instance_reuses_the_model(self, engine, engine_factory):
+        """Test a restart loads the saved model instead of retraining."""
+        engine.train_recognizer(wait=True)
+        engine.save_data()
+        engine.gallery_writer.flush()
+        
+        restarted = engine_factory()
+        
+        assert restarted.face_recognizer is not None
+        assert restarted.training_thread is None
+
+    def test_load_model_rejects_other_instances_changes(self, engine, engine_factory):
+        """Test samples another instance stored make the saved model stale."""
+        engine.train_recognizer(wait=True)
+        other = engine_factory()
+        other.gallery_writer.append(np.zeros((1, 100, 100), dtype=np.uint8), [2])
+        other.gallery_writer.flush()
+        
+        assert engine.load_model() is False
+
+    def test_model_with_pending_deletes_is_not_reused(self, engine):
+        """Test a model trained before a delete was compacted is not keyed on the store."""
+        engine.deleted_ids.add(1)
+        engine.train_recognizer(wait=True)
+        engine.deleted_ids.clear()
+        
+        assert engine.load_model() is False
+
+
+class TestNumpyLBPHRecognizer:
+    """Test the vectorized NumPy LBP histogram recognizer."""
+
+    @pytest.fixture
+    def gallery(self):
+        """Generate a gallery of noisy variants of a few textured faces."""
+        rng = np.random.default_rng(0)
+        bases = [cv2.GaussianBlur(rng.integers(0, 255, (100, 100), dtype=np.uint8), (7, 7), 0) for _ in range(3)]
+        
+        def variant(base):
+            noise = rng.integers(-15, 15, base.shape)
+            return np.clip(base.astype(int) + noise, 0, 255).astype(np.uint8)
+        
+        face_data = [variant(base) for base in bases for _ in range(5)]
+        face_labels = [label for label in range(len(bases)) for _ in range(5)]
+        queries = [variant(base) for base in bases]
+        return face_data, face_labels, queries
+
+    def test_gallery_is_contiguous_float32_matrix(self, gallery):
+        """Test training stores all histograms in one contiguous float32 matrix."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, _ = gallery
+        recognizer = NumpyLBPHRecognizer()
+        recognizer.train(face_data, face_labels)
+        
+        assert recognizer.gallery.dtype == np.float32
+        assert recognizer.gallery.flags['C_CONTIGUOUS']
+        assert recognizer.histograms.shape == (len(face_data), 8 * 8 * 256)
+
+    def test_cell_histograms_are_normalized(self, gallery):
+        """Test each grid cell histogram sums to 1 like OpenCV's LBPH."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        recognizer = NumpyLBPHRecognizer()
+        features = recognizer.extract_features(gallery[0][:2])
+        
+        cell_sums = features.reshape(2, 64, 256).sum(axis=2)
+        assert np.allclose(cell_sums, 1.0)
+
+    def test_histograms_match_opencv(self, gallery):
+        """Test extracted histograms closely match OpenCV's LBPH histograms."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, _ = gallery
+        reference = cv2.face.LBPHFaceRecognizer_create()
+        reference.train(face_data, np.array(face_labels))
+        expected = np.array(reference.getHistograms()).reshape(len(face_data), -1)
+        
+        recognizer = NumpyLBPHRecognizer()
+        recognizer.train(face_data, face_labels)
+        
+        assert np.abs(recognizer.histograms - expected).sum(axis=1).max() < 0.5
+
+    def test_parallel_extraction_matches_serial(self, gallery):
+        """Test chunked parallel feature extraction gives identical features."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        recognizer = NumpyLBPHRecognizer(workers=4, chunk_size=2)
+        serial = recognizer.extract_features(gallery[0])
+        parallel = recognizer.extract_features_parallel(gallery[0])
+        
+        assert np.array_equal(serial, parallel)
+
+    @pytest.mark.parametrize("metric", ["chi2", "intersection"])
+    def test_predict_batch_labels(self, gallery, metric):
+        """Test a batch of queries is matched to the right people."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, queries = gallery
+        recognizer = NumpyLBPHRecognizer(metric=metric)
+        recognizer.train(face_data, face_labels)
+        
+        results = recognizer.predict_batch(queries)
+        
+        assert [label for label, _ in results] == [0, 1, 2]
+
+    def test_confidence_matches_opencv_scale(self, gallery):
+        """Test chi-square confidences are on the same scale as OpenCV's."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, queries = gallery
+        reference = cv2.face.LBPHFaceRecognizer_create()
+        reference.train(face_data, np.array(face_labels))
+        recognizer = NumpyLBPHRecognizer()
+        recognizer.train(face_data, face_labels)
+        
+        for query in queries:
+            expected_label, expected_confidence = reference.predict(query)
+            label, confidence = recognizer.predict(query)
+            
+            assert label == expected_label
+            assert confidence == pytest.approx(expected_confidence, rel=0.05)
+
+    def test_intersection_confidence_uses_chi2_scale(self, gallery):
+        """Test the intersection metric reports known faces on the chi-square scale, under 100."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, queries = gallery
+        chi2 = NumpyLBPHRecognizer()
+        chi2.train(face_data, face_labels)
+        intersection = NumpyLBPHRecognizer(metric='intersection')
+        intersection.train(face_data, face_labels)
+        
+        for query in queries:
+            label, confidence = intersection.predict(query)
+            expected_label, expected_confidence = chi2.predict(query)
+            
+            assert label == expected_label
+            assert confidence < 100
+            assert confidence == pytest.approx(expected_confidence, rel=0.05)
+
+    def test_exact_match_has_zero_distance(self, gallery):
+        """Test a gallery sample matches itself with zero distance."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, _ = gallery
+        recognizer = NumpyLBPHRecognizer(max_block_bytes=1024)
+        recognizer.train(face_data, face_labels)
+        
+        label, confidence = recognizer.predict(face_data[7])
+        
+        assert label == face_labels[7]
+        assert confidence == pytest.approx(0.0, abs=1e-3)
+
+    def test_update_appends_samples(self, gallery):
+        """Test update adds samples without retraining existing ones."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, _ = gallery
+        recognizer = NumpyLBPHRecognizer()
+        recognizer.train(face_data[:5], face_labels[:5])
+        recognizer.update(face_data[5:], face_labels[5:])
+        
+        assert len(recognizer.labels) == len(face_data)
+        assert recognizer.predict(face_data[12])[0] == face_labels[12]
+
+    def test_write_read_roundtrip(self, gallery, tmp_path):
+        """Test a written model reads back with identical predictions."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        face_data, face_labels, queries = gallery
+        recognizer = NumpyLBPHRecognizer()
+        recognizer.train(face_data, face_labels)
+        model_file = str(tmp_path / "model.yml")
+        recognizer.write(model_file)
+        
+        loaded = NumpyLBPHRecognizer()
+        loaded.read(model_file)
+        
+        assert loaded.predict_batch(queries) == recognizer.predict_batch(queries)
+
+    def test_predict_untrained_raises(self):
+        """Test predicting before training raises an error."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        with pytest.raises(ValueError):
+            NumpyLBPHRecognizer().predict(np.zeros((100, 100), dtype=np.uint8))
+
+    def test_predict_faces_uses_batch_api(self):
+        """Test predict_faces prefers predict_batch when available."""
+        from face_engine import predict_faces
+        
+        batched = MagicMock()
+        batched.predict_batch.return_value = [(0, 10.0), (1, 20.0)]
+        single = MagicMock(spec=['predict'])
+        single.predict.return_value = (3, 30.0)
+        
+        assert predict_faces(batched, [1, 2]) == [(0, 10.0), (1, 20.0)]
+        assert predict_faces(single, [1, 2]) == [(3, 30.0), (3, 30.0)]
+
+
+class TestRecognizerBackends:
+    """Test the pluggable recognizer registry and benchmark report."""
+
+    @pytest.fixture
+    def gallery(self):
+        """Generate a gallery with three people and ten samples each."""
+        rng = np.random.default_rng(1)
+        bases = [cv2.GaussianBlur(rng.integers(0, 255, (100, 100), dtype=np.uint8), (7, 7), 0) for _ in range(3)]
+        face_data = [np.clip(base.astype(int) + rng.integers(-15, 15, base.shape), 0, 255).astype(np.uint8)
+                     for base in bases for _ in range(10)]
+        face_labels = [label for label in range(3) for _ in range(10)]
+        return face_data, face_labels
+
+    def test_registry_contains_expected_backends(self):
+        """Test all supported backends are registered."""
+        from face_engine import RECOGNIZER_BACKENDS
+        
+        assert {'lbph', 'lbph_numpy', 'eigen', 'fisher'} <= set(RECOGNIZER_BACKENDS)
+
+    def test_unknown_backend_raises(self):
+        """Test creating an unregistered backend raises an error."""
+        from face_engine import create_recognizer
+        
+        with pytest.raises(ValueError):
+            create_recognizer('nonexistent')
+
+    @pytest.mark.parametrize("backend", ['lbph', 'lbph_numpy', 'eigen', 'fisher'])
+    def test_backend_recognizes_gallery_sample(self, gallery, backend):
+        """Test every backend trains and recognizes a known sample."""
+        from face_engine import create_recognizer
+        
+        face_data, face_labels = gallery
+        recognizer = create_recognizer(backend)
+        recognizer.train(np.array(face_data), np.array(face_labels, dtype=np.int32))
+        
+        label, confidence = recognizer.predict(face_data[15])
+        
+        assert label == 1
+        assert confidence < 100
+
+    def test_scaled_distance_maps_threshold_to_100(self):
+        """Test the subspace distance is rescaled to the LBPH confidence scale."""
+        from face_engine import ScaledDistanceRecognizer
+        
+        inner = MagicMock()
+        inner.predict.return_value = (2, 2500.0)
+        
+        assert ScaledDistanceRecognizer(inner, 5000).predict(None) == (2, 50.0)
+
+    @pytest.mark.parametrize("backend", ['eigen', 'fisher'])
+    @pytest.mark.parametrize("crop_size", [64, 100])
+    def test_unknown_threshold_separates_strangers(self, backend, crop_size):
+        """Test new samples of enrolled people score under 100 and strangers over it."""
+        from face_engine import create_recognizer
+        
+        rng = np.random.default_rng(4)
+        
+        def person():
+            return cv2.GaussianBlur(rng.integers(0, 255, (crop_size, crop_size), dtype=np.uint8), (7, 7), 0)
+            
+        def sample(base):
+            return np.clip(base.astype(int) + rng.integers(-15, 15, base.shape), 0, 255).astype(np.uint8)
+            
+        known = [person() for _ in range(4)]
+        recognizer = create_recognizer(backend)
+        recognizer.train(np.array([sample(base) for base in known for _ in range(8)]),
+                         np.repeat(np.arange(4, dtype=np.int32), 8))
+        
+        for label, base in enumerate(known):
+            predicted, confidence = recognizer.predict(sample(base))
+            assert predicted == label
+            assert confidence < 100
+        for _ in range(4):
+            assert recognizer.predict(sample(person()))[1] >= 100
+            
+    def test_calibration_survives_write_and_read(self, gallery, tmp_path):
+        """Test a model read back from disk scores like the one that was trained."""
+        from face_engine import create_recognizer
+        
+        face_data, face_labels = gallery
+        recognizer = create_recognizer('eigen')
+        recognizer.train(np.array(face_data), np.array(face_labels, dtype=np.int32))
+        recognizer.write(str(tmp_path / "model.yml"))
+        loaded = create_recognizer('eigen')
+        loaded.read(str(tmp_path / "model.yml"))
+        
+        assert loaded.unknown_distance == pytest.approx(recognizer.unknown_distance)
+        assert loaded.predict(face_data[4]) == pytest.approx(recognizer.predict(face_data[4]))
+
+    def test_fisher_requires_two_people(self):
+        """Test Fisherfaces refuses a single-person gallery."""
+        from face_engine import check_trainable
+        
+        with pytest.raises(ValueError):
+            check_trainable('fisher', [0, 0, 0])
+        check_trainable('lbph', [0, 0, 0])
+
+    def test_split_gallery_holds_out_each_person(self):
+        """Test the benchmark split keeps every person in both sets."""
+        from face_engine import split_gallery
+        
+        labels = [0] * 10 + [1] * 10
+        train_idx, test_idx = split_gallery(None, labels, test_every=5)
+        
+        assert len(test_idx) == 4
+        assert {labels[i] for i in test_idx} == {0, 1}
+        assert not set(train_idx) & set(test_idx)
+
+    def test_benchmark_reports_each_backend(self, gallery):
+        """Test the benchmark reports timing and accuracy per backend."""
+        from face_engine import benchmark_recognizers, format_benchmark_report
+        
+        results = benchmark_recognizers(*gallery, backends=['lbph', 'eigen'])
+        
+        assert [result['backend'] for result in results] == ['lbph', 'eigen']
+        for result in results:
+            assert result['train_time'] >= 0
+            assert result['predict_ms'] >= 0
+            assert 0.0 <= result['accuracy'] <= 1.0
+        assert 'eigen' in format_benchmark_report(results)
+
+    def test_benchmark_records_backend_errors(self, gallery):
+        """Test a backend that cannot train is reported, not raised."""
+        from face_engine import benchmark_recognizers
+        
+        face_data, face_labels = gallery
+        results = benchmark_recognizers(face_data[:10], face_labels[:10], backends=['fisher'])
+        
+        assert 'error' in results[0]
+
+    def test_training_uses_selected_backend(self, engine, gallery):
+        """Test the engine trains the selected backend."""
+        from face_engine import NumpyLBPHRecognizer
+        
+        engine.gallery.append(*gallery)
+        engine.recognizer_backend = 'lbph_numpy'
+        
+        engine.train_recognizer(wait=True)
+        
+        assert isinstance(engine.face_recognizer, NumpyLBPHRecognizer)
+        engine.face_recognizer = None
+        assert engine.load_model() is True
+
+    def test_stored_model_is_backend_specific(self, engine, gallery):
+        """Test a model trained by one backend is not loaded for another."""
+        engine.gallery.append(*gallery)
+        engine.train_recognizer(wait=True)
+        
+        engine.recognizer_backend = 'eigen'
+        
+        assert engine.load_model() is False
+
+
+class TestGallerySettings:
+    """Test configurable crop size and LBPH grid parameters."""
+
+    def test_defaults_match_original_pipeline(self):
+        """Test default settings keep 100x100 crops and OpenCV's LBPH defaults."""
+        from face_engine import validate_gallery_settings
+        
+        settings = validate_gallery_settings({})
+        
+        assert settings['crop_size'] == 100
+        assert (settings['lbph_radius'], settings['lbph_neighbors']) == (1, 8)
+        assert (settings['lbph_grid_x'], settings['lbph_grid_y']) == (8, 8)
+
+    @pytest.mark.parametrize("settings", [
+        {'crop_size': 10},
+        {'lbph_neighbors': 12},
+        {'unknown': 1},
+        {'crop_size': 32, 'lbph_grid_x': 16}
+    ])
+    def test_invalid_settings_rejected(self, settings):
+        """Test out-of-range or unknown settings raise ValueError."""
+        from face_engine import validate_gallery_settings
+        
+        with pytest.raises(ValueError):
+            validate_gallery_settings(settings)
+
+    def test_resize_samples(self):
+        """Test stored samples are re-derived at the new crop size."""
+        from face_engine import resize_samples
+        
+        samples = np.zeros((3, 100, 100), dtype=np.uint8)
+        
+        resized = resize_samples(samples, 64)
+        
+        assert resized.shape == (3, 64, 64)
+        assert resize_samples(samples, 100) is samples
+        assert resize_samples(list(samples), 100).shape == (3, 100, 100)
+
+    def test_lbph_uses_grid_settings(self):
+        """Test the LBPH backends are built with the configured grid."""
+        from face_engine import create_recognizer, validate_gallery_settings
+        
+        settings = validate_gallery_settings({'lbph_grid_x': 4, 'lbph_grid_y': 6, 'lbph_radius': 2})
+        
+        opencv = create_recognizer('lbph', settings)
+        numpy_lbph = create_recognizer('lbph_numpy', settings)
+        
+        assert (opencv.getGridX(), opencv.getGridY(), opencv.getRadius()) == (4, 6, 2)
+        assert (numpy_lbph.grid_x, numpy_lbph.grid_y, numpy_lbph.radius) == (4, 6, 2)
+
+    def test_model_key_depends_on_settings(self):
+        """Test a stored model is invalidated when settings change."""
+        from face_engine import model_key, validate_gallery_settings
+        
+        assert model_key('lbph', validate_gallery_settings({})) != \
+            model_key('lbph', validate_gallery_settings({'crop_size': 64}))
+
+    def test_benchmark_configurations(self):
+        """Test the trade-off benchmark reports each configuration."""
+        from face_engine import benchmark_configurations, format_benchmark_report
+        
+        rng = np.random.default_rng(2)
+        face_data = [rng.integers(0, 255, (100, 100), dtype=np.uint8) for _ in range(20)]
+        face_labels = [i // 10 for i in range(20)]
+        configurations = [{'crop_size': 100}, {'crop_size': 48, 'lbph_grid_x': 4, 'lbph_grid_y': 4}]
+        
+        results = benchmark_configurations(face_data, face_labels, 'lbph', configurations)
+        
+        assert [result['settings']['crop_size'] for result in results] == [100, 48]
+        assert all('predict_ms' in result and 'accuracy' in result for result in results)
+        assert '48px' in format_benchmark_report(results)
+
+    def test_apply_settings_rederives_samples(self, app_without_gui):
+        """Test changing the crop size resizes the stored gallery and retrains."""
+        import json
+        from face_engine import validate_gallery_settings
+        
+        app_without_gui.engine.gallery.append(np.random.randint(0, 255, (4, 100, 100), dtype=np.uint8), [0, 0, 1, 1])
+        
+        app_without_gui.apply_gallery_settings(validate_gallery_settings({'crop_size': 64}))
+        app_without_gui.engine.training_thread.join()
+        
+        assert app_without_gui.engine.gallery.faces.shape == (4, 64, 64)
+        assert app_without_gui.engine.face_recognizer.predict(app_without_gui.engine.gallery.faces[3])[0] == 1
+        app_without_gui.engine.gallery_writer.flush()
+        with open(app_without_gui.engine.data_file) as f:
+            assert json.load(f)['settings']['crop_size'] == 64
+
+    def test_shrinking_crops_asks_first(self, app_without_gui):
+        """Test only a smaller crop size on a non-empty gallery needs confirming."""
+        from face_engine import validate_gallery_settings
+        
+        smaller = validate_gallery_settings({'crop_size': 64})
+        larger = validate_gallery_settings({'crop_size': 120})
+        
+        with patch('face_recognition_opencv.messagebox') as messagebox:
+            assert app_without_gui.confirm_gallery_settings(smaller)
+            app_without_gui.engine.gallery.append(np.zeros((2, 100, 100), dtype=np.uint8), 0)
+            assert app_without_gui.confirm_gallery_settings(larger)
+            messagebox.askyesno.assert_not_called()
+            
+            messagebox.askyesno.return_value = False
+            assert not app_without_gui.confirm_gallery_settings(smaller)
+            messagebox.askyesno.assert_called_once()
+
+
+class TestTombstoneDeletes:
+    """Test deletes are tombstoned and compacted in batches."""
+
+    @pytest.fixture
+    def app(self, app_without_gui):
+        """Create an app with three people of four samples each."""
+        app = app_without_gui
+        rng = np.random.default_rng(0)
+        for person_id, name in enumerate(['Alice', 'Bob', 'Carol']):
+            faces = rng.integers(0, 255, (4, 100, 100), dtype=np.uint8)
+            app.engine.gallery.append(faces, person_id)
+            app.engine.gallery_writer.append(faces, [person_id] * 4)
+            app.engine.name_to_id[name] = person_id
+            app.engine.id_to_name[person_id] = name
+        app.engine.next_person_id = 3
+        app.engine.train_recognizer(wait=True)
+        return app
+
+    @staticmethod
+    def delete(app, name):
+        """Delete `name` through the face list as the user would."""
+        app.face_listbox.tag_ranges.return_value = ('1.0', '1.5')
+        app.face_listbox.get.return_value = f"👤 {name} (4 samples)"
+        with patch('face_recognition_opencv.messagebox') as messagebox:
+            messagebox.askyesno.return_value = True
+            app.delete_selected_face()
+
+    def test_delete_only_marks_a_tombstone(self, app):
+        """Test a delete hides the person without removing samples or retraining."""
+        app.root.after = MagicMock(return_value='job')
+        app.engine.train_recognizer = MagicMock()
+        
+        self.delete(app, 'Bob')
+        
+        assert app.engine.deleted_ids == {1}
+        assert 'Bob' not in app.engine.name_to_id
+        assert len(app.engine.gallery) == 12
+        app.engine.train_recognizer.assert_not_called()
+
+    def test_burst_of_deletes_compacts_once(self, app):
+        """Test several deletes share one compaction and one retrain."""
+        app.root.after = MagicMock(return_value='job')
+        app.root.after_cancel = MagicMock()
+        
+        self.delete(app, 'Alice')
+        self.delete(app, 'Bob')
+        
+        assert app.root.after_cancel.call_count == 1
+        app.root.after = MagicMock(side_effect=lambda delay, callback: callback())
+        app.engine.train_recognizer = MagicMock()
+        app.engine.compact_gallery()
+        app.engine.compaction_thread.join()
+        
+        assert app.engine.gallery.label_counts() == {2: 4}
+        assert app.engine.deleted_ids == set()
+        app.engine.train_recognizer.assert_called_once()
+
+    def test_recognition_filters_tombstoned_labels(self, app):
+        """Test a match on a deleted person is reported as unknown."""
+        app.root.after = MagicMock(return_value='job')
+        app.engine.detect_faces = MagicMock(return_value=[(0, 0, 100, 100)])
+        frame = np.zeros((120, 120, 3), dtype=np.uint8)
+        frame[:100, :100] = app.engine.gallery.faces[4][..., None]
+        
+        with patch('face_recognition_opencv.cv2.putText') as put_text:
+            app.process_recognition(frame)
+            assert put_text.call_args[0][1].startswith("Bob")
+            self.delete(app, 'Bob')
+            app.process_recognition(frame)
+        
+        assert put_text.call_args[0][1] == "Unknown"
+
+    def test_ids_are_never_reused(self, app):
+        """Test a new person does not take the ID of a live or deleted person."""
+        app.root.after = MagicMock(return_value='job')
+        self.delete(app, 'Alice')
+        
+        assert app.engine.allocate_person_id() == 3
+        assert app.engine.allocate_person_id() == 4
+
+    def test_allocator_is_persisted(self, app):
+        """Test the next ID survives a save and reload."""
+        app.engine.next_person_id = 9
+        app.save_data()
+        app.engine.gallery_writer.flush()
+        app.engine.next_person_id = 0
+        
+        app.engine.load_data()
+        
+        assert app.engine.next_person_id == 9
+
+    def test_compaction_keeps_samples_added_meanwhile(self, app):
+        """Test captures that land during compaction survive the swap."""
+        deferred = []
+        app.root.after = MagicMock(side_effect=lambda delay, callback: deferred.append(callback) or 'job')
+        self.delete(app, 'Alice')
+        deferred.clear()
+        
+        app.engine.compact_gallery()
+        app.engine.compaction_thread.join()
+        app.engine.gallery.append(np.zeros((2, 100, 100), dtype=np.uint8), 7)
+        app.engine.train_recognizer = MagicMock()
+        deferred[-1]()
+        
+        assert app.engine.gallery.label_counts() == {1: 4, 2: 4, 7: 2}
+
+    def test_settings_change_purges_tombstones(self, app):
+        """Test a gallery rewrite never brings deleted samples back."""
+        from face_engine import validate_gallery_settings
+        
+        app.root.after = MagicMock(return_value='job')
+        self.delete(app, 'Carol')
+        app.root.after = MagicMock(side_effect=lambda delay, callback: callback())
+        
+        app.apply_gallery_settings(validate_gallery_settings({'crop_size': 64}))
+        app.engine.training_thread.join()
+        app.engine.gallery_writer.flush()
+        
+        assert app.engine.deleted_ids == set()
+        assert 2 not in app.engine.gallery.label_counts()
+        assert 2 not in set(app.engine.gallery_store.load()[1])
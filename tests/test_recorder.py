@@ -0,0 +1,195 @@
+"""
+Unit tests for the asynchronous annotated-video recorder.
+Tests timing, the drop policies and error handling.
+"""
+
+import threading
+import time
+import pytest
+import numpy as np
+import cv2
+from unittest.mock import MagicMock, patch
+
+
+def make_frame(value, size=(64, 48)):
+    """Create a BGR frame of one brightness."""
+    return np.full((size[1], size[0], 3), value, dtype=np.uint8)
+
+
+class BlockingWriter:
+    """A VideoWriter stand-in that records frame values and can be held up."""
+
+    def __init__(self, *args):
+        self.frames = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        self.entered.set()
+        self.gate.wait(10)
+        self.frames.append(int(frame[0, 0, 0]))
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def blocking_writer():
+    """Patch VideoWriter with a BlockingWriter and return it."""
+    writer = BlockingWriter()
+    with patch('face_recorder.cv2.VideoWriter', return_value=writer):
+        yield writer
+
+
+class TestVideoRecorder:
+    """Test the recorder writing on its own thread."""
+
+    def test_writes_readable_video(self, tmp_path):
+        """Test frames end up in a video file at the requested rate."""
+        from face_recorder import VideoRecorder
+
+        path = str(tmp_path / "session.avi")
+        recorder = VideoRecorder(path, fps=10, fourcc='MJPG')
+        for i in range(10):
+            recorder.write(make_frame(i * 20), timestamp=i / 10)
+        assert recorder.close(timeout=10)
+
+        cap = cv2.VideoCapture(path)
+        count = 0
+        while cap.read()[0]:
+            count += 1
+        cap.release()
+        assert count == 10
+        assert (recorder.received, recorder.encoded, recorder.dropped) == (10, 10, 0)
+
+    def test_keeps_wall_clock_timing(self, blocking_writer):
+        """Test short gaps hold the previous frame and fast frames share a slot."""
+        from face_recorder import VideoRecorder
+
+        recorder = VideoRecorder("out.mp4", fps=10)
+        for value, timestamp in ((1, 0.0), (2, 0.01), (3, 0.3), (4, 0.4)):
+            recorder.write(make_frame(value), timestamp=timestamp)
+        recorder.close(timeout=10)
+
+        assert blocking_writer.frames == [1, 1, 1, 3, 4]
+        assert recorder.frames_out == 5
+
+    def test_long_gaps_are_cut(self, blocking_writer):
+        """Test a pause longer than a second is not filled in."""
+        from face_recorder import VideoRecorder
+
+        recorder = VideoRecorder("out.mp4", fps=10)
+        recorder.write(make_frame(1), timestamp=0.0)
+        recorder.write(make_frame(2), timestamp=60.0)
+        recorder.write(make_frame(3), timestamp=60.2)
+        recorder.close(timeout=10)
+
+        assert blocking_writer.frames == [1, 2, 2, 3]
+
+    def test_frames_are_resized_to_the_first(self, tmp_path):
+        """Test a frame of another size is scaled to the file's size."""
+        from face_recorder import VideoRecorder
+
+        writer = MagicMock()
+        writer.isOpened.return_value = True
+        with patch('face_recorder.cv2.VideoWriter', return_value=writer):
+            recorder = VideoRecorder("out.mp4", fps=10)
+            recorder.write(make_frame(1), timestamp=0.0)
+            recorder.write(make_frame(2, size=(128, 96)), timestamp=0.1)
+            recorder.close(timeout=10)
+
+        assert [call[0][0].shape for call in writer.write.call_args_list] == [(48, 64, 3)] * 2
+
+    def test_drop_newest(self, blocking_writer):
+        """Test a full queue drops incoming frames without blocking the caller."""
+        from face_recorder import VideoRecorder
+
+        blocking_writer.gate.clear()
+        recorder = VideoRecorder("out.mp4", fps=10, queue_size=2, drop='newest')
+        recorder.write(make_frame(0), timestamp=0.0)
+        assert blocking_writer.entered.wait(5)
+
+        start = time.monotonic()
+        accepted = [recorder.write(make_frame(i), timestamp=i / 10) for i in range(1, 6)]
+        elapsed = time.monotonic() - start
+        blocking_writer.gate.set()
+        recorder.close(timeout=10)
+
+        assert elapsed < 1
+        assert accepted == [True, True, False, False, False]
+        assert recorder.dropped == 3
+        assert blocking_writer.frames[0] == 0
+        assert sorted(set(blocking_writer.frames)) == [0, 1, 2]
+
+    def test_drop_oldest(self, blocking_writer):
+        """Test a full queue makes room by dropping the longest-waiting frame."""
+        from face_recorder import VideoRecorder
+
+        blocking_writer.gate.clear()
+        recorder = VideoRecorder("out.mp4", fps=10, queue_size=2, drop='oldest')
+        recorder.write(make_frame(0), timestamp=0.0)
+        assert blocking_writer.entered.wait(5)
+
+        accepted = [recorder.write(make_frame(i), timestamp=i / 10) for i in range(1, 6)]
+        blocking_writer.gate.set()
+        recorder.close(timeout=10)
+
+        assert all(accepted)
+        assert recorder.dropped == 3
+        assert sorted(set(blocking_writer.frames)) == [0, 4, 5]
+
+    def test_unknown_drop_policy(self):
+        """Test an unknown drop policy is rejected."""
+        from face_recorder import VideoRecorder
+
+        with pytest.raises(ValueError):
+            VideoRecorder("out.mp4", drop='random')
+
+    @pytest.mark.parametrize("fps", [0, -5, float('nan')])
+    def test_invalid_fps(self, fps):
+        """Test a frame rate that is not a positive number is rejected."""
+        from face_recorder import VideoRecorder
+
+        with pytest.raises(ValueError, match="Frame rate"):
+            VideoRecorder("out.mp4", fps=fps)
+
+    def test_unwritable_file(self, tmp_path, capsys):
+        """Test a file that cannot be opened stops recording without raising."""
+        from face_recorder import VideoRecorder
+
+        recorder = VideoRecorder(str(tmp_path / "missing" / "out.avi"), fourcc='MJPG')
+        recorder.write(make_frame(1))
+        assert recorder.close(timeout=10)
+
+        assert recorder.error is not None
+        assert recorder.write(make_frame(2)) is False
+        assert "Recording stopped" in capsys.readouterr().err
+
+    def test_gui_entry_point_creates_recorder(self, temp_data_dir):
+        """Test run --record hands a recorder with the chosen settings to the app."""
+        import face_recognition_opencv
+
+        with patch('face_recognition_opencv.FaceRecognitionApp') as app, \
+             patch('face_recognition_opencv.ctk'):
+            face_recognition_opencv.main(['run', '--record', 'audit.mp4', '--record-fps', '15',
+                                          '--record-drop', 'oldest'])
+
+        recorder = app.call_args[1]['recorder']
+        recorder.close(timeout=10)
+        assert (recorder.path, recorder.fps, recorder.drop) == ('audit.mp4', 15.0, 'oldest')
+
+    def test_gui_entry_point_rejects_invalid_fps(self, temp_data_dir, capsys):
+        """Test run --record with a zero frame rate exits with an error instead of starting."""
+        import face_recognition_opencv
+
+        with patch('face_recognition_opencv.FaceRecognitionApp') as app, \
+             patch('face_recognition_opencv.ctk'):
+            result = face_recognition_opencv.main(['run', '--record', 'audit.mp4', '--record-fps', '0'])
+
+        assert result == 1
+        app.assert_not_called()
+        assert "Frame rate" in capsys.readouterr().err
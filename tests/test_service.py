@@ -0,0 +1,174 @@
+"""
+Integration tests for the local HTTP recognition service.
+Tests the endpoints and request batching over loopback.
+"""
+
+import json
+import threading
+import time
+import pytest
+import numpy as np
+import cv2
+from unittest.mock import MagicMock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+
+def make_face(seed):
+    """Create a reproducible random face crop."""
+    return np.random.RandomState(seed).randint(0, 255, (100, 100), dtype=np.uint8)
+
+
+def encode(gray):
+    """PNG-encode a grayscale image as a colour upload."""
+    return cv2.imencode('.png', cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))[1].tobytes()
+
+
+def post(service, path, body):
+    """POST raw bytes and return (status, JSON body)."""
+    request = Request(service.url + path, data=body, method='POST')
+    try:
+        with urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def service(engine):
+    """Serve the engine on an ephemeral loopback port with faces found everywhere."""
+    from face_service import RecognitionService
+
+    engine.detect_faces = MagicMock(side_effect=lambda frame, gray: [(0, 0, 100, 100)] if gray.max() > 0 else [])
+    service = RecognitionService(engine, port=0, window=0.05).start()
+    yield service
+    service.close()
+
+
+class TestRecognitionService:
+    """Test the HTTP endpoints end to end."""
+
+    def test_binds_to_loopback(self, service):
+        """Test the service listens on localhost by default."""
+        assert service.server_address[0] == '127.0.0.1'
+
+    def test_health(self, service):
+        """Test the health endpoint reports the gallery size."""
+        with urlopen(service.url + '/health', timeout=10) as response:
+            assert json.loads(response.read()) == {'people': 0, 'samples': 0}
+
+    def test_detect(self, service):
+        """Test detect returns boxes only."""
+        status, body = post(service, '/detect', encode(make_face(1)))
+
+        assert status == 200
+        assert body == {'faces': [{'box': [0, 0, 100, 100]}]}
+
+    def test_enroll_then_recognize(self, service, engine):
+        """Test faces enrolled over HTTP are recognized over HTTP."""
+        for seed, name in ((1, 'Alice'), (2, 'Bob')):
+            for _ in range(2):
+                status, body = post(service, f'/enroll?name={name}', encode(make_face(seed)))
+                assert status == 200
+        engine.training_thread.join()
+
+        status, body = post(service, '/recognize', encode(make_face(2)))
+
+        assert status == 200
+        assert body['faces'][0]['name'] == 'Bob'
+        assert body['faces'][0]['confidence'] is not None
+
+    def test_enroll_reports_samples(self, service):
+        """Test enroll returns the person's ID and sample count."""
+        post(service, '/enroll?name=Alice', encode(make_face(1)))
+        status, body = post(service, '/enroll?name=Alice', encode(make_face(1)))
+
+        assert status == 200
+        assert body == {'name': 'Alice', 'id': 0, 'samples': 2}
+
+    def test_errors(self, service):
+        """Test bad requests get JSON errors with the right status."""
+        blank = encode(np.zeros((50, 50), dtype=np.uint8))
+
+        assert post(service, '/recognize', b'not an image')[0] == 400
+        assert post(service, '/recognize', b'')[0] == 400
+        assert post(service, '/enroll', encode(make_face(1)))[0] == 400
+        assert post(service, '/enroll?name=Alice', blank)[0] == 422
+        assert post(service, '/train', encode(make_face(1)))[0] == 404
+
+    def test_concurrent_requests_are_batched(self, service, engine):
+        """Test requests arriving together share one model call."""
+        recognize_batch = MagicMock(wraps=engine.recognize_batch)
+        engine.recognize_batch = recognize_batch
+        barrier = threading.Barrier(6)
+        statuses = []
+
+        def client():
+            barrier.wait()
+            statuses.append(post(service, '/recognize', encode(make_face(3)))[0])
+
+        clients = [threading.Thread(target=client) for _ in range(6)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join(10)
+
+        assert statuses == [200] * 6
+        assert recognize_batch.call_count < 6
+        assert max(len(call[0][0]) for call in recognize_batch.call_args_list) > 1
+
+    def test_enroll_updates_the_live_model(self, service, engine):
+        """Test enrolling into a trained gallery adds to the model instead of retraining."""
+        post(service, '/enroll?name=Alice', encode(make_face(1)))
+        engine.training_thread.join()
+        engine.train_recognizer = MagicMock(wraps=engine.train_recognizer)
+
+        status, _ = post(service, '/enroll?name=Bob', encode(make_face(2)))
+        engine.training_thread.join()
+
+        assert status == 200
+        engine.train_recognizer.assert_not_called()
+        assert engine.face_recognizer.predict(make_face(2))[0] == engine.name_to_id['Bob']
+
+    def test_recognize_waits_for_the_model(self, service, engine):
+        """Test a recognize request waits for a busy model instead of answering without names."""
+        post(service, '/enroll?name=Alice', encode(make_face(1)))
+        engine.training_thread.join()
+        engine.recognizer_lock.acquire()
+        threading.Timer(0.2, engine.recognizer_lock.release).start()
+
+        status, body = post(service, '/recognize', encode(make_face(1)))
+
+        assert status == 200
+        assert body['faces'][0]['name'] == 'Alice'
+
+    def test_close_without_start(self, engine):
+        """Test a service that never served closes without waiting for it."""
+        from face_service import RecognitionService
+
+        service = RecognitionService(engine, port=0)
+        thread = threading.Thread(target=service.close, daemon=True)
+        thread.start()
+        thread.join(10)
+
+        assert not thread.is_alive()
+
+
+class TestMicroBatcher:
+    """Test the engine thread behind the service."""
+
+    def test_polls_while_busy(self):
+        """Test gallery changes are picked up even when requests never stop arriving."""
+        from face_service import MicroBatcher
+
+        engine = MagicMock()
+        engine.detect_faces.return_value = []
+        batcher = MicroBatcher(engine, window=0, poll_interval=0.05)
+        try:
+            stop = time.monotonic() + 0.5
+            while time.monotonic() < stop:
+                batcher.submit('detect', np.zeros((10, 10, 3), dtype=np.uint8)).result(5)
+        finally:
+            batcher.close(5)
+
+        assert engine.poll_journal.call_count >= 3